@@ -1,6 +1,9 @@
 import re
 from dataclasses import dataclass, field
+from io import StringIO
+from itertools import islice
 from json import dumps
+from typing import Iterable, Iterator, TextIO
 
 # required expressions
 RUN = "R_{un}"
@@ -11,6 +14,12 @@ DONE = "D_{one}"
 # line register
 LINE = "L_{ine}"
 
+# a jump to a label, as opposed to a computed jump like `GOTO T_{able}\left[i\right]`
+GOTO_LABEL = r"\bGOTO\b (\w+)(?![\w{])"
+
+# the line number of a label, which can be used in any latex (such as a list of jump targets)
+LABEL_REF = r"\bLABEL\b (\w+)"
+
 
 @dataclass
 class DesmosExpr:
@@ -19,13 +28,63 @@ class DesmosExpr:
     kwargs: dict[str, str] = field(default_factory=lambda: dict())
 
 
-def generate_js(exprs: list[DesmosExpr]) -> str:
+class JsWriter:
+    """
+    Writes javascript which creates Desmos expressions, one expression
+    at a time, so the whole javascript never has to be held in memory.
+
+    If `chunk_size` is given, the expressions are split between several
+    `Calc.setExpressions` calls of at most `chunk_size` expressions each,
+    which Desmos processes one after another.
+    """
+
+    def __init__(self, out: TextIO, chunk_size: int | None = None):
+        self.out = out
+        self.chunk_size = chunk_size
+        self.count = 0
+
+    def write(self, id: str, latex_parts: Iterable[str], kwargs: dict[str, str] = {}):
+        """
+        Write an expression whose latex is `latex_parts` joined together
+        """
+        if self.count == 0:
+            self.out.write("Calc.setExpressions([")
+        elif self.chunk_size is not None and self.count % self.chunk_size == 0:
+            self.out.write("]);\nCalc.setExpressions([")
+        else:
+            self.out.write(", ")
+
+        self.out.write(f'{{"id": {dumps(id)}, "latex": "')
+        for part in latex_parts:
+            # escaping each part is the same as escaping the joined string
+            self.out.write(dumps(part)[1:-1])
+        self.out.write('"')
+        for key, value in kwargs.items():
+            self.out.write(f", {dumps(key)}: {dumps(value)}")
+        self.out.write("}")
+        self.count += 1
+
+    def close(self):
+        if self.count == 0:
+            self.out.write("Calc.setExpressions([")
+        self.out.write("])")
+
+
+def generate_js(exprs: list[DesmosExpr], chunk_size: int | None = None) -> str:
     """
     Convert a list of `DesmosExpr` objects to javascript code
     which creates the expressions when run in Desmos
     """
-    json = dumps([{"id": i.id, "latex": i.latex, **i.kwargs} for i in exprs])
-    return f"Calc.setExpressions({json})"
+    js = StringIO()
+    writer = JsWriter(js, chunk_size)
+    for expr in exprs:
+        writer.write(expr.id, [expr.latex], expr.kwargs)
+    writer.close()
+    return js.getvalue()
+
+
+def resolve_labels(latex: str, labels: dict[str, str]) -> str:
+    return re.sub(LABEL_REF, lambda g: labels[g.group(1)], latex)
 
 
 def process_line(line: str, labels: dict[str, str]):
@@ -34,55 +93,168 @@ def process_line(line: str, labels: dict[str, str]):
     line = re.sub(r"\bIN\b", IN, line)
     line = re.sub(r"\bLINE\b", LINE, line)
     line = re.sub(r"\bNEXTLINE\b", rf"{LINE} \\to {LINE} + 1", line)
-    line = re.sub(r"\bGOTO\b (\w+)", lambda g: rf"{LINE} \to {labels[g.group(1)]}", line)
-    return line
+    line = re.sub(GOTO_LABEL, lambda g: rf"{LINE} \to {labels[g.group(1)]}", line)
+    # any other target is latex for the line number to jump to
+    line = re.sub(r"\bGOTO\b ", rf"{LINE} \\to ", line)
+    return resolve_labels(line, labels)
 
 
-def assemble(program: str):
+def iter_assembly(program: str) -> Iterator[tuple[str, str]]:
     """
-    Turn a program written in Desmos assembly into javascript
+    Yield the type ("line", "label" or "expr") and the contents
+    of each instruction of a program written in Desmos assembly
     """
-    lines = []
-    exprs = []
-    labels = {}
-
-    for line in program.strip().split("\n"):
-        if line == "":
-            continue
-
+    for match in re.finditer(r"\S.*", program):
+        line = match.group()
         line_type = re.match(r"^(\w+) ?(.*)$", line.strip())
 
         assert line_type is not None, f'invalid format of line "{line}"'
 
-        match line_type.group(1):
+        if line_type.group(1) not in ("line", "label", "expr"):
+            raise ValueError(f'unknown type of line "{line}"')
+
+        yield line_type.group(1), line_type.group(2)
+
+
+def parse_assembly(program: str) -> tuple[list[str], dict[str, int], list[str]]:
+    """
+    Split a program written in Desmos assembly into its parts.
+
+    Returns:
+    lines -- the actions of each `line` instruction, in order
+    labels -- a dict from label name to the index of the line after the label
+    exprs -- the contents of each `expr` instruction, in order
+    """
+    lines = []
+    exprs = []
+    labels = {}
+
+    for instruction, contents in iter_assembly(program):
+        match instruction:
             case "line":
-                lines.append(line_type.group(2))
+                lines.append(contents)
             case "label":
-                labels[line_type.group(2)] = str(len(lines))
+                labels[contents] = len(lines)
             case "expr":
                 # TODO: support for kwargs to DesmosExpr
-                exprs.append(line_type.group(2))
-            case _:
-                raise ValueError(f'unknown type of line "{line}"')
-
-    standard_expressions = [
-        DesmosExpr("in", f"{IN}=0"),
-        DesmosExpr("out", f"{OUT}=0"),
-        DesmosExpr("done", f"{DONE}=-1"),
-        DesmosExpr("line", f"{LINE}=0"),
-    ]
-    expr_expressions = [DesmosExpr(f"expr{i}", j) for i, j in enumerate(exprs)]
-
-    lines = [process_line(i, labels) for i in lines]
-    run_latex = RUN + r" = \left\{"
-    for i, j in enumerate(lines):
-        run_latex += rf"{LINE}={i}:\left({j}\right)"
-        if i < len(lines) - 1:
-            run_latex += ", "
-    run_latex += r"\right\}"
-
-    all_expressions = (
-        [DesmosExpr("run", run_latex)] + standard_expressions + expr_expressions
+                exprs.append(contents)
+
+    return lines, labels, exprs
+
+
+def run_latex(name: str, lines: Iterable[tuple[int, str]]) -> Iterator[str]:
+    """
+    Yield the latex of an action which runs the numbered `lines`
+    depending on the line register, in parts
+    """
+    yield name + r" = \left\{"
+    for k, (i, line) in enumerate(lines):
+        if k > 0:
+            yield ", "
+        yield rf"{LINE}={i}:\left({line}\right)"
+    yield r"\right\}"
+
+
+def assembly_expressions(
+    program: str, block_size: int | None = None
+) -> Iterator[tuple[str, Iterable[str]]]:
+    """
+    Yield the id and the latex (in parts) of each expression
+    for a program written in Desmos assembly.
+
+    The program is read twice, first to find the labels and then to generate
+    the latex, so only one line is processed at a time. If `block_size` is
+    given, the lines are split into blocks of that many lines, each in an
+    action of its own, and the run action picks the block to run.
+    """
+    labels = {}
+    num_lines = 0
+    for instruction, contents in iter_assembly(program):
+        if instruction == "line":
+            num_lines += 1
+        elif instruction == "label":
+            labels[contents] = str(num_lines)
+
+    lines = enumerate(
+        process_line(contents, labels)
+        for instruction, contents in iter_assembly(program)
+        if instruction == "line"
     )
+    if block_size is None:
+        yield "run", run_latex(RUN, lines)
+    else:
+        num_blocks = max(1, -(-num_lines // block_size))
+        for b in range(num_blocks):
+            yield f"run{b}", run_latex(f"R_{{un{b}}}", islice(lines, block_size))
+        blocks = [rf"{LINE}<{(b + 1) * block_size}:R_{{un{b}}}" for b in range(num_blocks - 1)]
+        blocks.append(f"R_{{un{num_blocks - 1}}}")
+        yield "run", [RUN + r" = \left\{" + ", ".join(blocks) + r"\right\}"]
+
+    yield "in", [f"{IN}=0"]
+    yield "out", [f"{OUT}=0"]
+    yield "done", [f"{DONE}=-1"]
+    yield "line", [f"{LINE}=0"]
 
-    return generate_js(all_expressions)
+    exprs = (contents for instruction, contents in iter_assembly(program) if instruction == "expr")
+    for i, expr in enumerate(exprs):
+        yield f"expr{i}", [resolve_labels(expr, labels)]
+
+
+def assembly_latex(
+    program: str, minified: bool = False, block_size: int | None = None
+) -> Iterable[tuple[str, Iterable[str]]]:
+    """
+    The id and the latex (in parts) of each expression for a program written
+    in Desmos assembly, minified if `minified` is True (see `write_assembly`)
+    """
+    expressions = assembly_expressions(program, block_size)
+    if not minified:
+        return expressions
+
+    from desmos_compiler.minify import minify
+
+    expressions = [(id, "".join(parts)) for id, parts in expressions]
+    latex = minify([l for _, l in expressions], {RUN, IN, OUT, DONE})
+    ids = [id for id, _ in expressions]
+    ids += [f"helper{i}" for i in range(len(latex) - len(ids))]
+    return [(id, [l]) for id, l in zip(ids, latex)]
+
+
+def write_assembly(
+    program: str,
+    out: TextIO,
+    minified: bool = False,
+    chunk_size: int | None = None,
+    block_size: int | None = None,
+):
+    """
+    Write the javascript for a program written in Desmos assembly to `out`.
+
+    The javascript is written in parts as it is generated, one line of the
+    program at a time, so it is never held in memory as well as the assembly.
+    If `chunk_size` is given, the expressions are created by several
+    `Calc.setExpressions` calls of at most `chunk_size` expressions each.
+    If `block_size` is given, the run action is split into blocks of
+    `block_size` lines (see `assembly_expressions`).
+
+    If `minified` is True, the latex is made as short as possible, which makes
+    large programs faster to load but harder to read. Minifying needs every
+    expression at once, so the whole latex is held in memory.
+    """
+    writer = JsWriter(out, chunk_size)
+    for id, parts in assembly_latex(program, minified, block_size):
+        writer.write(id, parts)
+    writer.close()
+
+
+def assemble(
+    program: str, minified: bool = False, chunk_size: int | None = None, block_size: int | None = None
+) -> str:
+    """
+    Turn a program written in Desmos assembly into javascript.
+
+    See `write_assembly` for the arguments.
+    """
+    js = StringIO()
+    write_assembly(program, js, minified, chunk_size, block_size)
+    return js.getvalue()
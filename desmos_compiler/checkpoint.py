@@ -0,0 +1,91 @@
+import math
+import re
+from typing import Iterator, TextIO
+
+from desmos_compiler.assembler import JsWriter, assembly_latex
+from desmos_compiler.emulator import Emulator, Value
+from desmos_compiler.evaluator import number_literal
+
+# javascript which returns the state of the graph, including every
+# variable the run action has changed, as a JSON string
+CHECKPOINT_JS = "JSON.stringify(Calc.getState())"
+
+# a number desmos writes in scientific notation, such as 1.5\times10^{-7}
+SCIENTIFIC = r"(\d+(?:\.\d+)?)\\times10\^\{(-?\d+)\}"
+
+Checkpoint = dict[str, Value]
+
+
+class CheckpointError(Exception):
+    """
+    A checkpoint which cannot be used to resume a program
+    """
+
+
+def value_latex(value: Value) -> str:
+    """
+    Latex for the value of a variable
+    """
+    if isinstance(value, list):
+        return r"\left[" + ",".join(value_latex(v) for v in value) + r"\right]"
+    if not math.isfinite(value):
+        return r"\frac{0}{0}"
+    return number_literal(float(value)).val
+
+
+def read_checkpoint(state: dict) -> Checkpoint:
+    """
+    Values of the variables changed by the run action (the stack, the line
+    register and every other register) in a graph state from `Calc.getState`.
+
+    Desmos writes the value assigned by an action into the expression of the
+    variable, so the state of a running program contains the whole machine.
+    """
+    scientific = lambda m: number_literal(float(f"{m.group(1)}e{m.group(2)}")).val
+    latex = []
+    for expr in state.get("expressions", {}).get("list", []):
+        if expr.get("type", "expression") == "expression" and expr.get("latex"):
+            latex.append(re.sub(SCIENTIFIC, scientific, expr["latex"]))
+    if len(latex) == 0:
+        raise CheckpointError("The graph state does not have any expressions")
+    return Emulator(latex).variables
+
+
+def resume_expressions(
+    program: str, checkpoint: Checkpoint, minified: bool = False, block_size: int | None = None
+) -> Iterator[tuple[str, list[str]]]:
+    """
+    The id and the latex (in parts) of each expression for a program written in
+    Desmos assembly, with its variables set to the values saved in `checkpoint`
+    so the program continues from the line it had reached.
+
+    The program must be assembled with the same arguments as the program the
+    checkpoint was saved from (see `write_assembly`).
+    """
+    expressions = [(id, "".join(parts)) for id, parts in assembly_latex(program, minified, block_size)]
+    emulator = Emulator(latex for _, latex in expressions)
+    if emulator.variables.keys() != checkpoint.keys():
+        missing = sorted(emulator.variables.keys() ^ checkpoint.keys())
+        raise CheckpointError(f"The checkpoint was not saved from this program ({', '.join(missing)} differ)")
+    for (id, latex), name in zip(expressions, emulator.definitions):
+        if name in checkpoint:
+            latex = latex.partition("=")[0] + "=" + value_latex(checkpoint[name])
+        yield id, [latex]
+
+
+def write_resume(
+    program: str,
+    checkpoint: Checkpoint,
+    out: TextIO,
+    minified: bool = False,
+    chunk_size: int | None = None,
+    block_size: int | None = None,
+):
+    """
+    Write the javascript for a program written in Desmos assembly to `out`,
+    continuing from `checkpoint` instead of starting from the beginning
+    """
+    writer = JsWriter(out, chunk_size)
+    for id, parts in resume_expressions(program, checkpoint, minified, block_size):
+        writer.write(id, parts)
+    writer.close()
@@ -1,47 +1,183 @@
 from dataclasses import dataclass
-from typing import List
+from typing import Callable, List
 
+from desmos_compiler.defaults import EVAL_STEPS, HEAP_SIZE, MAX_LIST_LENGTH, UNROLL_BUDGET
+from desmos_compiler.evaluator import OUT_OF_MEMORY, heap_size_classes, number_literal, partial_evaluate
+from desmos_compiler.optimizer import OptimizationStats, always_returns, optimize
+from desmos_compiler.scheduler import schedule
 from desmos_compiler.syntax_tree import (
+    Alloc,
+    ArrayType,
     Assignment,
     BinaryOperation,
+    Comprehension,
     Declaration,
     DesmosType,
     Expression,
+    Free,
     FunctionCall,
     FunctionCallStatement,
     FunctionDefinition,
     FunctionReturn,
     Group,
     If,
+    Index,
+    IndexAssignment,
+    Length,
+    ListLiteral,
+    ListOperator,
     Literal,
     Operator,
+    Range,
+    Reduction,
+    Slice,
     Statement,
+    UnaryOperation,
     Variable,
     While,
+    contains_call,
+    walk,
 )
 
 
 # stack memory
 STACK = "S_{tack}"
 
-# pointers to stack frame bases
-STACK_BASE_PTRS = "S_{tackPtrs}"
-CURRENT_STACK_BASE_PTR = rf"{STACK_BASE_PTRS}\left[\operatorname{{length}}\left({STACK_BASE_PTRS}\right)\right]"
+# stack index of the current function's stack frame
+FRAME_PTR = "F_{ramePtr}"
 
 # register to store return value
 RETURN_VAL = "R_{eturnVal}"
 
-# lines to jump back to on "return"
-RETURN_LINES = "R_{eturnLines}"
+# stack entries before each function's stack frame holding
+# the line to return to and the frame pointer of the caller
+FRAME_HEADER = 2
+
+# index of the last stack entry in use when the stack is split into pages
+STACK_TOP = "S_{tackTop}"
+
+# page number of the current function's stack frame and the index of
+# the frame pointer within the page (when there is more than one page)
+FRAME_PAGE = "F_{ramePage}"
+FRAME_OFFSET = "F_{rameOffset}"
+
+# page holding the current function's stack frame (when there is more than one page)
+STACK_FRAME = "S_{tackFrame}"
+
+# exit code when there is no room on the stack for a function call
+STACK_OVERFLOW = 2
+
+# fewest numbers with a case in a switch (or a chain of ifs like one) for it to be compiled to a jump table
+JUMP_TABLE_CASES = 3
+
+# largest number of entries in a jump table for each number with a case,
+# so that the table is not much longer than the chain of ifs it replaces
+JUMP_TABLE_DENSITY = 4
+
+# heap memory
+HEAP = "H_{eap}"
+
+# first free block of each size class on the heap (0 if there are none)
+HEAP_FREE = "H_{eapFree}"
+
+# heap index of the last entry given to a block
+HEAP_TOP = "H_{eapTop}"
+
+# number of elements in a block of each size class
+HEAP_SIZES = "H_{eapSizes}"
+
+
+POINTER = DesmosType("ptr")
 
 # sizes of variables
-SIZEOF = {DesmosType("num"): 1}
+SIZEOF = {DesmosType("num"): 1, POINTER: 1}
+
+
+def sizeof(var_type: DesmosType) -> int:
+    if isinstance(var_type, ArrayType):
+        return var_type.size * SIZEOF[DesmosType(var_type.type)]
+    return SIZEOF[var_type]
 
 
 class CompilerError(Exception):
     pass
 
 
+def _indices(list_name: str, length: int | None = None) -> str:
+    """
+    Desmos expression for the indices of every element of a list,
+    where `length` is the number of elements if it never changes
+    """
+    if length is not None:
+        return rf"\left[1...{length}\right]"
+    return rf"\left[1...\operatorname{{length}}\left({list_name}\right)\right]"
+
+
+def _update_list_asm(list_name: str, condition: str, value: str) -> str:
+    """
+    Returns desmos assembly which sets the elements of a list whose indices satisfy
+    a condition on `_indices(list_name)`, leaving the rest of the list unchanged
+    """
+    return f"line {list_name} \\to \\left\\{{{condition}:{value},{list_name}\\right\\}}, NEXTLINE\n"
+
+
+@dataclass
+class StackPages:
+    """
+    Stack memory split into `count` desmos lists of `size` entries each,
+    so it can grow past the length limit of a single list.
+
+    A stack frame never crosses the end of a page, so every variable in a
+    frame is on the same page and writes only change that page.
+    """
+
+    size: int
+    count: int
+
+    def page(self, index: int) -> str:
+        return f"S_{{tack{index}}}"
+
+    def location(self, address: str) -> tuple[str, str]:
+        """
+        Desmos expressions for the page number of a stack address and its index in the page
+        """
+        if self.count == 1:
+            return "0", address
+        page = rf"\operatorname{{floor}}\left(\frac{{{address}-1}}{{{self.size}}}\right)"
+        return page, rf"{address}-{self.size}\cdot{page}"
+
+    def indices(self) -> str:
+        """
+        Desmos expression for the indices of every entry of a page
+        """
+        return _indices(self.page(0), self.size)
+
+    def frame_ptr(self) -> str:
+        """
+        Register holding the index of the frame pointer in its page
+        """
+        return FRAME_PTR if self.count == 1 else FRAME_OFFSET
+
+    def frame_memory(self) -> str:
+        """
+        Desmos list holding the current function's stack frame
+        """
+        return self.page(0) if self.count == 1 else STACK_FRAME
+
+    def update_actions(self, page: str, condition: str, value: str) -> str:
+        """
+        Desmos actions which set the entries of the page numbered `page` whose
+        indices satisfy a condition on `indices()`, leaving every other page unchanged
+        """
+        if self.count == 1:
+            return rf"{self.page(0)}\to\left\{{{condition}:{value},{self.page(0)}\right\}}"
+        branches = [
+            rf"{page}={i}:{self.page(i)}\to\left\{{{condition}:{value},{self.page(i)}\right\}}"
+            for i in range(self.count)
+        ]
+        return rf"\left\{{{','.join(branches)}\right\}}"
+
+
 @dataclass
 class VarInfo:
     mem_offset: int
@@ -52,39 +188,179 @@ class VarInfo:
 class FuncInfo:
     goto_label: str
     definition: FunctionDefinition
+    # desmos variable holding the size of the function's stack frame
+    frame_size_var: str
+    # desmos variable holding zeros for the entries of the stack frame after the arguments
+    frame_locals_var: str
+    # desmos variable holding the stack index a call would start the frame at (with stack pages)
+    frame_start_var: str
+    scope: "StackVariableScope | None" = None
 
 
 class StackVariableScope:
-    def __init__(self, parent: "StackVariableScope | None", variable_scope_base: str):
+    def __init__(
+        self,
+        parent: "StackVariableScope | None",
+        frame_ptr: str | None,
+        base_offset: int,
+        pages: StackPages | None = None,
+    ):
+        """
+        Arguments:
+        parent -- the scope to look in for variables not declared in this scope
+        frame_ptr -- register holding the stack index of the frame base,
+                     or None if the scope is addressed from the start of the stack
+        base_offset -- stack index of the scope relative to `frame_ptr`
+        pages -- how the stack is split into pages, or None if it is a single list
+                 (with pages, indices are relative to the start of the page)
+        """
         self._parent_scope = parent
-        self._variable_scope_base = variable_scope_base
+        self._pages = pages
+        self._frame_ptr = frame_ptr
+        self._base_offset = base_offset
         self._var_lookup: dict[Variable, VarInfo] = {}
         self._total_offset = 0
+        self._child_scopes: list[tuple[int, StackVariableScope]] = []
+        # whether the entries after `_total_offset` are still 0 from when the frame was reserved,
+        # which is only known for the scope of a whole frame before any scope inside it is used
+        self._fresh = parent is None or parent._frame_ptr != frame_ptr
+
+    def _index(self, index: int) -> str:
+        """
+        Desmos expression for the stack index `index` entries after the frame pointer
+        """
+        if self._frame_ptr is None:
+            return str(index)
+        if index == 0:
+            return self._frame_ptr
+        return f"{self._frame_ptr}+{index}" if index > 0 else f"{self._frame_ptr}{index}"
+
+    def _address(self, offset: int) -> str:
+        """
+        Desmos expression for the stack index `offset` entries after the scope base
+        """
+        return self._index(self._base_offset + offset)
+
+    def _stack_before(self, index: int) -> str:
+        """
+        Desmos expression for the stack entries before `index` (relative to the frame pointer)
+        """
+        if self._frame_ptr is None and index == 1:
+            return r"\left[\right]"
+        # frames always start above the global variables, so they never start at 1
+        return rf"{STACK}\left[1...{self._index(index - 1)}\right]"
 
     def get_child_scope_base(self):
-        return f"{self._variable_scope_base} + {self._total_offset}"
+        return self._address(self._total_offset)
+
+    def child_scope(self) -> "StackVariableScope":
+        """
+        Create a scope which starts at the current top of this scope
+        """
+        child = StackVariableScope(
+            self, self._frame_ptr, self._base_offset + self._total_offset, self._pages
+        )
+        self._child_scopes.append((self._total_offset, child))
+        # the child scope can leave values in entries this scope uses later
+        self._fresh = False
+        return child
+
+    def frame_size(self) -> int:
+        """
+        Largest number of stack entries used at once by this scope and its child scopes
+        """
+        return max(
+            [self._total_offset]
+            + [offset + child.frame_size() for offset, child in self._child_scopes]
+        )
 
     def get_scope_base(self):
-        return self._variable_scope_base
+        return self._address(0)
+
+    def memory(self) -> str:
+        """
+        Desmos list holding the entries of this scope
+        """
+        if self._pages is None:
+            return STACK
+        if self._frame_ptr is None:
+            return self._pages.page(0)
+        return self._pages.frame_memory()
+
+    def indices(self) -> str:
+        """
+        Desmos expression for the indices of every entry of `memory()`
+        """
+        return _indices(STACK) if self._pages is None else self._pages.indices()
 
-    def add_var_asm(self, var: Variable, var_type: DesmosType):
+    def update_memory_asm(self, condition: str, value: str) -> str:
         """
-        Returns desmos assembly which adds a variable to the stack.
+        Returns desmos assembly which sets the entries of `memory()` whose indices
+        satisfy a condition on `indices()`
+        """
+        if self._pages is None or self._frame_ptr is None:
+            return _update_list_asm(self.memory(), condition, value)
+        return f"line {self._pages.update_actions(FRAME_PAGE, condition, value)}, NEXTLINE\n"
+
+    def add_var(self, var: Variable, var_type: DesmosType) -> bool:
+        """
+        Give a variable a place in the stack frame.
+
+        No assembly is needed to make room for it because the whole frame is
+        reserved by `reserve_frame_asm` when it is entered. Returns whether the
+        place is known to still be 0 from then, otherwise it can hold a value
+        left by another block (or an earlier iteration of a loop).
         """
         if var in self._var_lookup:
             raise CompilerError(f"Variable {var} is already declared")
 
         self._var_lookup[var] = VarInfo(self._total_offset, var_type)
-        self._total_offset += SIZEOF[var_type]
+        self._total_offset += sizeof(var_type)
+        return self._fresh
 
-        return f"line {STACK}\\to\\operatorname{{join}}\\left({STACK},\\left[1...{SIZEOF[var_type]}\\right]\\cdot0\\right), NEXTLINE\n"
+    def reserve_frame_asm(self) -> str:
+        """
+        Returns desmos assembly which pushes the stack frame of the main program.
+        The frames of functions are pushed by each call (see `Compiler.call_asm`).
+        """
+        if self._pages is not None or self.frame_size() == 0:
+            # the pages start out empty, so the global variables only need `STACK_TOP`
+            return ""
+        return f"line {STACK}\\to\\operatorname{{join}}\\left({STACK},\\left[1...{self.frame_size()}\\right]\\cdot0\\right), NEXTLINE\n"
+
+    def return_actions(self) -> list[str]:
+        """
+        Desmos actions which remove the whole stack frame containing this scope,
+        restore the caller's frame pointer and jump back to the line saved by the call
+        """
+        memory = self.memory()
+        actions = [
+            rf"{FRAME_PTR}\to {memory}\left[{self._index(1 - FRAME_HEADER)}\right]",
+            rf"LINE\to {memory}\left[{self._index(-FRAME_HEADER)}\right]",
+        ]
+        if self._pages is not None:
+            actions.append(rf"{STACK_TOP}\to {FRAME_PTR}-{FRAME_HEADER + 1}")
+        else:
+            actions.append(rf"{STACK}\to {self._stack_before(-FRAME_HEADER)}")
+        return actions
+
+    def defining_scope(self, var: Variable) -> "StackVariableScope":
+        """
+        Get the scope in which a variable was declared
+        """
+        if var in self._var_lookup:
+            return self
+        if self._parent_scope is not None:
+            return self._parent_scope.defining_scope(var)
+        raise CompilerError(f"Variable {var} is not in scope")
 
     def get_var_data_expr(self, var: Variable) -> tuple[str, DesmosType]:
         """
         Get a desmos expression for the variable data.
 
         Returns:
-        expr -- a desmos expression which evaluates to a list containing the data
+        expr -- a desmos expression which evaluates to the data
+                (a number if the type has size 1, otherwise a list)
         type -- a DesmosType of the variable
         """
         if not var in self._var_lookup:
@@ -95,17 +371,30 @@ class StackVariableScope:
 
         offset = self._var_lookup[var].mem_offset
         var_type = self._var_lookup[var].var_type
-        slice_start = f"{self._variable_scope_base} + {offset}"
-        slice_end = f"{self._variable_scope_base} + {offset} + {SIZEOF[var_type] - 1}"
-        return f"{STACK}[{slice_start} ... {slice_end}]", var_type
+        if sizeof(var_type) == 1:
+            return rf"{self.memory()}\left[{self._address(offset)}\right]", var_type
+        slice_start = self._address(offset)
+        slice_end = self._address(offset + sizeof(var_type) - 1)
+        return rf"{self.memory()}\left[{slice_start}...{slice_end}\right]", var_type
 
-    @staticmethod
-    def _set_var_expr(start, end, expr):
+    def get_var_address(self, var: Variable, index: int = 0) -> tuple[str, DesmosType]:
+        """
+        Get a desmos expression for the stack index `index` entries into a variable
+
+        Returns:
+        expr -- a desmos expression which evaluates to the stack index
+        type -- a DesmosType of the variable
+        """
+        scope = self.defining_scope(var)
+        info = scope._var_lookup[var]
+        return scope._address(info.mem_offset + index), info.var_type
+
+    def _set_var_expr(self, offset: int, size: int, expr: str) -> str:
+        end = self._address(offset + size - 1)
         return (
-            rf"\operatorname{{join}}\left(\left\{{{start}=1:\left[\right]"
-            + rf",{STACK}\left[1...{start}-1\right]\right\}},{expr},\left"
+            rf"\operatorname{{join}}\left({self._stack_before(self._base_offset + offset)},{expr},\left"
             + rf"\{{{end}=\operatorname{{length}}\left({STACK}\right):\left"
-            + rf"[\right],{STACK}\left[{end}+1...\right]\right\}}\right)"
+            + rf"[\right],{STACK}\left[{self._address(offset + size)}...\right]\right\}}\right)"
         )
 
     def set_var_asm(self, var: Variable, desmos_expr: str) -> str:
@@ -117,27 +406,81 @@ class StackVariableScope:
 
         offset = self._var_lookup[var].mem_offset
         var_type = self._var_lookup[var].var_type
-        slice_start = f"{self._variable_scope_base} + {offset}"
-        slice_end = f"{self._variable_scope_base} + {offset} + {SIZEOF[var_type] - 1}"
-        new_stack_expr = self._set_var_expr(slice_start, slice_end, desmos_expr)
+        if self._pages is not None:
+            indices = self.indices()
+            if sizeof(var_type) == 1:
+                return self.update_memory_asm(f"{indices}={self._address(offset)}", desmos_expr)
+            first = self._address(offset)
+            last = self._address(offset + sizeof(var_type) - 1)
+            return self.update_memory_asm(
+                rf"{first}\le {indices}\le {last}",
+                rf"{desmos_expr}\left[{indices}-\left({first}\right)+1\right]",
+            )
+        new_stack_expr = self._set_var_expr(offset, sizeof(var_type), desmos_expr)
         return f"line {STACK} \\to {new_stack_expr}, NEXTLINE\n"
 
-    def pop_scope_asm(self) -> str:
-        base = self._variable_scope_base
-        return (
-            f"line {STACK} \\to \\left\\{{{base}=1:\\left[\\right],"
-            + f"{STACK}\\left[1...{base}-1\\right]\\right\\}}, NEXTLINE\n"
-        )
 
 
 class Compiler:
-    def __init__(self, root: Statement):
+    def __init__(
+        self,
+        root: Statement,
+        heap_size: int = HEAP_SIZE,
+        stack_pages: StackPages | None = None,
+        eval_steps: int = EVAL_STEPS,
+        unroll_budget: int = UNROLL_BUDGET,
+        optimized: bool = True,
+    ):
+        """
+        Compiles `root` after running what it can at compile time and optimizing it,
+        or exactly as it is written if `optimized` is False
+        """
+        self.optimization_stats = OptimizationStats()
+        # output of a program which runs completely at compile time
+        self.output = None
         self.root = root
-        self.global_scope = StackVariableScope(None, "1")
+        self.heap_size = heap_size
+        if optimized:
+            # evaluating and optimizing the program can remove code which would not
+            # compile, so the statements of the program as it is written are compiled
+            # first to find errors, without scheduling them (and with a single stack,
+            # since optimizing can make the stack frames smaller)
+            self.reset(None)
+            self.compile_program()
+
+            if stack_pages is None:
+                stack_size, page_count = MAX_LIST_LENGTH, 1
+            else:
+                stack_size, page_count = stack_pages.size * stack_pages.count, stack_pages.count
+            evaluation = partial_evaluate(root, eval_steps, MAX_LIST_LENGTH, stack_size, page_count)
+            self.output = evaluation.output
+            self.root = optimize(evaluation.residual, self.optimization_stats, unroll_budget)
+        self.reset(stack_pages)
+
+    def reset(self, stack_pages: StackPages | None):
+        """
+        Forget any assembly compiled so far, to compile `root` with the stack split into `stack_pages`
+        """
+        # whether the program uses the heap
+        self.uses_heap = False
+        self.stack_pages = stack_pages
+        self.global_scope = StackVariableScope(None, None, 1, stack_pages)
         self.function_lookup: dict[Variable, FuncInfo] = {}
         self.label_counter = 0
 
-        self.compiling_function = False
+        # function being compiled (None for the main program)
+        self.current_function: Variable | None = None
+
+        # registers for temporary values of each function
+        self.registers: dict[Variable | None, list[str]] = {}
+        self.registers_in_use = 0
+        self.register_counter = 0
+
+        # desmos variables for the elements of list comprehensions being compiled
+        self.list_variables: dict[Variable, str] = {}
+
+        # lists of the lines to jump to for each switch, by name
+        self.jump_tables: dict[str, str] = {}
 
         self.program_asm = ""
 
@@ -160,64 +503,461 @@ class Compiler:
             case Operator.MULT | Operator.SUB | Operator.ADD:
                 op_str = op.value.replace("*", "\\cdot")
                 return rf"\left({arg1} {op_str} {arg2}\right)"
+            case Operator.NE:
+                return rf"\left\{{{arg1} = {arg2}:0,1\right\}}"
             case (
                 Operator.EQ
-                | Operator.NE
                 | Operator.LT
                 | Operator.GT
                 | Operator.LE
                 | Operator.GE
             ):
-                op_str = (
-                    op.value.replace(">=", "\\ge ")
-                    .replace("<=", "\\le")
-                    .replace("==", "=")
-                )
-                return rf"\left\{{{arg1} {op_str} {arg2}:1,0\right\}}"
+                return rf"\left\{{{self.get_comparison(arg1, arg2, op)}:1,0\right\}}"
             case _:
                 raise CompilerError(f"Unknown binary operator {op}")
 
-    def eval_expression(self, expr: Expression, scope: StackVariableScope) -> None:
+    def get_comparison(self, arg1: str, arg2: str, op: Operator):
+        """
+        Get the desmos condition for a comparison, which can be used
+        in a piecewise expression but is not a value itself.
+        """
+        op_str = (
+            op.value.replace(">=", "\\ge ")
+            .replace("<=", "\\le")
+            .replace("==", "=")
+        )
+        return f"{arg1} {op_str} {arg2}"
+
+    def calls_function(self, expr: Expression, target: Variable | None) -> bool:
+        """
+        Whether evaluating an expression can call a function (directly or indirectly).
+        The main program (None) is never called.
+        """
+        todo = [n.name for n in walk(expr) if isinstance(n, FunctionCall)]
+        seen = set()
+        while len(todo) > 0:
+            name = todo.pop()
+            if name == target:
+                return True
+            if name in seen or name not in self.function_lookup:
+                continue
+            seen.add(name)
+            body = self.function_lookup[name].definition.body
+            todo.extend(n.name for n in walk(body) if isinstance(n, FunctionCall))
+        return False
+
+    def is_unchanged_by_calls(self, expr: Expression, scope: StackVariableScope) -> bool:
+        """
+        Whether the value of an expression stays the same after calling a function.
+        Functions can only change global variables and registers.
+        """
+        match expr:
+            case Literal(_):
+                return True
+            case Variable(_):
+                return scope.defining_scope(expr) is not self.global_scope
+            case BinaryOperation(arg1, arg2, _):
+                return self.is_unchanged_by_calls(
+                    arg1, scope
+                ) and self.is_unchanged_by_calls(arg2, scope)
+            case UnaryOperation(arg, _):
+                return self.is_unchanged_by_calls(arg, scope)
+            case Index(array, index):
+                # functions can change anything on the heap
+                return (
+                    self.memory(array, scope) != HEAP
+                    and self.is_unchanged_by_calls(array, scope)
+                    and self.is_unchanged_by_calls(index, scope)
+                )
+            case Length(Variable(_)):
+                return True
+            case _:
+                return False
+
+    def allocate_register(self) -> str:
+        """
+        Get a register which is not in use by the current statement.
+        Every function has its own registers so they are only overwritten by recursion.
+        """
+        registers = self.registers.setdefault(self.current_function, [])
+        if self.registers_in_use == len(registers):
+            self.register_counter += 1
+            registers.append(f"T_{{emp{self.register_counter}}}")
+        self.registers_in_use += 1
+        return registers[self.registers_in_use - 1]
+
+    def keep_value(
+        self,
+        value: str,
+        expr: Expression,
+        later: list[Expression],
+        scope: StackVariableScope,
+    ) -> tuple[str, StackVariableScope]:
+        """
+        Make sure the value of `expr` is still available after the `later`
+        expressions are evaluated.
+
+        Calls overwrite the return value register, so a value which depends on a
+        call is saved in a register before the next call. If the next call can
+        reach the current function, the register could be overwritten as well and
+        the value is saved on the stack instead.
+
+        Returns the desmos expression for the kept value and the scope to
+        evaluate the later expressions in.
+        """
+        if not any(contains_call(e) for e in later):
+            return value, scope
+        if self.is_unchanged_by_calls(expr, scope):
+            return value, scope
+
+        temp, set_asm, scope = self.temporary(later, scope)
+        self.program_asm += set_asm(value)
+        return temp, scope
+
+    def temporary(
+        self, later: list[Expression], scope: StackVariableScope
+    ) -> tuple[str, Callable[[str], str], StackVariableScope]:
+        """
+        Get somewhere to store a value while the `later` expressions are evaluated.
+        This is a register, unless the later expressions can call the current
+        function and overwrite it, in which case it is on the stack.
+
+        Returns the desmos expression for the stored value, a function giving
+        the assembly which sets it and the scope to evaluate the later expressions in.
+        """
+        if any(self.calls_function(e, self.current_function) for e in later):
+            temp_scope = scope.child_scope()
+            temp_var = Variable(f"#temp{self.label_counter}")
+            self.label_counter += 1
+            temp_scope.add_var(temp_var, DesmosType("num"))
+            return (
+                temp_scope.get_var_data_expr(temp_var)[0],
+                lambda value: temp_scope.set_var_asm(temp_var, value),
+                temp_scope,
+            )
+
+        register = self.allocate_register()
+        return register, lambda value: f"line {register} \\to {value}, NEXTLINE\n", scope
+
+    def array_type(self, var: Variable, scope: StackVariableScope) -> ArrayType:
+        var_type = scope.get_var_address(var)[1]
+        if not isinstance(var_type, ArrayType):
+            raise CompilerError(f"{var} is not an array")
+        return var_type
+
+    def memory(self, var: Variable, scope: StackVariableScope) -> str:
+        """
+        Get the list holding the elements of an array (the stack) or
+        the block a pointer points to (the heap)
+        """
+        var_type = scope.get_var_address(var)[1]
+        if isinstance(var_type, ArrayType):
+            return scope.defining_scope(var).memory()
+        if var_type == POINTER:
+            self.uses_heap = True
+            return HEAP
+        raise CompilerError(f"{var} is not an array or pointer")
+
+    def indices(self, var: Variable, scope: StackVariableScope) -> str:
+        """
+        Desmos expression for the indices of every entry of `memory(var)`
+        """
+        if self.memory(var, scope) == HEAP:
+            return _indices(HEAP, self.heap_length())
+        return scope.defining_scope(var).indices()
+
+    def update_memory_asm(
+        self, var: Variable, scope: StackVariableScope, condition: str, value: str
+    ) -> str:
+        """
+        Returns desmos assembly which sets the entries of `memory(var)` whose
+        indices satisfy a condition on `indices(var)`
+        """
+        if self.memory(var, scope) == HEAP:
+            return _update_list_asm(HEAP, condition, value)
+        return scope.defining_scope(var).update_memory_asm(condition, value)
+
+    def element_address(
+        self, array: Variable, index: Expression, scope: StackVariableScope, offset: int = 0
+    ) -> str:
+        """
+        Get a desmos expression for the index in memory of an element of an array
+        or pointer (plus `offset`) and generate any assembly needed to evaluate the index.
+        """
+        if self.memory(array, scope) != HEAP:
+            if isinstance(index, Literal) and float(index.val).is_integer():
+                return scope.get_var_address(array, int(float(index.val)) + offset)[0]
+            index_expr = self.eval_expression(index, scope)
+            return f"{scope.get_var_address(array, offset)[0]}+{index_expr}"
+
+        base = self.eval_expression(array, scope)
+        if isinstance(index, Literal) and float(index.val).is_integer():
+            offset += int(float(index.val))
+            return base if offset == 0 else f"{base}{offset:+d}"
+        index_expr = self.eval_expression(index, scope)
+        return f"{base}+{index_expr}" if offset == 0 else f"{base}{offset:+d}+{index_expr}"
+
+    def address_dependency(self, array: Variable, index: Expression, scope: StackVariableScope) -> Expression:
+        """
+        An expression which changes whenever the address of an element changes
+        """
+        if self.memory(array, scope) != HEAP:
+            return index
+        return BinaryOperation(array, index, Operator.ADD)
+
+    def slice_addresses(
+        self,
+        array_slice: Variable | Slice,
+        later: list[Expression],
+        scope: StackVariableScope,
+    ) -> tuple[str, str, str, StackVariableScope]:
+        """
+        Get desmos expressions for the indices in memory of the first and last
+        elements of an array or slice which are still valid after
+        the `later` expressions are evaluated.
+
+        Returns the list holding the elements, the indices, and the scope
+        to evaluate the later expressions in.
+        """
+        match array_slice:
+            case Variable(_):
+                size = self.array_type(array_slice, scope).size
+                first = scope.get_var_address(array_slice)[0]
+                last = scope.get_var_address(array_slice, size - 1)[0]
+                return self.memory(array_slice, scope), first, last, scope
+            case Slice(array, start, end):
+                first = self.element_address(array, start, scope)
+                dependency = self.address_dependency(array, start, scope)
+                first, scope = self.keep_value(first, dependency, [end] + later, scope)
+                last = self.element_address(array, end, scope, -1)
+                dependency = self.address_dependency(array, end, scope)
+                last, scope = self.keep_value(last, dependency, later, scope)
+                return self.memory(array, scope), first, last, scope
+
+    def is_list(self, expr: Expression, scope: StackVariableScope) -> bool:
+        """
+        Whether an expression evaluates to a list instead of a number
+        """
+        match expr:
+            case Variable(_):
+                return expr not in self.list_variables and isinstance(
+                    scope.get_var_address(expr)[1], ArrayType
+                )
+            case Slice(_, _, _) | Range(_, _) | Comprehension(_, _, _, _) | ListLiteral(_):
+                return True
+            case _:
+                return False
+
+    def assign_elements(
+        self,
+        target: Variable | Slice,
+        val: Expression,
+        scope: StackVariableScope,
+    ) -> None:
+        """
+        Generate assembly to set every element of an array or slice to a number
+        or to the elements of a list of the same length
+        """
+        _, first, last, scope = self.slice_addresses(target, [val], scope)
+        array = target if isinstance(target, Variable) else target.array
+        indices = self.indices(array, scope)
+        condition = rf"{first}\le {indices}\le {last}"
+        if not self.is_list(val, scope):
+            val_expr = self.eval_expression(val, scope)
+            self.program_asm += self.update_memory_asm(array, scope, condition, val_expr)
+            return
+
+        if isinstance(val, (Variable, Slice)):
+            # copy from the entries at the same position relative to the source
+            source_memory, source_first, _, scope = self.slice_addresses(val, [], scope)
+            source = rf"{source_memory}\left[{indices}-\left({first}\right)+{source_first}\right]"
+        else:
+            list_expr = self.eval_list_expression(val, scope)
+            source = rf"{list_expr}\left[{indices}-\left({first}\right)+1\right]"
+        self.program_asm += self.update_memory_asm(array, scope, condition, source)
+
+    def heap_size_classes(self) -> list[int]:
+        return heap_size_classes(self.heap_size)
+
+    def heap_length(self) -> int:
+        """
+        Number of entries in the heap list, with one more than the heap size
+        for the entry before a block, so a block as large as the heap fits
+        """
+        return self.heap_size + 1
+
+    def alloc_asm(self, register: str, size: Expression, size_expr: str) -> str:
+        """
+        Returns desmos assembly which finds a block with room for `size` numbers
+        and stores a pointer to it in a register.
+
+        Every block is preceded by an entry holding its size class (the index in
+        `HEAP_SIZES` minus one), which is used to find the free list when it is freed.
+        The first entry of a free block holds a pointer to the next free block of
+        the same size class, so taking a block from a free list or from the unused
+        space after `HEAP_TOP` both take a single tick.
+        """
+        self.uses_heap = True
+        sizes = self.heap_size_classes()
+        if isinstance(size, Literal) and float(size.val) <= sizes[-1]:
+            size_class = str(len([i for i in sizes if i < float(size.val)]))
+            list_index = str(int(size_class) + 1)
+            block_size = str(sizes[int(size_class)])
+        else:
+            size_class = rf"\operatorname{{length}}\left({HEAP_SIZES}\left[{HEAP_SIZES}<{size_expr}\right]\right)"
+            list_index = f"{size_class}+1"
+            # undefined (and out of memory) if the size is larger than every class
+            block_size = rf"{HEAP_SIZES}\left[{list_index}\right]"
+
+        head = rf"{HEAP_FREE}\left[{list_index}\right]"
+        pointer = rf"\left\{{{head}>0:{head},{HEAP_TOP}+2\right\}}"
+        new_top = rf"{HEAP_TOP}+{block_size}+1"
+
+        actions = [
+            f"{register}\\to {pointer}",
+            rf"{HEAP_TOP}\to\left\{{{head}>0:{HEAP_TOP},{new_top}\right\}}",
+            # the next block in the free list becomes the head
+            rf"{HEAP_FREE}\to\left\{{{_indices(HEAP_FREE, len(sizes))}={list_index}:\left\{{{head}>0:{HEAP}\left[{head}\right],0\right\}},{HEAP_FREE}\right\}}",
+            rf"{HEAP}\to\left\{{{_indices(HEAP, self.heap_length())}={pointer}-1:{size_class},{HEAP}\right\}}",
+            rf"DONE\to\left\{{{head}>0:DONE,{new_top}\le {self.heap_length()}:DONE,{OUT_OF_MEMORY}\right\}}",
+        ]
+        return f"line {', '.join(actions)}, NEXTLINE\n"
+
+    def free_asm(self, pointer_expr: str) -> str:
+        """
+        Returns desmos assembly which adds a block to the front of the free list of its size class
+        """
+        self.uses_heap = True
+        sizes = self.heap_size_classes()
+        size_class = rf"{HEAP}\left[{pointer_expr}-1\right]"
+        head = rf"{HEAP_FREE}\left[{size_class}+1\right]"
+        actions = [
+            rf"{HEAP_FREE}\to\left\{{{_indices(HEAP_FREE, len(sizes))}={size_class}+1:{pointer_expr},{HEAP_FREE}\right\}}",
+            rf"{HEAP}\to\left\{{{_indices(HEAP, self.heap_length())}={pointer_expr}:{head},{HEAP}\right\}}",
+        ]
+        return f"line {', '.join(actions)}, NEXTLINE\n"
+
+    def eval_list_expression(self, expr: Expression, scope: StackVariableScope) -> str:
+        """
+        Evaluate an expression which is a list and generate any assembly needed
+        to facilitate this evaluation.
+
+        Returns a desmos list expression which is valid in the next line of assembly.
+        Every element of a list is computed in the same tick, so function calls
+        are not allowed in expressions which are evaluated for each element.
+        """
+        match expr:
+            case Variable(_) | Slice(_, _, _) if self.is_list(expr, scope):
+                memory, first, last, scope = self.slice_addresses(expr, [], scope)
+                list_expr = rf"{memory}\left[{first}...{last}\right]"
+                if isinstance(expr, Variable) or all(
+                    isinstance(i, Literal) for i in [expr.start, expr.end]
+                ):
+                    return list_expr
+                # a range in desmos counts down if the end is before the start
+                return rf"\left\{{{first}\le {last}:{list_expr},\left[\right]\right\}}"
+            case Range(start, end):
+                if all(isinstance(i, Literal) and float(i.val).is_integer() for i in [start, end]):
+                    if float(start.val) >= float(end.val):
+                        return r"\left[\right]"
+                    return rf"\left[{start.val}...{int(float(end.val)) - 1}\right]"
+                start_expr = self.eval_expression(start, scope)
+                start_expr, scope = self.keep_value(start_expr, start, [end], scope)
+                end_expr = self.eval_expression(end, scope)
+                count = rf"\operatorname{{ceil}}\left({end_expr}-\left({start_expr}\right)\right)"
+                return (
+                    rf"\left\{{{end_expr}>{start_expr}:\left[0...{count}-1\right]+{start_expr},"
+                    + r"\left[\right]\right\}"
+                )
+            case Comprehension(element, var, source, condition):
+                for e in [element] + ([condition] if condition is not None else []):
+                    if contains_call(e):
+                        raise CompilerError(f"Function calls cannot be used for each element of a list ({expr})")
+                source_expr = self.eval_list_expression(source, scope)
+
+                list_var = f"E_{{lem{self.label_counter}}}"
+                self.label_counter += 1
+                outer_list_variables = self.list_variables
+                self.list_variables = {**outer_list_variables, var: list_var}
+                if condition is not None:
+                    condition_expr = self.eval_expression(condition, scope)
+                    source_expr = rf"{source_expr}\left[\left[{condition_expr}\operatorname{{for}}{list_var}={source_expr}\right]=1\right]"
+                element_expr = self.eval_expression(element, scope)
+                self.list_variables = outer_list_variables
+                return rf"\left[{element_expr}\operatorname{{for}}{list_var}={source_expr}\right]"
+            case ListLiteral(values):
+                return rf"\left[{','.join(self.eval_expression(v, scope) for v in values)}\right]"
+            case _:
+                raise CompilerError(f"{expr} is not a list")
+
+    def eval_expression(self, expr: Expression, scope: StackVariableScope) -> str:
         """
         Evaluate an expression and generate any assembly needed to facilitate this evaluation.
 
-        Places the returned expression in the RETURN_VAL register.
+        Returns a desmos expression for the result which is valid in the next line of assembly.
+        Expressions without function calls do not generate any assembly.
         """
         match expr:
             case Literal(s):
-                self.program_asm += f"line {RETURN_VAL} \\to {s}, NEXTLINE\n"
+                return rf"\left({s}\right)" if s.startswith("-") else s
+            case Variable(name) if expr in self.list_variables:
+                return self.list_variables[expr]
             case Variable(name):
                 desmos_expr, var_type = scope.get_var_data_expr(Variable(name))
-                if SIZEOF[var_type] == 1:
-                    self.program_asm += f"line {RETURN_VAL} \\to {desmos_expr}[1], NEXTLINE\n"
-                else:
-                    raise CompilerError(f"Variables with size > 1 not yet supported")
+                if isinstance(var_type, ArrayType):
+                    raise CompilerError(f"Array {name} cannot be used as a number")
+                return desmos_expr
+            case Index(array, index):
+                memory = self.memory(array, scope)
+                return rf"{memory}\left[{self.element_address(array, index, scope)}\right]"
+            case Slice(_, _, _) | Range(_, _) | Comprehension(_, _, _, _) | ListLiteral(_):
+                raise CompilerError(f"List {expr} cannot be used as a number")
+            case Length(Variable(_) as array) if array not in self.list_variables:
+                return str(self.array_type(array, scope).size)
+            case Length(arg):
+                list_expr = self.eval_list_expression(arg, scope)
+                return rf"\operatorname{{length}}\left({list_expr}\right)"
+            case Alloc(size):
+                size_expr = self.eval_expression(size, scope)
+                register = self.allocate_register()
+                self.program_asm += self.alloc_asm(register, size, size_expr)
+                return register
+            case Reduction(op, arg):
+                list_expr = self.eval_list_expression(arg, scope)
+                match op:
+                    case ListOperator.SUM:
+                        return rf"\operatorname{{total}}\left({list_expr}\right)"
+                    case ListOperator.MIN:
+                        return rf"\min\left({list_expr}\right)"
+                    case ListOperator.MAX:
+                        return rf"\max\left({list_expr}\right)"
+            case BinaryOperation(arg1, arg2, Operator.AND | Operator.OR as op) if contains_call(arg2):
+                # the calls in the second argument are skipped if the first one decides the result
+                result, set_asm, scope = self.temporary([arg2], scope)
+                condition = self.eval_condition(arg1, scope)
+                end = f"endcond{self.label_counter}"
+                self.label_counter += 1
+                self.program_asm += set_asm(rf"\left\{{{condition}:1,0\right\}}")
+                self.program_asm += self.branch_asm(condition, end, op == Operator.OR)
+                condition = self.eval_condition(arg2, scope)
+                self.program_asm += set_asm(rf"\left\{{{condition}:1,0\right\}}")
+                self.program_asm += f"label {end}\n"
+                return result
+            case BinaryOperation(arg1, arg2, Operator.AND):
+                condition1 = self.eval_condition(arg1, scope)
+                condition2 = self.eval_condition(arg2, scope)
+                return rf"\left\{{{condition1}:\left\{{{condition2}:1,0\right\}},0\right\}}"
+            case BinaryOperation(arg1, arg2, Operator.OR):
+                condition1 = self.eval_condition(arg1, scope)
+                condition2 = self.eval_condition(arg2, scope)
+                return rf"\left\{{{condition1}:1,{condition2}:1,0\right\}}"
             case BinaryOperation(arg1, arg2, op):
-                arg_scope = StackVariableScope(scope, scope.get_child_scope_base())
-
-                # evaluate both arguments in a temporary scope
-                self.compile_statement(
-                    Group(
-                        [
-                            Declaration(Variable("#arg1"), DesmosType("num")),
-                            Assignment(Variable("#arg1"), arg1),
-                            Declaration(Variable("#arg2"), DesmosType("num")),
-                            Assignment(Variable("#arg2"), arg2),
-                        ]
-                    ),
-                    arg_scope,
-                )
-                arg1_expr, arg1_type = arg_scope.get_var_data_expr(Variable("#arg1"))
-                arg2_expr, arg2_type = arg_scope.get_var_data_expr(Variable("#arg2"))
-                if SIZEOF[arg1_type] > 1 or SIZEOF[arg2_type] > 1:
-                    raise CompilerError("Variables with size > 1 not yet supported")
-
-                # calculate and save result
-                result_expression = self.get_binary_op_expr(arg1_expr + "[1]", arg2_expr + "[1]", op)
-                self.program_asm += f"line {RETURN_VAL} \\to {result_expression}, NEXTLINE\n"
-
-                # pop scope
-                self.program_asm += arg_scope.pop_scope_asm()
+                arg1_expr, arg2_expr = self.eval_operands(arg1, arg2, scope)
+                return self.get_binary_op_expr(arg1_expr, arg2_expr, op)
+            case UnaryOperation(arg, Operator.NOT):
+                return rf"\left\{{{self.eval_condition(arg, scope)}:0,1\right\}}"
+            case UnaryOperation(arg, _):
+                return rf"\left(-{self.eval_expression(arg, scope)}\right)"
 
             case FunctionCall(name, args):
                 func = self.function_lookup[name]
@@ -226,61 +966,284 @@ class Compiler:
                         f"Function {name} expected to have {len(func.definition.params)} arguments"
                     )
 
-                # create temporary scope for calculating arguments (in current context of the program)
-                # this will leave arguments on the stack in order
-                arg_scope = StackVariableScope(scope, scope.get_child_scope_base())
-                for arg_index, (arg, param) in enumerate(
-                    zip(args, func.definition.params)
-                ):
-                    # temporary variable name
-                    arg_variable = Variable(f"#arg{arg_index}")
-
-                    # assign temporary variable to argument value
-                    self.compile_statement(
-                        Declaration(arg_variable, param.type), arg_scope
+                # calculate arguments in the current context of the program
+                arg_exprs = []
+                for arg_index, (arg, param) in enumerate(zip(args, func.definition.params)):
+                    if sizeof(param.type) > 1:
+                        raise CompilerError("Variables with size > 1 not yet supported")
+                    arg_expr = self.eval_expression(arg, scope)
+                    arg_expr, scope = self.keep_value(
+                        arg_expr, arg, args[arg_index + 1 :], scope
                     )
-                    self.compile_statement(Assignment(arg_variable, arg), arg_scope)
-
-                # set stack frame base pointer to the argument scope's base
-                self.program_asm += f"line {STACK_BASE_PTRS}\\to\\operatorname{{join}}\\left({STACK_BASE_PTRS},{arg_scope.get_scope_base()}\\right), NEXTLINE\n"
+                    arg_exprs.append(arg_expr)
 
-                # save line location and jump to function
-                self.program_asm += f"line {RETURN_LINES}\\to\\operatorname{{join}}\\left({RETURN_LINES},LINE + 1\\right), GOTO {func.goto_label}\n"
+                self.program_asm += self.call_asm(func, arg_exprs)
+                return RETURN_VAL
             case _:
                 raise CompilerError(f"Unknown expression type {type(expr)} ({expr})")
 
+    def eval_operands(
+        self, arg1: Expression, arg2: Expression, scope: StackVariableScope
+    ) -> tuple[str, str]:
+        """
+        Evaluate both arguments of a binary operation, keeping the value
+        of the first one while the second one is evaluated
+        """
+        arg1_expr = self.eval_expression(arg1, scope)
+        arg1_expr, scope = self.keep_value(arg1_expr, arg1, [arg2], scope)
+        return arg1_expr, self.eval_expression(arg2, scope)
+
+    def eval_condition(self, expr: Expression, scope: StackVariableScope) -> str:
+        """
+        Evaluate an expression used as a condition and generate any assembly needed to facilitate this evaluation.
+
+        Returns a desmos condition, which is true in the next line of assembly if the value
+        of the expression is 1. Comparisons are used directly instead of as a value.
+        """
+        match expr:
+            case BinaryOperation(
+                arg1, arg2, Operator.EQ | Operator.LT | Operator.GT | Operator.LE | Operator.GE as op
+            ):
+                return self.get_comparison(*self.eval_operands(arg1, arg2, scope), op)
+            case _:
+                return f"{self.eval_expression(expr, scope)}=1"
+
+    def branch_asm(self, condition: str, label: str, jump_if: bool) -> str:
+        """
+        Returns desmos assembly which jumps to a label if a desmos condition
+        is `jump_if` and continues on the next line otherwise
+        """
+        branches = [f"GOTO {label}", "NEXTLINE"] if jump_if else ["NEXTLINE", f"GOTO {label}"]
+        return f"line \\left\\{{{condition}: {', '.join(branches)} \\right\\}}\n"
+
+    def compile_branch(
+        self, condition: Expression, scope: StackVariableScope, label: str, jump_if: bool
+    ) -> None:
+        """
+        Generate assembly which jumps to a label if a condition is `jump_if` (1 for true)
+        and continues on the next line otherwise.
+
+        If the second argument of `&&` or `||` calls a function, each argument gets its own
+        branch so the calls are only made when the first argument does not decide where to go.
+        """
+        match condition:
+            case UnaryOperation(arg, Operator.NOT) if self.short_circuits(arg):
+                self.compile_branch(arg, scope, label, not jump_if)
+            case BinaryOperation(arg1, arg2, Operator.AND | Operator.OR as op) if self.short_circuits(
+                condition
+            ):
+                # the first argument decides the result when it is true for || and false for &&
+                decides = op == Operator.OR
+                if decides == jump_if:
+                    self.compile_branch(arg1, scope, label, jump_if)
+                    self.compile_branch(arg2, scope, label, jump_if)
+                else:
+                    end = f"endcond{self.label_counter}"
+                    self.label_counter += 1
+                    self.compile_branch(arg1, scope, end, decides)
+                    self.compile_branch(arg2, scope, label, jump_if)
+                    self.program_asm += f"label {end}\n"
+            case _:
+                condition_expr = self.eval_condition(condition, scope)
+                self.program_asm += self.branch_asm(condition_expr, label, jump_if)
+
+    def short_circuits(self, condition: Expression) -> bool:
+        """
+        Whether a condition needs more than one branch to skip function calls which are not needed
+        """
+        match condition:
+            case UnaryOperation(arg, Operator.NOT):
+                return self.short_circuits(arg)
+            case BinaryOperation(arg1, arg2, Operator.AND | Operator.OR):
+                return contains_call(arg2) or self.short_circuits(arg1)
+            case _:
+                return False
+
+    def case_numbers(self, condition: Expression) -> tuple[Expression, list[float]] | None:
+        """
+        The expression and the numbers it is compared to by a condition like `x == 1 || x == 3`,
+        or None if the condition is not of this form
+        """
+        match condition:
+            case BinaryOperation(arg1, arg2, Operator.OR):
+                first, second = self.case_numbers(arg1), self.case_numbers(arg2)
+                if first is None or second is None or first[0] != second[0]:
+                    return None
+                return first[0], first[1] + second[1]
+            case BinaryOperation(Literal(number), arg, Operator.EQ) | BinaryOperation(
+                arg, Literal(number), Operator.EQ
+            ):
+                return arg, [float(number)]
+            case _:
+                return None
+
+    def switch_cases(
+        self, statement: If
+    ) -> tuple[Expression, list[tuple[list[int], Statement]], Statement | None] | None:
+        """
+        Find the cases of a chain of ifs which compare the same expression to
+        whole numbers, like the chain a switch statement becomes.
+
+        Returns the expression, the numbers and contents of each case and the statement
+        run when there is no case for the value, or None if the chain is not worth
+        compiling to a jump table (see `JUMP_TABLE_CASES` and `JUMP_TABLE_DENSITY`).
+        """
+        value = None
+        cases = []
+        numbers: set[int] = set()
+        rest = statement
+        while True:
+            if isinstance(rest, Group) and len(rest.statements) == 1:
+                rest = rest.statements[0]
+            if not isinstance(rest, If):
+                break
+            found = self.case_numbers(rest.condition)
+            if found is None or not all(n.is_integer() for n in found[1]):
+                break
+            # the value is evaluated once instead of before each comparison
+            if value is None and not any(isinstance(n, (FunctionCall, Alloc)) for n in walk(found[0])):
+                value = found[0]
+            if found[0] != value:
+                break
+            # numbers of earlier cases never reach this one
+            case = [int(n) for n in dict.fromkeys(found[1]) if int(n) not in numbers]
+            numbers.update(case)
+            cases.append((case, rest.contents))
+            rest = rest._else
+
+        if len(numbers) < JUMP_TABLE_CASES:
+            return None
+        if max(numbers) - min(numbers) + 1 > JUMP_TABLE_DENSITY * len(numbers):
+            return None
+        return value, cases, rest
+
+    def call_asm(self, func: FuncInfo, arg_exprs: list[str]) -> str:
+        """
+        Returns desmos assembly which pushes a function's stack frame and jumps to the function.
+
+        The frame starts with `FRAME_HEADER` entries holding the line after the call and the
+        frame pointer of the caller, followed by the arguments and zeros for the rest of the
+        frame. The frame pointer is set to the first argument.
+
+        If the whole frame does not fit on the stack, the program exits
+        with `STACK_OVERFLOW` instead.
+        """
+        header = ["LINE+1", FRAME_PTR]
+        if self.stack_pages is None:
+            top = rf"\operatorname{{length}}\left({STACK}\right)"
+            frame_ptr = f"{top}+{FRAME_HEADER + 1}"
+            last = f"{top}+{FRAME_HEADER}+{func.frame_size_var}"
+            capacity = MAX_LIST_LENGTH
+        else:
+            first = func.frame_start_var
+            frame_ptr = f"{first}+{FRAME_HEADER}"
+            last = f"{first}+{FRAME_HEADER - 1}+{func.frame_size_var}"
+            capacity = self.stack_pages.size * self.stack_pages.count
+
+        actions = [rf"{FRAME_PTR}\to {frame_ptr}"]
+        if self.stack_pages is None:
+            actions.append(
+                rf"{STACK}\to\operatorname{{join}}\left({STACK},{','.join(header + arg_exprs)},{func.frame_locals_var}\right)"
+            )
+        else:
+            page, page_first = self.stack_pages.location(first)
+            indices = self.stack_pages.indices()
+            frame = rf"\operatorname{{join}}\left(\left[{','.join(header + arg_exprs)}\right],{func.frame_locals_var}\right)"
+            actions.append(rf"{STACK_TOP}\to {last}")
+            actions.append(
+                self.stack_pages.update_actions(
+                    page,
+                    rf"{page_first}\le {indices}\le {page_first}+{FRAME_HEADER - 1}+{func.frame_size_var}",
+                    rf"{frame}\left[{indices}-\left({page_first}\right)+1\right]",
+                )
+            )
+        actions.append(f"GOTO {func.goto_label}")
+        return f"line \\left\\{{{last}\\le {capacity}:\\left({', '.join(actions)}\\right),DONE\\to {STACK_OVERFLOW}\\right\\}}\n"
+
     def compile_statement(
         self, statement: Statement, scope: StackVariableScope
     ) -> None:
+        # registers are only used within a single statement
+        registers_in_use = self.registers_in_use
+
         match statement:
             case Group(statements):
-                for s in statements:
-                    self.compile_statement(s, scope)
+                for i, s in enumerate(statements):
+                    if isinstance(s, Declaration) and i + 1 < len(statements):
+                        # no need to set the variable to 0 if the next statement sets all of it
+                        self.declare(s, scope, not self.initializes(s.var, statements[i + 1]))
+                    else:
+                        self.compile_statement(s, scope)
 
-            case Declaration(var, var_type):
-                self.program_asm += scope.add_var_asm(var, var_type)
+            case Declaration(_, _):
+                self.declare(statement, scope, True)
 
             case Assignment(var, val):
-                self.eval_expression(val, scope)
-                self.program_asm += scope.set_var_asm(var, RETURN_VAL)
+                if isinstance(scope.get_var_address(var)[1], ArrayType):
+                    self.assign_elements(var, val, scope)
+                else:
+                    val_expr = self.eval_expression(val, scope)
+                    self.program_asm += scope.set_var_asm(var, val_expr)
+
+            case IndexAssignment(Index(array, index), val):
+                address = self.element_address(array, index, scope)
+                dependency = self.address_dependency(array, index, scope)
+                address, val_scope = self.keep_value(address, dependency, [val], scope)
+                val_expr = self.eval_expression(val, val_scope)
+                self.program_asm += self.update_memory_asm(
+                    array, scope, f"{self.indices(array, scope)}={address}", val_expr
+                )
+
+            case IndexAssignment(Slice(_, _, _) as target, val):
+                self.assign_elements(target, val, scope)
+
+            case If(_, _, _) if self.switch_cases(statement) is not None:
+                value, cases, default = self.switch_cases(statement)
+                label = self.label_counter
+                self.label_counter += 1
+
+                # jump straight to the case for the value, or to the default
+                # (the first entry of the table) if there is no case for it
+                value_expr = self.eval_expression(value, scope)
+                case_labels = {n: f"case{label}_{k}" for k, (case, _) in enumerate(cases) for n in case}
+                first, last = min(case_labels), max(case_labels)
+                targets = [f"else{label}"] + [
+                    case_labels.get(n, f"else{label}") for n in range(first, last + 1)
+                ]
+                table = f"J_{{umpTable{label}}}"
+                self.jump_tables[table] = rf"\left[{','.join(f'LABEL {t}' for t in targets)}\right]"
+                shift = 2 - first
+                entry = f"{value_expr}+{shift}" if shift >= 0 else f"{value_expr}-{-shift}"
+                in_table = rf"{first}\le {value_expr}\le {last}:{entry}"
+                index = rf"\left\{{\operatorname{{mod}}\left({value_expr},1\right)=0:\left\{{{in_table},1\right\}},1\right\}}"
+                self.program_asm += f"line GOTO {table}\\left[{index}\\right]\n"
+                self.registers_in_use = registers_in_use
+
+                for k, (_, contents) in enumerate(cases):
+                    self.program_asm += f"label case{label}_{k}\n"
+                    self.compile_statement(contents, scope.child_scope())
+                    if not always_returns(contents):
+                        self.program_asm += f"line GOTO endif{label}\n"
+                self.program_asm += f"label else{label}\n"
+                if default is not None:
+                    self.compile_statement(default, scope.child_scope())
+                self.program_asm += f"label endif{label}\n"
 
             case If(condition, contents, _else):
                 label = self.label_counter
                 self.label_counter += 1
 
-                self.eval_expression(condition, scope)
-                self.program_asm += f"line \\left\\{{{RETURN_VAL} = 1: NEXTLINE, GOTO else{label} \\right\\}}\n"
+                self.compile_branch(condition, scope, f"else{label}", False)
+                self.registers_in_use = registers_in_use
 
-                new_scope = StackVariableScope(scope, scope.get_child_scope_base())
-                self.compile_statement(contents, new_scope)
-                self.program_asm += new_scope.pop_scope_asm()
+                self.compile_statement(contents, scope.child_scope())
 
-                self.program_asm += f"line GOTO endif{label}\n"
+                # no jump past the else branch if the branch can never reach it
+                if not always_returns(contents):
+                    self.program_asm += f"line GOTO endif{label}\n"
                 self.program_asm += f"label else{label}\n"
                 if _else is not None:
-                    new_scope = StackVariableScope(scope, scope.get_child_scope_base())
-                    self.compile_statement(_else, new_scope)
-                    self.program_asm += new_scope.pop_scope_asm()
+                    self.compile_statement(_else, scope.child_scope())
 
                 self.program_asm += f"label endif{label}\n"
 
@@ -288,15 +1251,15 @@ class Compiler:
                 label = self.label_counter
                 self.label_counter += 1
 
-                self.program_asm += f"label begwhile{label}\n"
-                self.eval_expression(statement.condition, scope)
-                self.program_asm += f"line \\left\\{{{RETURN_VAL}=1: NEXTLINE, GOTO endwhile{label} \\right\\}}\n"
+                # check the condition at the end of the loop body so each
+                # iteration jumps back to the start on the same line
+                self.compile_branch(condition, scope, f"endwhile{label}", False)
+                self.registers_in_use = registers_in_use
 
-                new_scope = StackVariableScope(scope, scope.get_child_scope_base())
-                self.compile_statement(contents, new_scope)
-                self.program_asm += new_scope.pop_scope_asm()
+                self.program_asm += f"label begwhile{label}\n"
+                self.compile_statement(contents, scope.child_scope())
 
-                self.program_asm += f"line GOTO begwhile{label}\n"
+                self.compile_branch(condition, scope, f"begwhile{label}", True)
                 self.program_asm += f"label endwhile{label}\n"
 
             case FunctionDefinition(name, ret, params, body) as func_def:
@@ -309,85 +1272,208 @@ class Compiler:
                     raise CompilerError(f"Function {name} is already defined")
 
                 label = f"func{self.label_counter}"
+                self.function_lookup[name] = FuncInfo(
+                    label,
+                    func_def,
+                    f"F_{{rameSize{self.label_counter}}}",
+                    f"F_{{rameLocals{self.label_counter}}}",
+                    f"F_{{rameStart{self.label_counter}}}",
+                )
                 self.label_counter += 1
-                self.function_lookup[name] = FuncInfo(label, func_def)
                 # do not generate assembly here because it will go at the end of the program
 
             case FunctionReturn(expr):
-                if not self.compiling_function:
+                if self.current_function is None:
                     raise CompilerError("Return statements must be inside functions")
 
-                self.eval_expression(expr, scope)
-
-                # pop stack frame
-                self.program_asm += scope.pop_scope_asm()
+                return_expr = self.eval_expression(expr, scope)
+                actions = [] if return_expr == RETURN_VAL else [rf"{RETURN_VAL} \to {return_expr}"]
 
-                # revert stack frame base pointer
-                self.program_asm += f"line {STACK_BASE_PTRS}\\to {STACK_BASE_PTRS}\\left[1...\\operatorname{{length}}\\left({STACK_BASE_PTRS}\\right)-1\\right], NEXTLINE\n"
-
-                # set line to return line number
-                self.program_asm += f"line LINE\\to {RETURN_LINES}\\left[\\operatorname{{length}}\\left({RETURN_LINES}\\right)\\right],{RETURN_LINES}\\to {RETURN_LINES}\\left[1...\\operatorname{{length}}\\left({RETURN_LINES}\\right)-1\\right]\n"
+                # pop the stack frame, restore the caller's frame pointer
+                # and jump back to the line after the call in the same tick
+                self.program_asm += f"line {', '.join(actions + scope.return_actions())}\n"
 
             case FunctionCallStatement(call):
                 self.eval_expression(call, scope)
 
+            case Free(pointer):
+                pointer_expr = self.eval_expression(pointer, scope)
+                self.program_asm += self.free_asm(pointer_expr)
+
             case _:
                 raise CompilerError(f"Unknown statement type {type(statement)}")
 
+        self.registers_in_use = registers_in_use
+
+    def declare(self, declaration: Declaration, scope: StackVariableScope, zero: bool):
+        """
+        Add a declared variable to a scope, setting it to 0 if `zero` is True
+        and its place in the stack frame can hold an old value
+        """
+        var, var_type = declaration.var, declaration.type
+        if isinstance(var_type, ArrayType) and var_type.size < 1:
+            raise CompilerError(f"Array {var} must have at least one element")
+        if scope.add_var(var, var_type) or not zero:
+            return
+        if isinstance(var_type, ArrayType):
+            self.program_asm += scope.set_var_asm(var, rf"\left(\left[1...{var_type.size}\right]\cdot0\right)")
+        else:
+            self.program_asm += scope.set_var_asm(var, "0")
+
+    @staticmethod
+    def initializes(var: Variable, statement: Statement) -> bool:
+        """
+        Whether a statement sets the whole of a variable without using its old value
+        """
+        return (
+            isinstance(statement, Assignment)
+            and statement.var == var
+            and not any(isinstance(n, Variable) and n == var for n in walk(statement.val))
+        )
+
+    def compile_frame(self, body: Statement, scope: StackVariableScope, function: bool):
+        """
+        Compile statements which run in their own stack frame.
+
+        The frame size is only known once all nested scopes are compiled, so the
+        assembly reserving the frame of the main program is added before the body
+        afterwards. The frame of a function is reserved by each call along with its header.
+        """
+        outer_asm = self.program_asm
+        self.program_asm = ""
+        self.compile_statement(body, scope)
+        size = scope.frame_size() + (FRAME_HEADER if function else 0)
+        if self.stack_pages is not None and size > self.stack_pages.size:
+            raise CompilerError(
+                f"Stack frame of {size} entries does not fit in a page of {self.stack_pages.size}"
+            )
+        reserve_asm = "" if function else scope.reserve_frame_asm()
+        self.program_asm = outer_asm + reserve_asm + self.program_asm
+
     def compile_functions(self):
         for name, info in self.function_lookup.items():
             self.program_asm += f"label {info.goto_label}\n"
 
-            func_scope = StackVariableScope(self.global_scope, CURRENT_STACK_BASE_PTR)
+            frame_ptr = FRAME_PTR if self.stack_pages is None else self.stack_pages.frame_ptr()
+            func_scope = StackVariableScope(self.global_scope, frame_ptr, 0, self.stack_pages)
+            info.scope = func_scope
 
-            # arguments should be the top values on the stack
+            # the arguments are at the start of the frame
             for p in info.definition.params:
-                # ignore assembly output since the values are already on the stack
-                _ = func_scope.add_var_asm(p.var, p.type)
+                func_scope.add_var(p.var, p.type)
 
-            self.compiling_function = True
-            self.compile_statement(info.definition.body, func_scope)
+            self.current_function = name
+            self.compile_frame(info.definition.body, func_scope, True)
             # TODO: what to do with no return
-            self.compiling_function = False
-
-    def generate_assembly(self):
-        # define global variables for the program to use
-        global_vars = {
-            STACK: "[]",
-            STACK_BASE_PTRS: "[-1]",
-            RETURN_VAL: "0",
-            RETURN_LINES: "[]",
-        }
-        for i, j in global_vars.items():
-            self.program_asm += f"expr {i}={j}\n"
+            self.current_function = None
 
-        # create input and output
-        self.compile_statement(
+    def compile_program(self):
+        """
+        Generate the assembly for the statements of the program and its functions,
+        which raises `CompilerError` if the program is not valid
+        """
+        # create input and output then generate program assembly
+        self.compile_frame(
             Group(
                 [
                     Declaration(Variable("IN"), DesmosType("num")),
                     Assignment(Variable("IN"), Literal("IN")),
                     Declaration(Variable("OUT"), DesmosType("num")),
+                    self.root,
                 ]
             ),
             self.global_scope,
+            False,
         )
 
-        # generate program assembly
-        self.compile_statement(self.root, self.global_scope)
-
         # set output and exit program
         out_expr, out_type = self.global_scope.get_var_data_expr(Variable("OUT"))
-        if SIZEOF[out_type] > 1:
+        if sizeof(out_type) > 1:
             raise CompilerError("types of size > 1 are not yet supported")
-        self.program_asm += f"line OUT \\to {out_expr}[1], DONE \\to 0\n"
+        self.program_asm += f"line OUT \\to {out_expr}, DONE \\to 0\n"
 
         # add function definitions at the end of file
         # so they don't start executing unexpectedly
         self.compile_functions()
 
+    def generate_assembly(self):
+        self.compile_program()
+
+        if self.output is not None:
+            # the whole program ran at compile time, so only the output is set
+            # (it is still compiled so that the same programs are rejected)
+            output = self.eval_expression(number_literal(self.output), self.global_scope)
+            self.program_asm = f"line OUT \\to {output}, DONE \\to 0\n"
+            self.function_lookup = {}
+            self.global_scope = StackVariableScope(None, None, 1, self.stack_pages)
+            return self.program_asm
+
+        # define global variables for the program to use
+        global_vars = {
+            STACK: "[]",
+            FRAME_PTR: "1",
+            RETURN_VAL: "0",
+        }
+        for info in self.function_lookup.values():
+            size = info.scope.frame_size()
+            global_vars[info.frame_size_var] = str(size)
+            locals_size = size - len(info.definition.params)
+            global_vars[info.frame_locals_var] = (
+                rf"\left[1...{locals_size}\right]\cdot0" if locals_size > 0 else "[]"
+            )
+        if self.stack_pages is not None:
+            del global_vars[STACK]
+            global_vars.update(self.stack_pages_exprs())
+        for registers in self.registers.values():
+            global_vars.update({register: "0" for register in registers})
+        global_vars.update(self.jump_tables)
+        if self.uses_heap:
+            sizes = self.heap_size_classes()
+            global_vars.update(
+                {
+                    HEAP: rf"\left[1...{self.heap_length()}\right]\cdot0",
+                    HEAP_FREE: rf"\left[1...{len(sizes)}\right]\cdot0",
+                    HEAP_TOP: "0",
+                    HEAP_SIZES: rf"\left[{','.join(str(i) for i in sizes)}\right]",
+                }
+            )
+        global_vars_asm = "".join(f"expr {i}={j}\n" for i, j in global_vars.items())
+        self.program_asm = global_vars_asm + self.program_asm
+
+        # run independent actions in the same tick
+        self.program_asm = schedule(self.program_asm)
+
         return self.program_asm
 
 
-def compile_syntax_tree(root: Statement):
-    return Compiler(root).generate_assembly()
+    def stack_pages_exprs(self) -> dict[str, str]:
+        """
+        Desmos expressions for the stack pages and the variables used to find them
+        """
+        pages = self.stack_pages
+        exprs = {pages.page(i): rf"\left[1...{pages.size}\right]\cdot0" for i in range(pages.count)}
+        exprs[STACK_TOP] = str(self.global_scope.frame_size())
+        if pages.count > 1:
+            page, offset = pages.location(FRAME_PTR)
+            exprs[FRAME_PAGE] = page
+            exprs[FRAME_OFFSET] = offset
+            branches = [f"{FRAME_PAGE}={i}:{pages.page(i)}" for i in range(pages.count)]
+            exprs[STACK_FRAME] = rf"\left\{{{','.join(branches)}\right\}}"
+
+        # start a frame on the next page if it does not fit on the current one
+        for info in self.function_lookup.values():
+            top = STACK_TOP
+            fits = rf"\operatorname{{mod}}\left({top},{pages.size}\right)+{FRAME_HEADER}+{info.frame_size_var}\le {pages.size}"
+            next_page = rf"{pages.size}\cdot\operatorname{{ceil}}\left(\frac{{{top}}}{{{pages.size}}}\right)+1"
+            exprs[info.frame_start_var] = rf"\left\{{{fits}:{top}+1,{next_page}\right\}}"
+        return exprs
+
+
+def compile_syntax_tree(
+    root: Statement,
+    heap_size: int = HEAP_SIZE,
+    stack_pages: StackPages | None = None,
+    eval_steps: int = EVAL_STEPS,
+    unroll_budget: int = UNROLL_BUDGET,
+):
+    return Compiler(root, heap_size, stack_pages, eval_steps, unroll_budget).generate_assembly()
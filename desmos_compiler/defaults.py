@@ -0,0 +1,15 @@
+# default options of the compiler, kept apart from it so that
+# `desmoscc` can show them without importing the whole compiler
+
+# largest number of elements in a desmos list
+MAX_LIST_LENGTH = 10000
+
+# default number of heap entries
+HEAP_SIZE = 1000
+
+# default number of statements (and list elements) the compiler
+# evaluates before it leaves the rest of a program to run in desmos
+EVAL_STEPS = 10000
+
+# number of statements loop unrolling can add to a program
+UNROLL_BUDGET = 100
@@ -0,0 +1,564 @@
+import math
+import re
+from dataclasses import dataclass
+from functools import cache
+from operator import add, mul, neg, sub
+from typing import Callable, Iterable
+
+from desmos_compiler.assembler import DONE, IN, OUT, RUN, assembly_latex
+from desmos_compiler.defaults import MAX_LIST_LENGTH
+from desmos_compiler.minify import is_name, tokenize
+
+# default number of ticks a program can run for before it is stopped
+MAX_TICKS = 100000
+
+NAN = float("nan")
+
+NUMBER = r"\d+(?:\.\d+)?|\.\d+"
+
+COMPARISONS = {
+    "=": lambda a, b: a == b,
+    "<": lambda a, b: a < b,
+    ">": lambda a, b: a > b,
+    "\\le": lambda a, b: a <= b,
+    "\\ge": lambda a, b: a >= b,
+}
+
+Value = float | list[float]
+
+# evaluates an expression, given the variables bound by the list comprehensions it is in
+Evaluate = Callable[[dict[str, Value]], Value]
+
+# finds the assignments made by an action, as (variable, value) pairs
+Act = Callable[[], list[tuple[str, Value]]]
+
+
+class EmulatorError(Exception):
+    """
+    Latex which the emulator does not understand, or which would be an error in desmos
+    """
+
+
+@cache
+def _name(token: str) -> str:
+    # a_1 is the same variable as a_{1}
+    return re.sub(r"_([a-zA-Z0-9])$", r"_{\1}", token)
+
+
+def _check_length(values: list[float]) -> list[float]:
+    if len(values) > MAX_LIST_LENGTH:
+        raise EmulatorError(f"list of {len(values)} elements is longer than {MAX_LIST_LENGTH}")
+    return values
+
+
+def _apply(f: Callable, a: Value, b: Value):
+    if isinstance(a, list) or isinstance(b, list):
+        return _elementwise(f, a, b)
+    return f(a, b)
+
+
+def _elementwise(f: Callable, *args):
+    """
+    Apply a function of numbers to each element of the lists in `args`,
+    stopping at the end of the shortest list, or to the numbers if there are no lists
+    """
+    lists = [a for a in args if isinstance(a, list)]
+    if len(lists) == 0:
+        return f(*args)
+    length = min(len(l) for l in lists)
+    return [f(*(a[i] if isinstance(a, list) else a for a in args)) for i in range(length)]
+
+
+def _divide(a: float, b: float) -> float:
+    return a / b if b != 0 else NAN
+
+
+def _mod(a: float, b: float) -> float:
+    return a - b * math.floor(a / b) if b != 0 and math.isfinite(a) else NAN
+
+
+def _rounded(f: Callable[[float], int]) -> Callable[[float], float]:
+    return lambda a: float(f(a)) if math.isfinite(a) else a
+
+
+def _range(first: float, last: float) -> list[float]:
+    if math.isnan(first) or math.isnan(last):
+        return []
+    first, last = round(first), round(last)
+    step = 1 if first <= last else -1
+    return _check_length([float(i) for i in range(first, last + step, step)])
+
+
+def _index(values: list[float], index: float) -> float:
+    if math.isnan(index):
+        return NAN
+    if index != int(index):
+        raise EmulatorError(f"list index {index} is not a whole number")
+    return values[int(index) - 1] if 1 <= index <= len(values) else NAN
+
+
+def _rest(values: list[float], first: float) -> list[float]:
+    if math.isnan(first):
+        return []
+    return values[max(round(first), 1) - 1 :]
+
+
+def _numbers(args: list[Value]) -> list[float]:
+    return [n for a in args for n in (a if isinstance(a, list) else [a])]
+
+
+def _extreme(f: Callable) -> Callable[[list[Value]], float]:
+    def apply(args: list[Value]) -> float:
+        numbers = _numbers(args)
+        return f(numbers) if len(numbers) > 0 and not any(map(math.isnan, numbers)) else NAN
+
+    return apply
+
+
+FUNCTIONS: dict[str, Callable[[list[Value]], Value]] = {
+    "\\operatorname{length}": lambda args: float(len(args[0])),
+    "\\operatorname{join}": lambda args: _check_length(_numbers(args)),
+    "\\operatorname{total}": lambda args: float(sum(_numbers(args))),
+    "\\operatorname{mod}": lambda args: _elementwise(_mod, *args),
+    "\\operatorname{floor}": lambda args: _elementwise(_rounded(math.floor), *args),
+    "\\operatorname{ceil}": lambda args: _elementwise(_rounded(math.ceil), *args),
+    "\\max": _extreme(max),
+    "\\min": _extreme(min),
+}
+
+
+class _LatexParser:
+    """
+    Turns the tokens of a desmos expression into functions which evaluate it
+    """
+
+    def __init__(self, tokens: list[str], emulator: "Emulator"):
+        self.tokens = tokens
+        self.i = 0
+        self.emulator = emulator
+
+    def peek(self) -> str | None:
+        return self.tokens[self.i] if self.i < len(self.tokens) else None
+
+    def next(self) -> str:
+        token = self.peek()
+        if token is None:
+            raise EmulatorError("unexpected end of latex")
+        self.i += 1
+        return token
+
+    def expect(self, token: str):
+        found = self.next()
+        if found != token:
+            raise EmulatorError(f'expected "{token}" but found "{found}" in {"".join(self.tokens)}')
+
+    def finish(self):
+        if self.peek() is not None:
+            raise EmulatorError(f'unexpected "{self.peek()}" in {"".join(self.tokens)}')
+
+    def expression(self) -> Evaluate:
+        result = self.product()
+        while self.peek() in ("+", "-"):
+            op, a, b = self.next(), result, self.product()
+            if op == "+":
+                result = lambda bound, a=a, b=b: _apply(add, a(bound), b(bound))
+            else:
+                result = lambda bound, a=a, b=b: _apply(sub, a(bound), b(bound))
+        return result
+
+    def product(self) -> Evaluate:
+        result = self.negation()
+        while self.peek() == "\\cdot":
+            self.next()
+            a, b = result, self.negation()
+            result = lambda bound, a=a, b=b: _apply(mul, a(bound), b(bound))
+        return result
+
+    def negation(self) -> Evaluate:
+        if self.peek() == "-":
+            self.next()
+            a = self.negation()
+            return lambda bound: _elementwise(neg, a(bound))
+        return self.indexed()
+
+    def indexed(self) -> Evaluate:
+        result = self.atom()
+        while self.peek() == "[":
+            self.next()
+            result = self.index(result)
+            self.expect("]")
+        return result
+
+    def index(self, values: Evaluate) -> Evaluate:
+        first = self.expression()
+        if self.peek() in COMPARISONS:
+            # keep the elements where a condition is true
+            condition = self.condition(first)
+
+            def keep(bound):
+                v, c = values(bound), condition(bound)
+                return [x for x, k in zip(v, c) if k] if isinstance(c, list) else (v if c else [])
+
+            return keep
+        if self.peek() == "...":
+            self.next()
+            if self.peek() == "]":
+                return lambda bound: _rest(values(bound), first(bound))
+            last = self.expression()
+
+            def elements(bound):
+                v = values(bound)
+                return [_index(v, i) for i in _range(first(bound), last(bound))]
+
+            return elements
+
+        def element(bound):
+            v, i = values(bound), first(bound)
+            if not isinstance(v, list):
+                raise EmulatorError("only lists can be indexed")
+            return [_index(v, j) for j in i] if isinstance(i, list) else _index(v, i)
+
+        return element
+
+    def condition(self, first: Evaluate) -> Callable[[dict[str, Value]], bool | list[bool]]:
+        """
+        A condition starting with the expression `first`, such as `a<b` or `a\\le b\\le c`
+        """
+        comparisons = []
+        left = first
+        while self.peek() in COMPARISONS:
+            compare = COMPARISONS[self.next()]
+            right = self.expression()
+            comparisons.append((compare, left, right))
+            left = right
+
+        if len(comparisons) == 1:
+            compare, a, b = comparisons[0]
+            return lambda bound: _apply(compare, a(bound), b(bound))
+
+        def check(bound):
+            result = True
+            for compare, a, b in comparisons:
+                c = _apply(compare, a(bound), b(bound))
+                result = _apply(lambda x, y: x and y, result, c)
+            return result
+
+        return check
+
+    def arguments(self) -> list[Evaluate]:
+        self.expect("(")
+        args = [self.expression()]
+        while self.peek() == ",":
+            self.next()
+            args.append(self.expression())
+        self.expect(")")
+        return args
+
+    def atom(self) -> Evaluate:
+        token = self.next()
+        if re.fullmatch(NUMBER, token):
+            number = float(token)
+            return lambda bound: number
+        if is_name(token):
+            name = _name(token)
+            return lambda bound: bound[name] if name in bound else self.emulator.value(name)
+        match token:
+            case "(":
+                result = self.expression()
+                self.expect(")")
+                return result
+            case "\\frac":
+                self.expect("{")
+                a = self.expression()
+                self.expect("}")
+                self.expect("{")
+                b = self.expression()
+                self.expect("}")
+                return lambda bound: _apply(_divide, a(bound), b(bound))
+            case "\\{":
+                return self.piecewise()
+            case "[":
+                return self.list_literal()
+            case _ if token in FUNCTIONS:
+                f, args = FUNCTIONS[token], self.arguments()
+                return lambda bound: f([a(bound) for a in args])
+        raise EmulatorError(f'unexpected "{token}" in {"".join(self.tokens)}')
+
+    def list_literal(self) -> Evaluate:
+        if self.peek() == "]":
+            self.next()
+            return lambda bound: []
+        first = self.expression()
+        if self.peek() == "...":
+            self.next()
+            last = self.expression()
+            self.expect("]")
+            return lambda bound: _range(first(bound), last(bound))
+        if self.peek() == "\\operatorname{for}":
+            self.next()
+            variables = []
+            while True:
+                name = _name(self.next())
+                self.expect("=")
+                variables.append((name, self.expression()))
+                if self.peek() != ",":
+                    break
+                self.next()
+            self.expect("]")
+            return lambda bound: self.comprehension(first, variables, bound)
+        elements = [first]
+        while self.peek() == ",":
+            self.next()
+            elements.append(self.expression())
+        self.expect("]")
+        return lambda bound: _check_length([self.number(e(bound)) for e in elements])
+
+    @staticmethod
+    def number(value: Value) -> float:
+        if isinstance(value, list):
+            raise EmulatorError("lists cannot contain lists")
+        return value
+
+    def comprehension(self, element: Evaluate, variables: list[tuple[str, Evaluate]], bound) -> list[float]:
+        # every combination of the elements of the lists, with the last variable changing slowest
+        combinations = [dict(bound)]
+        for name, values in variables:
+            v = values(bound)
+            combinations = [{**c, name: x} for x in (v if isinstance(v, list) else [v]) for c in combinations]
+        return _check_length([self.number(element(c)) for c in combinations])
+
+    def constant_comparison(self) -> tuple[str, float] | None:
+        """
+        The variable and the number in a condition like `L_{ine}=3:`
+        starting at the current token, or None if it is not one
+        """
+        tokens = self.tokens[self.i : self.i + 4]
+        if (
+            len(tokens) == 4
+            and is_name(tokens[0])
+            and tokens[1] == "="
+            and re.fullmatch(NUMBER, tokens[2])
+            and tokens[3] == ":"
+        ):
+            return _name(tokens[0]), float(tokens[2])
+        return None
+
+    def branches(self, value: Callable[[], object]) -> tuple[list, object, list]:
+        """
+        The conditions and values of a piecewise expression, its default value (or None)
+        and the `constant_comparison` of each condition. `value` parses the value of a choice.
+        """
+        branches = []
+        default = None
+        comparisons = []
+        while True:
+            start = self.i
+            comparison = self.constant_comparison()
+            try:
+                first = self.expression()
+                is_condition = self.peek() in COMPARISONS
+            except EmulatorError:
+                is_condition = False
+            if is_condition:
+                comparisons.append(comparison)
+                condition = self.condition(first)
+                if self.peek() == ":":
+                    self.next()
+                    branches.append((condition, value()))
+                else:
+                    branches.append((condition, None))
+            else:
+                self.i = start
+                default = value()
+            if self.peek() != ",":
+                break
+            self.next()
+        self.expect("\\}")
+        return branches, default, comparisons
+
+    def piecewise(self) -> Evaluate:
+        branches, default, _ = self.branches(self.expression)
+        branches = [(c, v if v is not None else lambda bound: 1.0) for c, v in branches]
+
+        def choose(bound):
+            for k, (condition, value) in enumerate(branches):
+                c = condition(bound)
+                if isinstance(c, list):
+                    return choose_elements(bound, k)
+                if c:
+                    return value(bound)
+            return default(bound) if default is not None else NAN
+
+        def choose_elements(bound, start):
+            conditions = [condition(bound) for condition, _ in branches[start:]]
+            values = [value(bound) for _, value in branches[start:]]
+            otherwise = default(bound) if default is not None else NAN
+
+            def pick(*args):
+                for c, v in zip(args[: len(conditions)], args[len(conditions) : -1]):
+                    if c:
+                        return v
+                return args[-1]
+
+            return _elementwise(pick, *conditions, *values, otherwise)
+
+        return choose
+
+    def actions(self) -> Act:
+        actions = [self.action()]
+        while self.peek() == ",":
+            self.next()
+            actions.append(self.action())
+        return lambda: [a for act in actions for a in act()]
+
+    def action(self) -> Act:
+        token = self.next()
+        if token == "(":
+            result = self.actions()
+            self.expect(")")
+            return result
+        if token == "\\{":
+            branches, default, comparisons = self.branches(self.action)
+            if None not in comparisons and len({name for name, _ in comparisons}) == 1:
+                # the action for the value of a variable (such as the line register) is looked up
+                # directly instead of checking every condition
+                name = comparisons[0][0]
+                acts = {}
+                for (_, number), (_, act) in zip(comparisons, branches):
+                    acts.setdefault(number, act)
+                otherwise = default if default is not None else lambda: []
+
+                def look_up():
+                    value = self.emulator.value(name)
+                    if isinstance(value, list):
+                        raise EmulatorError("the condition of an action must be a number")
+                    return acts.get(value, otherwise)()
+
+                return look_up
+
+            def choose():
+                for condition, act in branches:
+                    c = condition({})
+                    if isinstance(c, list):
+                        raise EmulatorError("the condition of an action must be a number")
+                    if c:
+                        return act()
+                return default() if default is not None else []
+
+            return choose
+        if not is_name(token):
+            raise EmulatorError(f'unexpected "{token}" in {"".join(self.tokens)}')
+        name = _name(token)
+        if self.peek() != "\\to":
+            # an action defined by another expression
+            return lambda: self.emulator.action(name)()
+        self.next()
+        value = self.expression()
+        return lambda: [(name, value({}))]
+
+
+class Emulator:
+    """
+    Runs the expressions of a program in Desmos assembly without a browser,
+    the same way the run action does when it is clicked in desmos
+    """
+
+    def __init__(self, latex: Iterable[str]):
+        # variables which are set by actions
+        self.variables: dict[str, Value] = {}
+        # expressions which depend on other variables, and their values in the current tick
+        self.derived: dict[str, Evaluate] = {}
+        self.derived_values: dict[str, Value] = {}
+        self.actions: dict[str, Act] = {}
+        # name defined by each expression, in order
+        self.definitions: list[str] = []
+
+        for expr in latex:
+            tokens = tokenize(expr)
+            if len(tokens) < 2 or not is_name(tokens[0]) or tokens[1] != "=":
+                raise EmulatorError(f"expected a definition: {expr}")
+            name = _name(tokens[0])
+            self.definitions.append(name)
+            parser = _LatexParser(tokens[2:], self)
+            if "\\to" in tokens or any(_name(t) in self.actions for t in tokens[2:] if is_name(t)):
+                self.actions[name] = parser.actions()
+            elif any(is_name(t) for t in tokens[2:]):
+                self.derived[name] = parser.expression()
+            else:
+                self.variables[name] = parser.expression()({})
+            parser.finish()
+
+    def value(self, name: str) -> Value:
+        if name in self.variables:
+            return self.variables[name]
+        if name not in self.derived_values:
+            if name not in self.derived:
+                raise EmulatorError(f"{name} is not defined")
+            self.derived_values[name] = self.derived[name]({})
+        return self.derived_values[name]
+
+    def action(self, name: str) -> Act:
+        if name not in self.actions:
+            raise EmulatorError(f"{name} is not an action")
+        return self.actions[name]
+
+    def tick(self):
+        """
+        Run the run action once. Every assignment uses the values from before the tick.
+        """
+        assignments = self.action(RUN)()
+        names = [name for name, _ in assignments]
+        if len(set(names)) < len(names):
+            raise EmulatorError(f"a variable is assigned twice in one tick: {names}")
+        for name, value in assignments:
+            if name not in self.variables:
+                raise EmulatorError(f"{name} cannot be assigned by an action")
+            self.variables[name] = value
+        self.derived_values.clear()
+
+
+@dataclass
+class EmulatorOutput:
+    """
+    output -- output of the program
+    exit_code -- exit code of the program (0 for success)
+    ticks -- number of times the run action was clicked
+    """
+
+    output: Value
+    exit_code: float
+    ticks: int
+
+
+def run_latex(
+    latex: Iterable[str], program_input: float | None = 0, max_ticks: int = MAX_TICKS
+) -> EmulatorOutput:
+    """
+    Run the desmos expressions of a program until it exits, with
+    the input already in the latex if `program_input` is None
+    """
+    emulator = Emulator(latex)
+    if program_input is not None:
+        emulator.variables[IN] = float(program_input)
+    ticks = 0
+    while emulator.value(DONE) < 0:
+        if ticks == max_ticks:
+            raise EmulatorError(f"the program did not exit within {max_ticks} ticks")
+        emulator.tick()
+        ticks += 1
+    return EmulatorOutput(emulator.value(OUT), emulator.value(DONE), ticks)
+
+
+def run_assembly(
+    program: str,
+    program_input: float = 0,
+    max_ticks: int = MAX_TICKS,
+    minified: bool = False,
+    block_size: int | None = None,
+) -> EmulatorOutput:
+    """
+    Run a program written in Desmos assembly, assembled with the
+    same arguments as `write_assembly`, until it exits
+    """
+    latex = ("".join(parts) for _, parts in assembly_latex(program, minified, block_size))
+    return run_latex(latex, program_input, max_ticks)
@@ -0,0 +1,726 @@
+import math
+from dataclasses import dataclass
+from decimal import Decimal
+
+from desmos_compiler.defaults import EVAL_STEPS, HEAP_SIZE
+from desmos_compiler.syntax_tree import (
+    Alloc,
+    ArrayType,
+    Assignment,
+    BinaryOperation,
+    Comprehension,
+    Declaration,
+    DesmosType,
+    Expression,
+    Free,
+    FunctionCall,
+    FunctionCallStatement,
+    FunctionDefinition,
+    FunctionReturn,
+    Group,
+    If,
+    Index,
+    IndexAssignment,
+    Length,
+    ListLiteral,
+    ListOperator,
+    Literal,
+    Operator,
+    Range,
+    Reduction,
+    Slice,
+    Statement,
+    UnaryOperation,
+    Variable,
+    While,
+    contains_call,
+    walk,
+)
+
+NUM = DesmosType("num")
+POINTER = DesmosType("ptr")
+
+# value of a variable which is only known at runtime (the input)
+UNKNOWN = None
+
+# exit code when there is no room on the heap for a new block
+OUT_OF_MEMORY = 1
+
+Value = float | list[float] | None
+
+
+class EvaluationError(Exception):
+    """
+    A program cannot be evaluated any further at compile time, because it uses
+    the input or the heap, runs out of steps, or does something which does not compile
+    """
+
+
+class ProgramExit(Exception):
+    """
+    A program stops before it ends, with an exit code other than 0
+    """
+
+    def __init__(self, exit_code: int):
+        super().__init__(f"The program exits with code {exit_code}")
+        self.exit_code = exit_code
+
+
+def apply_operator(op: Operator, a: float, b: float) -> float | None:
+    """
+    Result of a binary operation on numbers in desmos, or None if it is undefined
+    """
+    match op:
+        case Operator.MULT:
+            result = a * b
+        case Operator.DIV:
+            result = a / b if b != 0 else math.nan
+        case Operator.MOD:
+            # the result has the sign of `b` in python and desmos
+            result = a % b if b != 0 else math.nan
+        case Operator.ADD:
+            result = a + b
+        case Operator.SUB:
+            result = a - b
+        case Operator.EQ:
+            result = float(a == b)
+        case Operator.NE:
+            result = float(a != b)
+        case Operator.LT:
+            result = float(a < b)
+        case Operator.GT:
+            result = float(a > b)
+        case Operator.LE:
+            result = float(a <= b)
+        case Operator.GE:
+            result = float(a >= b)
+        case Operator.AND:
+            result = float(a == 1 and b == 1)
+        case Operator.OR:
+            result = float(a == 1 or b == 1)
+    return result if math.isfinite(result) else None
+
+
+def apply_unary_operator(op: Operator, a: float) -> float:
+    """
+    Result of a unary operation on a number in desmos
+    """
+    return float(a != 1) if op == Operator.NOT else -a
+
+
+def number_literal(value: float) -> Literal:
+    """
+    Literal for a number, written out in full since desmos reads `e` as a constant
+    """
+    if value.is_integer():
+        return Literal(str(int(value)))
+    return Literal(format(Decimal(repr(value)), "f"))
+
+
+def sizeof(var_type: DesmosType) -> int:
+    return var_type.size if isinstance(var_type, ArrayType) else 1
+
+
+def _zero(var_type: DesmosType) -> float | list[float]:
+    return [0.0] * var_type.size if isinstance(var_type, ArrayType) else 0.0
+
+
+def _integer(value: float) -> int:
+    if not float(value).is_integer():
+        raise EvaluationError(f"{value} is not a whole number")
+    return int(value)
+
+
+def heap_size_classes(heap_size: int) -> list[int]:
+    """
+    Number of elements in a block of each size class: the powers of two
+    smaller than the heap size, and a class with room for the whole heap.
+    """
+    sizes = [1]
+    while sizes[-1] * 2 < heap_size:
+        sizes.append(sizes[-1] * 2)
+    if sizes[-1] < heap_size:
+        sizes.append(heap_size)
+    return sizes
+
+
+def _flatten(statement: Statement) -> list[Statement]:
+    if isinstance(statement, Group):
+        return [s for inner in statement.statements for s in _flatten(inner)]
+    return [statement]
+
+
+def frame_bound(statement: Statement) -> int:
+    """
+    More than the number of stack entries a function or the main program uses
+    at once, including the entries the compiler uses to keep values across calls
+    """
+    return sum(sizeof(n.type) if isinstance(n, Declaration) else 1 for n in walk(statement))
+
+
+class _Scope:
+    """
+    Variables declared in a block.
+
+    Every time a declaration runs it sets the variable to 0, so the variables
+    of a block inside a loop start at 0 in each iteration.
+    """
+
+    def __init__(self):
+        self.values: dict[str, Value] = {}
+        self.types: dict[str, DesmosType] = {}
+        self.declared: set[str] = set()
+        self.parent: _Scope | None = None
+        self.blocks: dict[int, _Scope] = {}
+
+    def block(self, statement: Statement) -> "_Scope":
+        """
+        Scope of a block inside this one, which starts without any declared variables
+        """
+        # blocks are found by identity because equal blocks in different places have their own variables
+        scope = self.blocks.get(id(statement))
+        if scope is None:
+            scope = _Scope()
+            scope.parent = self
+            self.blocks[id(statement)] = scope
+        scope.declared = set()
+        return scope
+
+    def declare(self, var: Variable, var_type: DesmosType):
+        if var.name in self.declared:
+            raise EvaluationError(f"Variable {var} is already declared")
+        self.declared.add(var.name)
+        self.types[var.name] = var_type
+        self.values[var.name] = _zero(var_type)
+
+
+class _Heap:
+    """
+    Heap memory laid out the same way as in the compiled program (see `Compiler.alloc_asm`),
+    so blocks are reused in the same order and their elements are not cleared.
+    """
+
+    def __init__(self, size: int):
+        self.sizes = heap_size_classes(size)
+        # entry i is entry i of the heap list in desmos, so entry 0 is never used
+        self.entries = [0.0] * (size + 2)
+        # first free block of each size class
+        self.free = [0] * len(self.sizes)
+        # index of the last entry given to a block
+        self.top = 0
+        # number of elements of each block which has not been freed
+        self.blocks: dict[int, int] = {}
+
+    def alloc(self, size: float) -> float:
+        size_class = len([i for i in self.sizes if i < size])
+        if size_class == len(self.sizes):
+            raise ProgramExit(OUT_OF_MEMORY)
+        pointer = self.free[size_class]
+        if pointer > 0:
+            self.free[size_class] = int(self.entries[pointer])
+        else:
+            pointer = self.top + 2
+            if self.top + self.sizes[size_class] + 1 >= len(self.entries):
+                raise ProgramExit(OUT_OF_MEMORY)
+            self.top += self.sizes[size_class] + 1
+        self.entries[pointer - 1] = float(size_class)
+        self.blocks[pointer] = self.sizes[size_class]
+        return float(pointer)
+
+    def free_block(self, pointer: float):
+        block = self.block(pointer)
+        size_class = int(self.entries[block - 1])
+        self.entries[block] = float(self.free[size_class])
+        self.free[size_class] = block
+        del self.blocks[block]
+
+    def block(self, pointer: float) -> int:
+        """
+        Index of the first entry of the block `pointer` points to
+        """
+        if pointer not in self.blocks:
+            raise EvaluationError(f"{pointer:g} is not a pointer to a block on the heap")
+        return int(pointer)
+
+
+class Evaluator:
+    """
+    Run programs at compile time with the same results as the compiled program in desmos.
+
+    Any statement which the compiler would reject or which uses something only known
+    at runtime raises `EvaluationError` instead of running.
+    """
+
+    def __init__(
+        self,
+        root: Statement,
+        steps: int = EVAL_STEPS,
+        program_input: float | None = UNKNOWN,
+        list_length: int | None = None,
+        stack_size: int | None = None,
+        page_count: int = 1,
+        heap_size: int | None = None,
+    ):
+        """
+        Arguments:
+        root -- the program
+        steps -- number of statements and list elements to evaluate before giving up
+        program_input -- value of IN, or UNKNOWN if it is only known at runtime
+        list_length -- largest number of elements in a list, or None if there is no limit
+        stack_size -- number of stack entries, or None if calls never overflow the stack
+        page_count -- number of pages the stack is split into
+        heap_size -- number of heap entries, or None if the heap is only used at runtime
+        """
+        self.steps = steps
+        self.list_length = list_length
+        self.statements = _flatten(root)
+        self.heap = _Heap(heap_size) if heap_size is not None else None
+
+        self.globals = _Scope()
+        self.globals.declare(Variable("IN"), NUM)
+        self.globals.declare(Variable("OUT"), NUM)
+        # inputs can be ints, but every value in the program is a float
+        self.globals.values["IN"] = program_input if program_input is UNKNOWN else float(program_input)
+        # functions can use every global variable, wherever it is declared
+        self.global_types = {
+            s.var.name: s.type for s in self.statements if isinstance(s, Declaration)
+        }
+        self.global_types.update(self.globals.types)
+
+        self.functions: dict[str, FunctionDefinition] = {}
+        # function being evaluated (None for the main program)
+        self.function: Variable | None = None
+        # values of the variables of list comprehensions being evaluated
+        self.bound: dict[str, float] = {}
+
+        # each call also saves the line to return to and the frame pointer of the caller
+        self.frame_bounds = {
+            n.name.name: 2 + len(n.params) + frame_bound(n.body)
+            for n in walk(root)
+            if isinstance(n, FunctionDefinition)
+        }
+        self.stack_free = None
+        if stack_size is not None:
+            # a frame never crosses the end of a page, which wastes less than a frame per page
+            largest = max(self.frame_bounds.values(), default=0)
+            self.stack_free = stack_size - page_count * largest - frame_bound(root)
+
+        # variables after the last statement or loop iteration the rest of the program can start from
+        self.safe = self.save()
+
+    def step(self, count: int = 1):
+        self.steps -= count
+        if self.steps < 0:
+            raise EvaluationError("Ran out of steps")
+
+    def save(self) -> tuple:
+        scope = self.globals
+        values = {k: list(v) if isinstance(v, list) else v for k, v in scope.values.items()}
+        return values, set(scope.declared), dict(scope.types), dict(self.functions)
+
+    def restore(self, saved: tuple):
+        values, declared, types, functions = saved
+        self.globals.values = values
+        self.globals.declared = declared
+        self.globals.types = types
+        self.globals.blocks = {}
+        self.functions = functions
+
+    def _scope_of(self, var: Variable, scope: _Scope) -> _Scope:
+        """
+        Scope in which a variable is declared
+        """
+        s = scope
+        while s is not None:
+            if var.name in s.declared:
+                return s
+            s = s.parent
+        if self.function is not None and var.name in self.global_types:
+            return self.globals
+        raise EvaluationError(f"Variable {var} is not in scope")
+
+    def _type(self, var: Variable, scope: _Scope) -> DesmosType:
+        s = self._scope_of(var, scope)
+        return s.types.get(var.name, self.global_types.get(var.name))
+
+    def _load(self, var: Variable, scope: _Scope) -> Value:
+        s = self._scope_of(var, scope)
+        if var.name not in s.values:
+            return _zero(self._type(var, scope))
+        return s.values[var.name]
+
+    def _store(self, var: Variable, scope: _Scope, value: float | list[float]):
+        s = self._scope_of(var, scope)
+        if s is self.globals and var.name not in s.declared:
+            # the value could not be given to the variable before the rest of the program
+            raise EvaluationError(f"Variable {var} is assigned before it is declared")
+        s.values[var.name] = value
+
+    def _array_type(self, var: Variable, scope: _Scope) -> ArrayType:
+        var_type = self._type(var, scope)
+        if not isinstance(var_type, ArrayType):
+            raise EvaluationError(f"{var} is not an array")
+        return var_type
+
+    def _heap(self) -> _Heap:
+        if self.heap is None:
+            raise EvaluationError("Heap memory is only used at runtime")
+        return self.heap
+
+    def _elements(self, var: Variable, scope: _Scope) -> tuple[list[float], int, int]:
+        """
+        The list holding the elements of an array or of the block a pointer points to,
+        the index in it of the first element, and the number of elements
+        """
+        if self._type(var, scope) == POINTER:
+            heap = self._heap()
+            first = heap.block(self.eval_expression(var, scope))
+            return heap.entries, first, heap.blocks[first]
+        return self._load(var, scope), 0, self._array_type(var, scope).size
+
+    def _set_elements(self, var: Variable, scope: _Scope, first: int, values: list[float]):
+        """
+        Set the elements of an array or block from index `first` to `values`
+        """
+        elements, start, size = self._elements(var, scope)
+        if first < 0 or first + len(values) > size:
+            raise EvaluationError(f"Elements {first} to {first + len(values)} are outside of {var}")
+        if self._type(var, scope) == POINTER:
+            elements[start + first : start + first + len(values)] = values
+        else:
+            elements = list(elements)
+            elements[first : first + len(values)] = values
+            self._store(var, scope, elements)
+
+    def _is_list(self, expr: Expression, scope: _Scope) -> bool:
+        match expr:
+            case Variable(name):
+                return name not in self.bound and isinstance(self._type(expr, scope), ArrayType)
+            case Slice(_, _, _) | Range(_, _) | Comprehension(_, _, _, _) | ListLiteral(_):
+                return True
+            case _:
+                return False
+
+    def eval_expression(self, expr: Expression, scope: _Scope) -> float:
+        """
+        Evaluate an expression which is a number
+        """
+        match expr:
+            case Literal(val):
+                try:
+                    return float(val)
+                except ValueError:
+                    raise EvaluationError(f"{val} is not a number")
+            case Variable(name) if name in self.bound:
+                return self.bound[name]
+            case Variable(name):
+                value = self._load(expr, scope)
+                if isinstance(value, list):
+                    raise EvaluationError(f"Array {name} cannot be used as a number")
+                if value is UNKNOWN:
+                    raise EvaluationError(f"{name} is only known at runtime")
+                return value
+            case Index(array, index):
+                i = _integer(self.eval_expression(index, scope))
+                elements, first, size = self._elements(array, scope)
+                if not 0 <= i < size:
+                    raise EvaluationError(f"Index {i} is outside of {array}")
+                return elements[first + i]
+            case Slice(_, _, _) | Range(_, _) | Comprehension(_, _, _, _) | ListLiteral(_):
+                raise EvaluationError(f"List {expr} cannot be used as a number")
+            case Length(Variable(name) as array) if name not in self.bound:
+                return float(self._array_type(array, scope).size)
+            case Length(arg):
+                return float(len(self.eval_list_expression(arg, scope)))
+            case Alloc(size):
+                return self._heap().alloc(self.eval_expression(size, scope))
+            case Reduction(op, arg):
+                values = self.eval_list_expression(arg, scope)
+                if op == ListOperator.SUM:
+                    return float(sum(values))
+                if len(values) == 0:
+                    raise EvaluationError(f"{op.value} of an empty list is undefined")
+                return min(values) if op == ListOperator.MIN else max(values)
+            case BinaryOperation(arg1, arg2, Operator.AND | Operator.OR as op):
+                # the second argument is only evaluated if it changes the result
+                a = self.eval_expression(arg1, scope)
+                if (a == 1) == (op == Operator.OR):
+                    return float(a == 1)
+                return float(self.eval_expression(arg2, scope) == 1)
+            case BinaryOperation(arg1, arg2, op):
+                a = self.eval_expression(arg1, scope)
+                b = self.eval_expression(arg2, scope)
+                result = apply_operator(op, a, b)
+                if result is None:
+                    raise EvaluationError(f"{expr} is undefined")
+                return result
+            case UnaryOperation(arg, op):
+                return apply_unary_operator(op, self.eval_expression(arg, scope))
+            case FunctionCall(_, _):
+                return self.call(expr, scope)
+            case _:
+                raise EvaluationError(f"Unknown expression type {type(expr)} ({expr})")
+
+    def eval_list_expression(self, expr: Expression, scope: _Scope) -> list[float]:
+        """
+        Evaluate an expression which is a list
+        """
+        match expr:
+            case Variable(_) if self._is_list(expr, scope):
+                return list(self._load(expr, scope))
+            case Slice(array, start, end):
+                first = _integer(self.eval_expression(start, scope))
+                last = _integer(self.eval_expression(end, scope)) - 1
+                elements, offset, size = self._elements(array, scope)
+                if first > last:
+                    if isinstance(start, Literal) and isinstance(end, Literal):
+                        # the compiled list counts down instead
+                        raise EvaluationError(f"{expr} is not a valid slice")
+                    return []
+                if first < 0 or last >= size:
+                    raise EvaluationError(f"{expr} is outside of {array}")
+                return elements[offset + first : offset + last + 1]
+            case Range(start, end):
+                first = self.eval_expression(start, scope)
+                end_value = self.eval_expression(end, scope)
+                if end_value <= first:
+                    return []
+                count = math.ceil(end_value - first)
+                if self.list_length is not None and count > self.list_length:
+                    raise EvaluationError(f"{expr} is too long")
+                self.step(count)
+                return [first + i for i in range(count)]
+            case Comprehension(element, var, source, condition):
+                if contains_call(element) or (condition is not None and contains_call(condition)):
+                    raise EvaluationError(f"Function calls cannot be used for each element of a list ({expr})")
+                values = self.eval_list_expression(source, scope)
+                self.step(len(values))
+                outer_bound = self.bound
+                result = []
+                try:
+                    for value in values:
+                        self.bound = {**outer_bound, var.name: value}
+                        if condition is None or self.eval_expression(condition, scope) == 1:
+                            result.append(self.eval_expression(element, scope))
+                finally:
+                    self.bound = outer_bound
+                return result
+            case ListLiteral(values):
+                return [self.eval_expression(v, scope) for v in values]
+            case _:
+                raise EvaluationError(f"{expr} is not a list")
+
+    def call(self, call: FunctionCall, scope: _Scope) -> float:
+        name, args = call.name, call.args
+        if name.name not in self.functions:
+            raise EvaluationError(f"Function {name} is not defined")
+        definition = self.functions[name.name]
+        if len(args) != len(definition.params):
+            raise EvaluationError(f"Function {name} expected to have {len(definition.params)} arguments")
+
+        values = []
+        for arg, param in zip(args, definition.params):
+            if sizeof(param.type) > 1:
+                raise EvaluationError("Variables with size > 1 not yet supported")
+            values.append(self.eval_expression(arg, scope))
+
+        frame = _Scope()
+        for param, value in zip(definition.params, values):
+            frame.declare(param.var, param.type)
+            frame.values[param.var.name] = value
+
+        size = self.frame_bounds[name.name]
+        if self.stack_free is not None and self.stack_free < size:
+            raise EvaluationError(f"Call to {name} could overflow the stack")
+
+        outer = self.function, self.bound
+        self.function, self.bound = name, {}
+        if self.stack_free is not None:
+            self.stack_free -= size
+        try:
+            result = self.execute(definition.body, frame)
+        finally:
+            self.function, self.bound = outer
+            if self.stack_free is not None:
+                self.stack_free += size
+        if result is None:
+            raise EvaluationError(f"Function {name} ends without returning")
+        return result
+
+    def _assign_elements(
+        self, array: Variable, first: int, end: int, val: Expression, scope: _Scope
+    ):
+        """
+        Set the elements of an array or block from `first` up to but not including `end`
+        to a number or to the elements of a list
+        """
+        if self._is_list(val, scope):
+            values = self.eval_list_expression(val, scope)
+        else:
+            values = [self.eval_expression(val, scope)] * max(end - first, 0)
+        if first >= end:
+            return
+        if len(values) < end - first:
+            raise EvaluationError(f"{val} has fewer than {end - first} elements")
+        self._set_elements(array, scope, first, values[: end - first])
+
+    def execute(self, statement: Statement, scope: _Scope) -> float | None:
+        """
+        Run a statement, returning the return value if it returns from a function
+        """
+        self.step()
+        match statement:
+            case Group(statements):
+                for s in statements:
+                    result = self.execute(s, scope)
+                    if result is not None:
+                        return result
+
+            case Declaration(var, var_type):
+                if isinstance(var_type, ArrayType) and var_type.size < 1:
+                    raise EvaluationError(f"Array {var} must have at least one element")
+                scope.declare(var, var_type)
+
+            case Assignment(var, val):
+                var_type = self._type(var, scope)
+                if isinstance(var_type, ArrayType):
+                    self._assign_elements(var, 0, var_type.size, val, scope)
+                else:
+                    self._store(var, scope, self.eval_expression(val, scope))
+
+            case IndexAssignment(Index(array, index), val):
+                i = _integer(self.eval_expression(index, scope))
+                self._set_elements(array, scope, i, [self.eval_expression(val, scope)])
+
+            case IndexAssignment(Slice(array, start, end), val):
+                self._elements(array, scope)
+                first = _integer(self.eval_expression(start, scope))
+                end_index = _integer(self.eval_expression(end, scope))
+                self._assign_elements(array, first, end_index, val, scope)
+
+            case If(condition, contents, _else):
+                branch = contents if self.eval_expression(condition, scope) == 1 else _else
+                if branch is not None:
+                    return self.execute(branch, scope.block(branch))
+
+            case While(condition, contents):
+                while self.eval_expression(condition, scope) == 1:
+                    result = self.execute(contents, scope.block(contents))
+                    if result is not None:
+                        return result
+                    if scope is self.globals:
+                        # the rest of the program can start from the next iteration,
+                        # since the declarations in the loop body set its variables to 0
+                        self.safe = self.save()
+
+            case FunctionDefinition(name, _, _, _):
+                if scope is not self.globals:
+                    raise EvaluationError(f"Function {name} is not in the global scope")
+                if name.name in self.functions:
+                    raise EvaluationError(f"Function {name} is already defined")
+                self.functions[name.name] = statement
+
+            case FunctionReturn(expr):
+                if self.function is None:
+                    raise EvaluationError("Return statements must be inside functions")
+                return self.eval_expression(expr, scope)
+
+            case FunctionCallStatement(call):
+                self.eval_expression(call, scope)
+
+            case Free(pointer):
+                self._heap().free_block(self.eval_expression(pointer, scope))
+
+            case _:
+                raise EvaluationError(f"Unknown statement type {type(statement)}")
+        return None
+
+    def run(self) -> int:
+        """
+        Run as many statements of the main program as possible.
+
+        Afterwards the variables are the ones from after the last statement which
+        ran completely, or from after an iteration of a loop in the main program
+        if the program cannot continue past it.
+        Returns the number of statements which ran.
+        """
+        for i, statement in enumerate(self.statements):
+            self.safe = self.save()
+            try:
+                self.execute(statement, self.globals)
+            except (EvaluationError, RecursionError):
+                self.restore(self.safe)
+                return i
+        return len(self.statements)
+
+    def state(self) -> list[Statement]:
+        """
+        Statements which give the global variables their current values,
+        assuming every variable starts at 0
+        """
+        statements = []
+        names = [s.var.name for s in self.statements if isinstance(s, Declaration)]
+        for name in ["IN", "OUT"] + names:
+            if name not in self.globals.declared:
+                continue
+            value = self.globals.values[name]
+            var = Variable(name)
+            if isinstance(value, list):
+                if any(v != 0 for v in value):
+                    statements.append(Assignment(var, ListLiteral([number_literal(v) for v in value])))
+            elif value is not UNKNOWN and (value != 0 or name == "IN"):
+                statements.append(Assignment(var, number_literal(value)))
+        return statements
+
+
+@dataclass
+class PartialEvaluation:
+    """
+    residual -- a program which does the same as the original, starting from
+                the variables after the statements which ran at compile time
+    output -- the output if the whole program ran at compile time
+    """
+
+    residual: Statement
+    output: float | None = None
+
+
+def evaluate(
+    root: Statement, program_input: float, steps: int = EVAL_STEPS, heap_size: int = HEAP_SIZE
+) -> float:
+    """
+    Run a whole program and return its output, raising `ProgramExit` if it
+    stops early because there is no room on the heap
+    """
+    evaluator = Evaluator(root, steps, program_input, heap_size=heap_size)
+    for statement in evaluator.statements:
+        evaluator.execute(statement, evaluator.globals)
+    return evaluator.globals.values["OUT"]
+
+
+def partial_evaluate(
+    root: Statement,
+    steps: int = EVAL_STEPS,
+    list_length: int | None = None,
+    stack_size: int | None = None,
+    page_count: int = 1,
+) -> PartialEvaluation:
+    """
+    Run the start of a program which does not depend on the input at compile time.
+
+    The residual program declares the functions and global variables of the
+    statements which ran, assigns the variables their values, and continues with
+    the rest of the program. See `Evaluator` for the arguments.
+    """
+    evaluator = Evaluator(root, steps, UNKNOWN, list_length, stack_size, page_count)
+    done = evaluator.run()
+    if done == len(evaluator.statements):
+        return PartialEvaluation(root, evaluator.globals.values["OUT"])
+
+    state = evaluator.state()
+    if done == 0 and len(state) == 0:
+        return PartialEvaluation(root)
+    ran = evaluator.statements[:done]
+    functions = [s for s in ran if isinstance(s, FunctionDefinition)]
+    declarations = [s for s in ran if isinstance(s, Declaration)]
+    return PartialEvaluation(Group(functions + declarations + state + evaluator.statements[done:]))
@@ -0,0 +1,531 @@
+import argparse
+import math
+import os
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from itertools import count
+from time import perf_counter
+from typing import Callable, Iterator
+
+from desmos_compiler.compiler import STACK_OVERFLOW, StackPages, compile_syntax_tree
+from desmos_compiler.defaults import EVAL_STEPS, MAX_LIST_LENGTH, UNROLL_BUDGET
+from desmos_compiler.emulator import run_assembly
+from desmos_compiler.evaluator import EvaluationError, ProgramExit, evaluate
+from desmos_compiler.parser import parse
+from desmos_compiler.syntax_tree import (
+    BinaryOperation,
+    Expression,
+    Group,
+    If,
+    Literal,
+    Node,
+    Statement,
+    UnaryOperation,
+    Variable,
+    While,
+)
+
+# number of statements the interpreter runs before a program is skipped for taking too long
+FUZZ_STEPS = 3000
+
+# number of ticks the compiled program can take, which is more than
+# enough for the statements the interpreter runs
+FUZZ_TICKS = 200000
+
+LITERALS = ["0", "1", "2", "3", "5", "7", "10", "-1", "-2", "0.5"]
+BINARY_OPERATORS = ["+", "-", "*", "+", "-", "*", "/", "%", "==", "!=", "<", ">", "<=", ">=", "&&", "||"]
+
+# size of the global array used by generated programs
+ARRAY_SIZE = 4
+
+# number of heap entries, which is small so that some programs run out of memory
+FUZZ_HEAP_SIZE = 64
+
+
+class ProgramGenerator:
+    """
+    Writes random programs which use most of the language.
+
+    The programs are always valid: variables are declared before they are used,
+    functions only call functions defined before them (or recurse towards a
+    base case), loops count up to a small number and nothing divides by zero.
+    Pointers are only used inside the blocks they point to, although the
+    elements of a block are sometimes read before they are set.
+    """
+
+    def __init__(self, seed: int):
+        self.random = random.Random(seed)
+        self.names = count()
+        self.array: str | None = None
+        # name of the global pointer and the size of its block
+        self.pointer: tuple[str, int] | None = None
+
+    def name(self, prefix: str) -> str:
+        return f"{prefix}{next(self.names)}"
+
+    def expression(self, variables: list[str], functions: list[tuple[str, int]], depth: int) -> str:
+        r = self.random
+        choice = r.random()
+        if depth <= 0 or choice < 0.3:
+            if len(variables) > 0 and r.random() < 0.6:
+                return r.choice(variables)
+            return r.choice(LITERALS)
+        if len(functions) > 0 and choice < 0.45:
+            name, params = r.choice(functions)
+            args = [self.expression(variables, functions, depth - 1) for _ in range(params)]
+            return f"{name}({', '.join(args)})"
+        if self.array is not None and choice < 0.5:
+            return r.choice(
+                [
+                    f"{self.array}[{r.randrange(ARRAY_SIZE)}]",
+                    f"sum({self.array})",
+                    f"max({self.array})",
+                    f"len({self.array})",
+                ]
+            )
+        if choice < 0.55:
+            return f"{r.choice(['!', '-'])}({self.expression(variables, functions, depth - 1)})"
+        if self.pointer is not None and choice < 0.6:
+            pointer, size = self.pointer
+            return r.choice([f"{pointer}[{r.randrange(size)}]", f"sum({pointer}[0:{size}])"])
+        op = r.choice(BINARY_OPERATORS)
+        a = self.expression(variables, functions, depth - 1)
+        b = self.expression(variables, functions, depth - 1)
+        if op == "%":
+            b = r.choice(["2", "3", "5", "7"])
+        elif op == "/":
+            b = r.choice(["2", "4", "-5"])
+        return f"({a} {op} {b})"
+
+    def block(
+        self,
+        variables: list[str],
+        functions: list[tuple[str, int]],
+        depth: int,
+        in_function: bool,
+        loops: int,
+    ) -> str:
+        """
+        Statements which can use `variables` and call `functions`, with `depth` levels of
+        nested if and switch statements, and `loops` levels of nested loops
+        """
+        r = self.random
+        variables = list(variables)
+        assignable = [v for v in variables if v != "IN"]
+        statements = []
+        for _ in range(r.randint(1, 4)):
+            choice = r.random()
+            if choice < 0.2:
+                name = self.name("v")
+                statements.append(f"num {name};")
+                initializer = r.random()
+                if initializer < 0.5:
+                    statements.append(f"{name} = {self.expression(variables, functions, 2)};")
+                elif initializer < 0.75:
+                    # read the value the declaration gave the variable
+                    statements.append(f"{name} = {name} + {self.expression(variables, functions, 2)};")
+                else:
+                    statements.append(f"OUT = OUT + {name} * {r.choice(['2', '3', '10'])};")
+                variables.append(name)
+                assignable.append(name)
+            elif choice < 0.4 and len(assignable) > 0:
+                statements.append(f"{r.choice(assignable)} = {self.expression(variables, functions, 3)};")
+            elif choice < 0.5 and depth > 0:
+                condition = self.expression(variables, functions, 2)
+                contents = self.block(variables, functions, depth - 1, in_function, loops)
+                statement = f"if ({condition}){{\n{contents}\n}}"
+                if r.random() < 0.5:
+                    statement += f" else {{\n{self.block(variables, functions, depth - 1, in_function, loops)}\n}}"
+                statements.append(statement)
+            elif choice < 0.57 and depth > 0:
+                value = self.expression(variables, functions, 2)
+                numbers = r.sample(range(-2, 8), r.randint(1, 5))
+                cases = ""
+                for n in numbers:
+                    values = str(n) if r.random() < 0.7 else f"{n}, {n + 10}"
+                    cases += f"case {values}:\n{self.block(variables, functions, depth - 1, in_function, loops)}\n"
+                if r.random() < 0.6:
+                    cases += f"default:\n{self.block(variables, functions, depth - 1, in_function, loops)}\n"
+                statements.append(f"switch ({value}){{\n{cases}}}")
+            elif choice < 0.67 and loops > 0:
+                counter = self.name("c")
+                contents = self.block(variables + [counter], functions, depth - 1, in_function, loops - 1)
+                statements.append(f"num {counter};")
+                statements.append(f"{counter} = 0;")
+                statements.append(
+                    f"while ({counter} < {r.randint(0, 5)}){{\n{contents}\n{counter} = {counter} + 1;\n}}"
+                )
+            elif choice < 0.72 and self.array is not None:
+                statements.append(self.array_statement(variables))
+            elif choice < 0.8 and self.pointer is not None:
+                statements.append(self.heap_statement(variables))
+            elif choice < 0.85 and len(functions) > 0:
+                name, params = r.choice(functions)
+                args = [self.expression(variables, functions, 1) for _ in range(params)]
+                statements.append(f"{name}({', '.join(args)});")
+            elif choice < 0.88 and in_function:
+                condition = self.expression(variables, functions, 1)
+                statements.append(f"if ({condition}){{\nreturn {self.expression(variables, functions, 2)};\n}}")
+            elif len(assignable) > 0:
+                v = r.choice(assignable)
+                statements.append(f"{v} = {v} + {self.expression(variables, functions, 1)};")
+        return "\n".join(statements)
+
+    def array_statement(self, variables: list[str]) -> str:
+        """
+        A statement which changes the global array, without calling any functions
+        """
+        r = self.random
+        a = self.array
+        choice = r.random()
+        if choice < 0.3:
+            return f"{a}[{r.randrange(ARRAY_SIZE)}] = {self.expression(variables, [], 2)};"
+        if choice < 0.5:
+            half = ARRAY_SIZE // 2
+            return f"{a}[0:{half}] = [x * {r.choice(LITERALS)} + x for x in {a}[{half}:{ARRAY_SIZE}]];"
+        if choice < 0.6:
+            return f"{a} = [x % 3 for x in range({r.randint(-2, 2)}, {r.randint(-2, 2) + ARRAY_SIZE})];"
+        # a loop which is compiled to list operations
+        counter = self.name("c")
+        value = self.expression(variables + [counter], [], 2)
+        return (
+            f"num {counter};\n{counter} = 0;\n"
+            f"while ({counter} < {ARRAY_SIZE}){{\n{a}[{counter}] = {a}[{counter}] + {value};\n"
+            f"{counter} = {counter} + 1;\n}}"
+        )
+
+    def heap_statement(self, variables: list[str]) -> str:
+        """
+        A statement which changes the block of the global pointer, or which
+        uses a new block, without calling any functions
+        """
+        r = self.random
+        pointer, size = self.pointer
+        choice = r.random()
+        if choice < 0.35:
+            return f"{pointer}[{r.randrange(size)}] = {self.expression(variables, [], 2)};"
+        if choice < 0.5 and size > 1:
+            half = size // 2
+            return f"{pointer}[0:{half}] = [x + {r.choice(LITERALS)} for x in {pointer}[{half}:{half * 2}]];"
+        if choice < 0.6:
+            # the block usually comes back from the free list with the same elements
+            return f"free({pointer});\n{pointer} = alloc({size});"
+        if choice < 0.7:
+            # move the elements to a new block, so there are blocks in the free list
+            block = self.name("m")
+            return (
+                f"ptr {block};\n{block} = alloc({size});\n{block}[0:{size}] = {pointer}[0:{size}];\n"
+                f"free({pointer});\n{pointer} = {block};"
+            )
+        # a block which is only sometimes freed, so the heap can run out
+        block = self.name("b")
+        block_size = r.choice([1, 2, 3, 5, 8, 16, 32, size])
+        statements = [
+            f"ptr {block};",
+            f"{block} = alloc({block_size});",
+            f"{block}[0] = {self.expression(variables, [], 2)};",
+            f"OUT = OUT + {block}[{r.randrange(block_size)}] * {r.choice(['2', '3', '10'])};",
+        ]
+        if r.random() < 0.6:
+            statements.append(f"free({block});")
+        return "\n".join(statements)
+
+    def program(self) -> str:
+        r = self.random
+        source = []
+        variables = ["IN", "OUT"]
+        for _ in range(2):
+            name = self.name("g")
+            source.append(f"num {name};\n{name} = {r.randint(-3, 5)};")
+            variables.append(name)
+        if r.random() < 0.5:
+            self.array = self.name("a")
+            source.append(f"num {self.array}[{ARRAY_SIZE}];")
+        if r.random() < 0.5:
+            self.pointer = (self.name("h"), r.randint(1, 6))
+            source.append(f"ptr {self.pointer[0]};\n{self.pointer[0]} = alloc({self.pointer[1]});")
+
+        functions: list[tuple[str, int]] = []
+        for _ in range(3):
+            name = self.name("f")
+            params = [self.name("p") for _ in range(r.randint(0, 3))]
+            body = self.block(variables + params, functions, 2, True, 1)
+            value = self.expression(variables + params, functions, 2)
+            param_list = ", ".join(f"num {p}" for p in params)
+            source.append(f"num {name}({param_list}){{\n{body}\nreturn {value};\n}}")
+            functions.append((name, len(params)))
+        if r.random() < 0.7:
+            # a recursive function which stops once its first argument is less than 1
+            name = self.name("r")
+            step = self.expression(["n", "total"] + variables, functions, 1)
+            source.append(
+                f"num {name}(num n, num total){{\nif (n < 1){{\nreturn total;\n}}\n"
+                f"return {name}(n - 1, total + {step});\n}}"
+            )
+            functions.append((name, 2))
+
+        source.append(self.block(variables, functions, 2, False, 1))
+        source.append(f"OUT = OUT + {self.expression(variables, functions, 2)};")
+        return "\n".join(source)
+
+
+@dataclass
+class FuzzOptions:
+    """
+    Arguments used to compile and assemble each program (see `compile_syntax_tree` and `write_assembly`)
+    """
+
+    stack_pages: StackPages | None = None
+    heap_size: int = FUZZ_HEAP_SIZE
+    eval_steps: int = EVAL_STEPS
+    unroll_budget: int = UNROLL_BUDGET
+    minified: bool = False
+    block_size: int | None = None
+
+
+@dataclass
+class Failure:
+    """
+    A program whose compiled output is different from the output of the interpreter.
+
+    expected -- output from the interpreter, or its exit code if it stopped early
+    result -- output of the compiled program, or a description of what went wrong
+    """
+
+    seed: int
+    program: Statement
+    program_input: float
+    expected: float | str
+    result: float | str
+
+
+def compiled_output(program: Statement, program_input: float, options: FuzzOptions) -> float | str:
+    """
+    Output of a program compiled and run in the emulator, or a description of the error it caused.
+
+    Raises `EvaluationError` if the program runs out of stack space, since this is not a mistake.
+    """
+    try:
+        assembly = compile_syntax_tree(
+            program,
+            heap_size=options.heap_size,
+            stack_pages=options.stack_pages,
+            eval_steps=options.eval_steps,
+            unroll_budget=options.unroll_budget,
+        )
+        result = run_assembly(assembly, program_input, FUZZ_TICKS, options.minified, options.block_size)
+    except Exception as e:
+        # the interpreter ran the program, so it should compile and run
+        return f"{type(e).__name__}: {e}"
+    if result.exit_code == STACK_OVERFLOW:
+        raise EvaluationError("The program needs a larger stack")
+    if result.exit_code != 0:
+        return f"exit code {result.exit_code:g}"
+    if isinstance(result.output, list):
+        return f"list output {result.output}"
+    return result.output
+
+
+def check_program(
+    program: Statement, program_input: float, options: FuzzOptions
+) -> tuple[float | str, float | str] | None:
+    """
+    Run a program with the interpreter and compiled in the emulator.
+
+    Returns the output of the interpreter and the compiled output if they are different.
+    Raises `EvaluationError` if the program cannot be checked, because the interpreter
+    cannot run it or it does not have a finite output.
+    """
+    try:
+        expected = evaluate(program, program_input, FUZZ_STEPS, options.heap_size)
+    except RecursionError:
+        raise EvaluationError("Too many nested function calls")
+    except ProgramExit as e:
+        # described the same way as the compiled output
+        expected = f"exit code {e.exit_code:g}"
+    if isinstance(expected, float) and not math.isfinite(expected):
+        raise EvaluationError(f"The output {expected} is not a finite number")
+
+    result = compiled_output(program, program_input, options)
+    if result == expected:
+        return None
+    if isinstance(result, float) and isinstance(expected, float):
+        if math.isclose(result, expected, rel_tol=1e-9, abs_tol=1e-9):
+            return None
+    return expected, result
+
+
+def fuzz_seed(seed: int, options: FuzzOptions) -> Failure | None:
+    """
+    Check a random program, raising `EvaluationError` if it cannot be checked
+    """
+    generator = ProgramGenerator(seed)
+    program = parse(generator.program())
+    program_input = generator.random.randint(0, 4)
+    difference = check_program(program, program_input, options)
+    if difference is None:
+        return None
+    return Failure(seed, program, program_input, *difference)
+
+
+def _smaller(node: Node) -> Iterator[Node]:
+    """
+    Nodes like `node` with a part of it removed or simplified
+    """
+    match node:
+        case Group(statements):
+            for i in range(len(statements)):
+                yield Group(statements[:i] + statements[i + 1 :])
+        case If(_, contents, _else):
+            yield contents
+            if _else is not None:
+                yield _else
+                yield replace(node, _else=None)
+        case While(_, contents):
+            yield contents
+        case BinaryOperation(arg1, arg2, _):
+            yield arg1
+            yield arg2
+        case UnaryOperation(arg, _):
+            yield arg
+    if isinstance(node, Expression) and not isinstance(node, (Literal, Variable)):
+        yield Literal("1")
+
+    for name in node.__match_args__:
+        value = getattr(node, name)
+        if isinstance(value, Node):
+            for child in _smaller(value):
+                yield replace(node, **{name: child})
+        elif isinstance(value, tuple):
+            for i, item in enumerate(value):
+                if isinstance(item, Node):
+                    for child in _smaller(item):
+                        yield replace(node, **{name: value[:i] + (child,) + value[i + 1 :]})
+
+
+def reduce_program(program: Statement, fails: Callable[[Statement], bool]) -> Statement:
+    """
+    Remove parts of a program for as long as `fails` is still true for it,
+    so that what is left is a small program which shows the same problem
+    """
+    reduced = True
+    while reduced:
+        reduced = False
+        for candidate in _smaller(program):
+            if fails(candidate):
+                program = candidate
+                reduced = True
+                break
+    return program
+
+
+def reduce_failure(failure: Failure, options: FuzzOptions) -> Statement:
+    """
+    A small program which is also compiled wrongly with the input of a failure
+    """
+
+    def fails(program: Statement) -> bool:
+        try:
+            return check_program(program, failure.program_input, options) is not None
+        except EvaluationError:
+            return False
+
+    return reduce_program(failure.program, fails)
+
+
+def _fuzz_worker(job: tuple[int, FuzzOptions, bool]) -> tuple[bool, Failure | None]:
+    """
+    Check the program for a seed, returning whether it was skipped and how it failed,
+    with the failing program reduced if the last part of `job` is True
+    """
+    seed, options, reduce = job
+    try:
+        failure = fuzz_seed(seed, options)
+    except EvaluationError:
+        return True, None
+    if failure is not None and reduce:
+        failure = replace(failure, program=reduce_failure(failure, options))
+    return False, failure
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        prog="desmosfuzz",
+        description="Check that random programs give the same output when they are compiled as in the interpreter",
+    )
+    arg_parser.add_argument("--count", type=int, default=1000, help="number of programs (default 1000)")
+    arg_parser.add_argument("--seed", type=int, default=0, help="seed of the first program (default 0)")
+    arg_parser.add_argument("--stack-pages", type=int, help="compile with the stack split into pages")
+    arg_parser.add_argument(
+        "--heap-size",
+        type=int,
+        default=FUZZ_HEAP_SIZE,
+        help=f"number of entries in heap memory (default {FUZZ_HEAP_SIZE})",
+    )
+    arg_parser.add_argument(
+        "--page-size",
+        type=int,
+        default=MAX_LIST_LENGTH,
+        help=f"number of entries in each stack page (default {MAX_LIST_LENGTH})",
+    )
+    arg_parser.add_argument(
+        "--eval-steps",
+        type=int,
+        default=EVAL_STEPS,
+        help=f"number of statements to run at compile time (default {EVAL_STEPS})",
+    )
+    arg_parser.add_argument(
+        "--unroll-budget",
+        type=int,
+        default=UNROLL_BUDGET,
+        help=f"number of statements loop unrolling can add (default {UNROLL_BUDGET})",
+    )
+    arg_parser.add_argument("--minify", action="store_true", help="run the minified latex")
+    arg_parser.add_argument("--block-size", type=int, help="split the run action into blocks of this many lines")
+    arg_parser.add_argument(
+        "--no-reduce", action="store_true", help="print failing programs without making them smaller"
+    )
+    arg_parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of programs to check at once in separate processes (default the number of CPUs)",
+    )
+    args = arg_parser.parse_args()
+
+    options = FuzzOptions(
+        StackPages(args.page_size, args.stack_pages) if args.stack_pages is not None else None,
+        args.heap_size,
+        args.eval_steps,
+        args.unroll_budget,
+        args.minify,
+        args.block_size,
+    )
+
+    failures = 0
+    skipped = 0
+    start = perf_counter()
+    jobs = [(seed, options, not args.no_reduce) for seed in range(args.seed, args.seed + args.count)]
+    with ProcessPoolExecutor(args.jobs) as pool:
+        outcomes = pool.map(_fuzz_worker, jobs, chunksize=8) if args.jobs > 1 else map(_fuzz_worker, jobs)
+        for was_skipped, failure in outcomes:
+            skipped += was_skipped
+            if failure is None:
+                continue
+            failures += 1
+            expected = f"{failure.expected:g}" if isinstance(failure.expected, float) else failure.expected
+            print(f"seed {failure.seed} with input {failure.program_input:g}: expected {expected}, got {failure.result}")
+            print(failure.program, end="\n\n", flush=True)
+
+    seconds = perf_counter() - start
+    print(
+        f"{args.count} programs, {failures} failures, {skipped} skipped "
+        f"in {seconds:.1f} s ({args.count / seconds * 60:.0f} programs per minute)"
+    )
+    sys.exit(1 if failures > 0 else 0)
+
+
+if __name__ == "__main__":
+    main()
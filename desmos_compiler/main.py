@@ -1,17 +1,164 @@
+import argparse
 import sys
-from desmos_compiler.compiler import compile_syntax_tree
-from desmos_compiler.assembler import assemble
-from desmos_compiler.parser import parse
+from contextlib import contextmanager
+from time import perf_counter
+
+# every other module is imported in the phase which needs it, so --help and bad
+# arguments take a few ms more than starting python. Compiling a small program
+# takes about 50 ms more (90 to 100 ms in all where python takes 35 ms to start),
+# most of it importing lark and the syntax tree, which --time counts in the parse phase
+from desmos_compiler.defaults import EVAL_STEPS, HEAP_SIZE, MAX_LIST_LENGTH, UNROLL_BUDGET
+
 
 def main():
-    with open(sys.argv[1], "r") as f:
-        program = f.read()
+    arg_parser = argparse.ArgumentParser(
+        prog="desmoscc", description="Compile a program to run in Desmos"
+    )
+    arg_parser.add_argument("path", help="path to the program")
+    arg_parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="print estimated ticks and memory usage instead of javascript",
+    )
+    arg_parser.add_argument(
+        "--heap-size",
+        type=int,
+        default=HEAP_SIZE,
+        help=f"number of entries in heap memory (default {HEAP_SIZE})",
+    )
+    arg_parser.add_argument(
+        "--stack-pages",
+        type=int,
+        help="split the stack into this many fixed size lists so it can grow past the list length limit",
+    )
+    arg_parser.add_argument(
+        "--page-size",
+        type=int,
+        default=MAX_LIST_LENGTH,
+        help=f"number of entries in each stack page (default {MAX_LIST_LENGTH})",
+    )
+    arg_parser.add_argument(
+        "--eval-steps",
+        type=int,
+        default=EVAL_STEPS,
+        help="number of statements to run at compile time before leaving "
+        f"the rest of the program to desmos, or 0 to run all of it in desmos (default {EVAL_STEPS})",
+    )
+    arg_parser.add_argument(
+        "--unroll-budget",
+        type=int,
+        default=UNROLL_BUDGET,
+        help="number of statements loop unrolling can add to the program, "
+        f"or 0 to not unroll loops (default {UNROLL_BUDGET})",
+    )
+    arg_parser.add_argument(
+        "--minify",
+        action="store_true",
+        help="shorten the generated latex so large programs load faster",
+    )
+    arg_parser.add_argument(
+        "--size",
+        action="store_true",
+        help="print the size of the javascript with and without --minify instead of javascript",
+    )
+    arg_parser.add_argument(
+        "--chunk-size",
+        type=int,
+        help="split the javascript into calls creating at most this many expressions",
+    )
+    arg_parser.add_argument(
+        "--block-size",
+        type=int,
+        help="split the run action into actions of at most this many lines",
+    )
+    arg_parser.add_argument(
+        "--resume",
+        metavar="STATE",
+        help="continue the program from a graph state saved with JSON.stringify(Calc.getState()) "
+        "while it was running, compiled with the same options",
+    )
+    arg_parser.add_argument(
+        "-o",
+        "--output",
+        help="write the javascript to this file instead of stdout",
+    )
+    arg_parser.add_argument(
+        "--time",
+        action="store_true",
+        help="print how long each phase of compiling takes to stderr",
+    )
+    args = arg_parser.parse_args()
+
+    timings = []
+
+    @contextmanager
+    def phase(name: str):
+        start = perf_counter()
+        yield
+        timings.append((name, perf_counter() - start))
+
+    try:
+        run(args, phase)
+    finally:
+        if args.time:
+            timings.append(("total", sum(t for _, t in timings)))
+            for name, seconds in timings:
+                print(f"{name:<10}{seconds * 1000:8.1f} ms", file=sys.stderr)
+
+
+def run(args: argparse.Namespace, phase):
+    with phase("read"):
+        with open(args.path, "r") as f:
+            program = f.read()
+
+    with phase("parse"):
+        from desmos_compiler.parser import parse
+
+        ast = parse(program)
+
+    with phase("compile"):
+        from desmos_compiler.compiler import Compiler, StackPages
+
+        stack_pages = None
+        if args.stack_pages is not None:
+            stack_pages = StackPages(args.page_size, args.stack_pages)
+        compiler = Compiler(ast, args.heap_size, stack_pages, args.eval_steps, args.unroll_budget)
+        desmos_assembly = compiler.generate_assembly()
+
+    if args.stats:
+        with phase("stats"):
+            from desmos_compiler.stats import collect_stats, format_stats
+
+            print(format_stats(collect_stats(compiler)))
+        return
+
+    with phase("assemble"):
+        from desmos_compiler.assembler import assemble, write_assembly
+
+        if args.size:
+            for name, minified in [("normal", False), ("minified", True)]:
+                js = assemble(desmos_assembly, minified)
+                expressions = js.count('"latex"')
+                print(f"{name}: {len(js)} bytes, {expressions} expressions")
+            return
+
+        write = write_assembly
+        if args.resume is not None:
+            import json
+
+            from desmos_compiler.checkpoint import read_checkpoint, write_resume
+
+            with open(args.resume, "r") as f:
+                checkpoint = read_checkpoint(json.load(f))
+            write = lambda program, out, *options: write_resume(program, checkpoint, out, *options)
 
-    ast = parse(program)
-    desmos_assembly = compile_syntax_tree(ast)
-    js = assemble(desmos_assembly)
+        if args.output is None:
+            write(desmos_assembly, sys.stdout, args.minify, args.chunk_size, args.block_size)
+            print()
+        else:
+            with open(args.output, "w") as f:
+                write(desmos_assembly, f, args.minify, args.chunk_size, args.block_size)
 
-    print(js)
 
 if __name__ == "__main__":
     main()
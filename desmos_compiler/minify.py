@@ -0,0 +1,279 @@
+import re
+from itertools import count
+
+# letters which have a meaning of their own in desmos
+RESERVED_LETTERS = set("extyri")
+
+# a repeated subexpression is only moved into its own expression if this
+# saves at least this many characters (counting the javascript for the expression)
+MIN_SAVINGS = 20
+EXPR_OVERHEAD = len('{"id": "expr0", "latex": ""}, ')
+
+_TOKEN = re.compile(
+    r"\\left|\\right"
+    r"|\\operatorname\{\w+\}"
+    r"|\\[a-zA-Z]+"
+    r"|\\[{}]"
+    r"|[a-zA-Z](?:_\{[a-zA-Z0-9]+\}|_[a-zA-Z0-9])?"
+    r"|\d+(?:\.\d+)?|\.\d+"
+    r"|\.\.\."
+    r"|\s+"
+    r"|."
+)
+
+OPEN = {"(": ")", "[": "]", "\\{": "\\}", "{": "}"}
+CLOSE = set(OPEN.values())
+
+# binding strength of operators, where higher binds more tightly
+PRECEDENCE = {
+    "\\to": -1,
+    "=": 0,
+    "<": 0,
+    ">": 0,
+    "\\le": 0,
+    "\\ge": 0,
+    "...": 0.5,
+    "+": 1,
+    "-": 1,
+    "\\cdot": 2,
+}
+UNARY_MINUS = 3
+ATOM = float("inf")
+
+# operators which give the same result when evaluated in either order (a + b + c)
+ASSOCIATIVE = {1, 2}
+
+SEPARATORS = {",", ":", "\\operatorname{for}"}
+FUNCTIONS = {"\\max", "\\min", "\\frac"}
+
+
+def tokenize(latex: str) -> list[str]:
+    """
+    Split latex into tokens, dropping whitespace and sizing macros
+    """
+    return [t for t in _TOKEN.findall(latex) if not t.isspace() and t not in ("\\left", "\\right")]
+
+
+def detokenize(tokens: list[str]) -> str:
+    latex = ""
+    previous = ""
+    for t in tokens:
+        # a letter after a command would become part of its name
+        if re.fullmatch(r"\\[a-zA-Z]+", previous) and t[0].isalpha():
+            latex += " "
+        latex += t
+        previous = t
+    return latex
+
+
+def is_name(token: str) -> bool:
+    return re.fullmatch(r"[a-zA-Z](?:_\{[a-zA-Z0-9]+\}|_[a-zA-Z0-9])?", token) is not None
+
+
+def is_value(token: str) -> bool:
+    return is_name(token) or re.fullmatch(r"\d+(?:\.\d+)?|\.\d+", token) is not None
+
+
+def is_function(token: str) -> bool:
+    return token in FUNCTIONS or (
+        token.startswith("\\operatorname") and token not in SEPARATORS
+    )
+
+
+def matching_brackets(tokens: list[str]) -> dict[int, int]:
+    """
+    Index of the closing bracket for the index of each opening bracket
+    """
+    matches = {}
+    stack = []
+    for i, t in enumerate(tokens):
+        if t in OPEN:
+            stack.append(i)
+        elif t in CLOSE:
+            matches[stack.pop()] = i
+    return matches
+
+
+def _is_unary(tokens: list[str], i: int) -> bool:
+    """
+    Whether the `-` at index `i` negates a value instead of subtracting it
+    """
+    return i == 0 or tokens[i - 1] in PRECEDENCE or tokens[i - 1] in SEPARATORS or tokens[i - 1] in OPEN
+
+
+def _content_precedence(tokens: list[str], start: int, end: int, matches: dict[int, int]) -> float | None:
+    """
+    Precedence of the loosest operator in `tokens[start:end]` outside of brackets,
+    or None if it contains a separator outside of brackets
+    """
+    precedence = ATOM
+    i = start
+    while i < end:
+        t = tokens[i]
+        if t in OPEN:
+            i = matches[i] + 1
+            continue
+        if t in SEPARATORS:
+            return None
+        if t in PRECEDENCE:
+            precedence = min(precedence, 1 if t == "-" and _is_unary(tokens, i) else PRECEDENCE[t])
+        i += 1
+    return precedence
+
+
+def remove_parentheses(tokens: list[str]) -> list[str]:
+    """
+    Remove parentheses which do not change how an expression is evaluated
+    """
+    changed = True
+    while changed:
+        changed = False
+        matches = matching_brackets(tokens)
+        removed = set()
+        for i, j in matches.items():
+            if tokens[i] != "(":
+                continue
+            before = tokens[i - 1] if i > 0 else ","
+            after = tokens[j + 1] if j + 1 < len(tokens) else ","
+            # keep function calls and implicit multiplication
+            if is_value(before) or is_function(before) or before in CLOSE:
+                continue
+            if is_value(after) or is_function(after) or after in OPEN:
+                continue
+
+            inner = _content_precedence(tokens, i + 1, j, matches)
+            if inner is None:
+                continue
+            if before in PRECEDENCE:
+                left = UNARY_MINUS if before == "-" and _is_unary(tokens, i - 1) else PRECEDENCE[before]
+            else:
+                left = -ATOM
+            right = PRECEDENCE[after] if after in PRECEDENCE else -ATOM
+
+            if inner > left and (inner > right or (inner == right and inner in ASSOCIATIVE)):
+                removed |= {i, j}
+        if len(removed) > 0:
+            tokens = [t for k, t in enumerate(tokens) if k not in removed]
+            changed = True
+    return tokens
+
+
+def short_names(reserved: set[str]):
+    """
+    Generate short desmos variable names, starting with single letters
+    """
+    letters = [
+        c
+        for c in "abcdfghjklmnopqsuvwzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+        if c not in RESERVED_LETTERS and c not in reserved
+    ]
+    yield from letters
+    for n in count(1):
+        for c in letters:
+            name = f"{c}_{n}" if n < 10 else f"{c}_{{{n}}}"
+            if name not in reserved:
+                yield name
+
+
+def _bound_names(tokens: list[str]) -> set[str]:
+    """
+    Names of the variables of list comprehensions
+    """
+    return {tokens[i + 1] for i, t in enumerate(tokens[:-1]) if t == "\\operatorname{for}"}
+
+
+def _candidates(tokens: list[str], matches: dict[int, int], bound: set[str]):
+    """
+    Spans of tokens which can be replaced by a variable holding their value
+    """
+    for i, j in matches.items():
+        t = tokens[i]
+        if t == "{":
+            continue
+        start = i
+        before = tokens[i - 1] if i > 0 else ","
+        if t == "(" and is_function(before) and before != "\\frac":
+            start = i - 1
+        elif t == "[" and is_name(before):
+            # an element of a list
+            start = i - 1
+        elif is_value(before) or is_function(before) or before in CLOSE:
+            continue
+        elif t == "(" and _content_precedence(tokens, i + 1, j, matches) is None:
+            # a point or a group of actions
+            continue
+        span = tokens[start : j + 1]
+        if "\\to" in span or any(n in bound for n in span):
+            continue
+        yield start, j + 1
+
+
+def _replace(tokens: list[str], spans: list[tuple[int, int]], name: str) -> list[str]:
+    """
+    Replace spans of tokens which do not overlap with a name
+    """
+    result = []
+    i = 0
+    for start, end in sorted(spans):
+        if start < i:
+            continue
+        result += tokens[i:start] + [name]
+        i = end
+    return result + tokens[i:]
+
+
+def minify(latex: list[str], keep: set[str]) -> list[str]:
+    """
+    Make the latex of expressions shorter without changing what they do.
+
+    Sizing macros (`\\left`, `\\right`) and unnecessary parentheses are removed,
+    every variable except the ones in `keep` gets a short name, and subexpressions
+    which are repeated are moved into their own expressions, which are added
+    after the given ones.
+    """
+    tokens = [tokenize(l) for l in latex]
+
+    # the most used names get the shortest replacements
+    uses: dict[str, int] = {}
+    for expr_tokens in tokens:
+        for t in expr_tokens:
+            if is_name(t) and t not in keep:
+                uses[t] = uses.get(t, 0) + 1
+    names = short_names(keep)
+    renames = {name: next(names) for name in sorted(uses, key=lambda n: -uses[n])}
+    tokens = [remove_parentheses([renames.get(t, t) for t in expr_tokens]) for expr_tokens in tokens]
+
+    bound = set().union(*[_bound_names(t) for t in tokens])
+    # variables assigned by actions are only variables if their definition does not use other names
+    assigned = {t[i - 1] for t in tokens for i in range(1, len(t)) if t[i] == "\\to"}
+    fixed = {k for k, t in enumerate(tokens) if t[1:2] == ["="] and t[0] in assigned}
+    name = next(names)
+    while True:
+        # positions of each candidate in each expression
+        occurrences: dict[tuple[str, ...], list[tuple[int, int, int]]] = {}
+        for k, expr_tokens in enumerate(tokens):
+            if k in fixed:
+                continue
+            matches = matching_brackets(expr_tokens)
+            for start, end in _candidates(expr_tokens, matches, bound):
+                span = tuple(expr_tokens[start:end])
+                occurrences.setdefault(span, []).append((k, start, end))
+
+        best, best_savings = None, MIN_SAVINGS - 1
+        for span, positions in occurrences.items():
+            length = len(detokenize(list(span)))
+            n = len(positions)
+            savings = n * (length - len(name)) - (len(name) + 1 + length + EXPR_OVERHEAD)
+            if n > 1 and savings > best_savings:
+                best, best_savings = span, savings
+        if best is None:
+            break
+
+        for k, expr_tokens in enumerate(tokens):
+            spans = [(start, end) for i, start, end in occurrences[best] if i == k]
+            if len(spans) > 0:
+                tokens[k] = _replace(expr_tokens, spans, name)
+        tokens.append([name, "="] + list(best))
+        name = next(names)
+
+    return [detokenize(t) for t in tokens]
@@ -0,0 +1,1107 @@
+from collections import Counter, deque
+from dataclasses import dataclass, field, replace
+from math import ceil
+from typing import Callable
+
+from desmos_compiler.defaults import UNROLL_BUDGET
+from desmos_compiler.evaluator import apply_operator, apply_unary_operator, number_literal
+from desmos_compiler.syntax_tree import (
+    Alloc,
+    ArrayType,
+    Assignment,
+    BinaryOperation,
+    Comprehension,
+    Declaration,
+    DesmosType,
+    Expression,
+    Free,
+    FunctionCall,
+    FunctionCallStatement,
+    FunctionDefinition,
+    FunctionReturn,
+    Group,
+    If,
+    Index,
+    IndexAssignment,
+    Length,
+    ListLiteral,
+    ListOperator,
+    Literal,
+    Operator,
+    Range,
+    Reduction,
+    Slice,
+    Statement,
+    UnaryOperation,
+    Variable,
+    While,
+    contains_call,
+    walk,
+)
+
+# number of iterations run together by a loop which is not unrolled completely
+UNROLL_FACTOR = 4
+
+
+def free_names(node: Expression | Statement, bound: frozenset[str] = frozenset()) -> set[str]:
+    """
+    Names of the variables used (read or assigned) by a node
+    which are not declared inside of it or in `bound`
+    """
+    match node:
+        case Literal(_) | ListLiteral(_):
+            return set()
+        case Variable(name):
+            return set() if name in bound else {name}
+        case BinaryOperation(arg1, arg2, _):
+            return free_names(arg1, bound) | free_names(arg2, bound)
+        case UnaryOperation(arg, _):
+            return free_names(arg, bound)
+        case FunctionCall(_, args):
+            return set().union(*[free_names(a, bound) for a in args])
+        case Index(array, index):
+            return free_names(array, bound) | free_names(index, bound)
+        case Slice(array, start, end):
+            return free_names(array, bound) | free_names(start, bound) | free_names(end, bound)
+        case Length(Variable(_)):
+            # the length of an array never changes
+            return set()
+        case Length(arg):
+            return free_names(arg, bound)
+        case Range(start, end):
+            return free_names(start, bound) | free_names(end, bound)
+        case Comprehension(expr, var, source, condition):
+            free = free_names(source, bound)
+            inner = bound | {var.name}
+            free |= free_names(expr, inner)
+            return free | (free_names(condition, inner) if condition is not None else set())
+        case Reduction(_, arg) | Alloc(arg):
+            return free_names(arg, bound)
+        case Group(statements):
+            free = set()
+            for s in statements:
+                if isinstance(s, Declaration):
+                    bound = bound | {s.var.name}
+                else:
+                    free |= free_names(s, bound)
+            return free
+        case Declaration(_, _) | FunctionDefinition(_, _, _, _):
+            return set()
+        case Assignment(var, val) | IndexAssignment(var, val):
+            return free_names(var, bound) | free_names(val, bound)
+        case If(condition, contents, _else):
+            free = free_names(condition, bound) | free_names(contents, bound)
+            return free | (free_names(_else, bound) if _else is not None else set())
+        case While(condition, contents):
+            return free_names(condition, bound) | free_names(contents, bound)
+        case FunctionReturn(expr):
+            return free_names(expr, bound)
+        case FunctionCallStatement(call):
+            return free_names(call, bound)
+        case Free(pointer):
+            return free_names(pointer, bound)
+        case _:
+            raise ValueError(f"Unknown node type {type(node)}")
+
+
+def read_names(node: Expression | Statement) -> set[str]:
+    """
+    Names of the variables whose value is used somewhere in a node
+    """
+    # every occurrence of a name which is not one of these is a read
+    counts: dict[str, int] = {}
+    for n in walk(node):
+        match n:
+            case Variable(name):
+                counts[name] = counts.get(name, 0) + 1
+            case Assignment(var, _) | Declaration(var, _) | FunctionCall(var, _) | Comprehension(
+                _, var, _, _
+            ) | FunctionDefinition(var, _, _, _):
+                counts[var.name] = counts.get(var.name, 0) - 1
+    return {name for name, count in counts.items() if count > 0}
+
+
+def constant_value(expr: Expression) -> float | None:
+    """
+    Value of an expression which only contains literals, or None if it is not constant
+    """
+    match expr:
+        case Literal(val):
+            try:
+                return float(val)
+            except ValueError:
+                return None
+        case BinaryOperation(arg1, arg2, op):
+            a, b = constant_value(arg1), constant_value(arg2)
+            if a is None or b is None:
+                return None
+            return apply_operator(op, a, b)
+        case UnaryOperation(arg, op):
+            a = constant_value(arg)
+            return apply_unary_operator(op, a) if a is not None else None
+    return None
+
+
+def always_returns(statement: Statement) -> bool:
+    """
+    Whether every path through a statement ends with a return
+    """
+    match statement:
+        case FunctionReturn(_):
+            return True
+        case Group(statements):
+            return any(always_returns(s) for s in statements)
+        case If(_, contents, _else):
+            return _else is not None and always_returns(contents) and always_returns(_else)
+        case _:
+            return False
+
+
+def pointer_names(root: Statement) -> set[str]:
+    """
+    Names of every variable or parameter declared as a pointer
+    """
+    names = set()
+    for n in walk(root):
+        if isinstance(n, Declaration) and n.type == DesmosType("ptr"):
+            names.add(n.var.name)
+        elif isinstance(n, FunctionDefinition):
+            names |= {p.var.name for p in n.params if p.type == DesmosType("ptr")}
+    return names
+
+
+def uses_heap(node: Expression | Statement, pointers: set[str]) -> bool:
+    """
+    Whether a node can read or change heap memory,
+    where `pointers` contains the names of the variables which could be pointers
+    """
+    return any(
+        isinstance(n, (Alloc, Free))
+        or (isinstance(n, (Index, Slice)) and n.array.name in pointers)
+        for n in walk(node)
+    )
+
+
+def pure_functions(root: Statement) -> set[Variable]:
+    """
+    Functions which do not use global variables or the heap and only call pure functions.
+    Calls to these functions always give the same result for the same arguments
+    and have no effect other than the ticks they take.
+    """
+    definitions = {n.name: n for n in walk(root) if isinstance(n, FunctionDefinition)}
+    pointers = pointer_names(root)
+    pure = {
+        name
+        for name, d in definitions.items()
+        if len(free_names(d.body, frozenset(p.var.name for p in d.params))) == 0
+        and not uses_heap(d.body, pointers)
+    }
+
+    changed = True
+    while changed:
+        changed = False
+        for name in list(pure):
+            calls = {n.name for n in walk(definitions[name].body) if isinstance(n, FunctionCall)}
+            if not calls <= pure:
+                pure.remove(name)
+                changed = True
+    return pure
+
+
+class LoopInvariantHoister:
+    """
+    Moves calls to pure functions which do not change between iterations of a
+    loop out of the loop, so each one is only evaluated once.
+
+    Only expressions which are evaluated on every iteration are moved (the loop
+    condition and statements directly in the loop body before any return).
+    Expressions from the loop body are evaluated after checking the loop
+    condition once, so they never run if the loop does not.
+
+    Invariant expressions without calls are not moved, and induction variables
+    are not strength reduced, since an expression without calls is computed in
+    the same tick as the statement using it, so moving or simplifying it saves
+    no ticks.
+    """
+
+    def __init__(self, root: Statement):
+        self.root = root
+        self.pure = pure_functions(root)
+        self.pointers = pointer_names(root)
+        self.temp_counter = 0
+
+    def hoist(self) -> Statement:
+        # variables declared at the top level are global
+        assert isinstance(self.root, Group)
+        return Group([self._statement(s, frozenset()) for s in self.root.statements])
+
+    def _statement(self, statement: Statement, local: frozenset[str]) -> Statement:
+        """
+        Hoist invariants out of every loop in a statement.
+
+        `local` is the set of variables in scope which cannot be changed by function calls.
+        """
+        match statement:
+            case Group(statements):
+                result = []
+                for s in statements:
+                    result.append(self._statement(s, local))
+                    if isinstance(s, Declaration):
+                        local = local | {s.var.name}
+                return Group(result)
+            case If(condition, contents, _else):
+                return If(
+                    condition,
+                    self._statement(contents, local),
+                    self._statement(_else, local) if _else is not None else None,
+                )
+            case FunctionDefinition(_, _, params, body):
+                return replace(
+                    statement,
+                    body=self._statement(body, frozenset(p.var.name for p in params)),
+                )
+            case While(condition, contents):
+                loop = While(condition, self._statement(contents, local))
+                return self._hoist_loop(loop, local)
+            case _:
+                return statement
+
+    def _is_invariant(self, expr: Expression, loop: While, local: frozenset[str]) -> bool:
+        changed = {n.var.name for n in walk(loop) if isinstance(n, (Assignment, Declaration))}
+        changed |= {n.target.array.name for n in walk(loop) if isinstance(n, IndexAssignment)}
+        calls = {n.name for n in walk(loop) if isinstance(n, FunctionCall)}
+        names = free_names(expr)
+        if not calls <= self.pure and not names <= local:
+            # global variables can be changed by the calls in the loop
+            return False
+        if uses_heap(expr, self.pointers):
+            # the heap can be changed through any pointer
+            return False
+        # variables declared in the loop are not in scope before it
+        declared = {n.var.name for n in walk(loop) if isinstance(n, Declaration)}
+        if any(isinstance(n, Variable) and n.name in declared for n in walk(expr)):
+            return False
+        expr_calls = {n.name for n in walk(expr) if isinstance(n, FunctionCall)}
+        return expr_calls <= self.pure and len(names & changed) == 0
+
+    def _invariants(self, expr: Expression, loop: While, local: frozenset[str]) -> list[Expression]:
+        """
+        Find the largest invariant subexpressions of an expression which contain calls
+        """
+        if not any(isinstance(n, FunctionCall) for n in walk(expr)):
+            return []
+        # lists can't be stored in a number
+        is_list = isinstance(expr, (Slice, Range, Comprehension))
+        if not is_list and self._is_invariant(expr, loop, local):
+            return [expr]
+        match expr:
+            case BinaryOperation(arg1, _, Operator.AND | Operator.OR):
+                # calls in the second argument do not run on every iteration
+                return self._invariants(arg1, loop, local)
+            case BinaryOperation(arg1, arg2, _):
+                return self._invariants(arg1, loop, local) + self._invariants(arg2, loop, local)
+            case UnaryOperation(arg, _):
+                return self._invariants(arg, loop, local)
+            case FunctionCall(_, args):
+                return [i for a in args for i in self._invariants(a, loop, local)]
+            case Index(_, index):
+                return self._invariants(index, loop, local)
+            case Slice(_, start, end):
+                return self._invariants(start, loop, local) + self._invariants(end, loop, local)
+            case _:
+                return []
+
+    def _every_iteration_exprs(self, loop: While) -> list[Expression]:
+        """
+        Expressions in the loop body which are evaluated on every iteration
+        """
+        exprs = []
+        statements = loop.contents.statements if isinstance(loop.contents, Group) else [loop.contents]
+        for s in statements:
+            if any(isinstance(n, FunctionReturn) for n in walk(s)):
+                break
+            match s:
+                case Assignment(_, val):
+                    exprs.append(val)
+                case IndexAssignment(target, val):
+                    exprs.extend([target, val])
+                case FunctionCallStatement(call):
+                    exprs.extend(call.args)
+                case If(condition, _, _) | While(condition, _):
+                    exprs.append(condition)
+        return exprs
+
+    def _hoist_loop(self, loop: While, local: frozenset[str]) -> Statement:
+        condition_invariants = self._invariants(loop.condition, loop, local)
+        body_invariants = [
+            i
+            for e in self._every_iteration_exprs(loop)
+            for i in self._invariants(e, loop, local)
+            if i not in condition_invariants
+        ]
+        if len(condition_invariants) + len(body_invariants) == 0:
+            return loop
+
+        temps: list[tuple[Expression, Variable]] = []
+        setup: list[Statement] = []
+        body_setup: list[Statement] = []
+        for invariant in condition_invariants + body_invariants:
+            if any(invariant == e for e, _ in temps):
+                continue
+            temp = Variable(f"#invariant{self.temp_counter}")
+            self.temp_counter += 1
+            temps.append((invariant, temp))
+            (setup if invariant in condition_invariants else body_setup).extend(
+                [Declaration(temp, DesmosType("num")), Assignment(temp, invariant)]
+            )
+
+        new_loop = substitute(loop, dict(temps))
+        if len(body_setup) == 0:
+            return Group(setup + [new_loop])
+
+        # only evaluate invariants from the body if the loop runs at least once
+        return Group(setup + [If(new_loop.condition, Group(body_setup + [new_loop]), None)])
+
+def substitute(node, replacements: dict[Expression, Expression]):
+    """
+    Replace every occurrence of some expressions in a syntax tree
+    """
+    if node in replacements:
+        return replacements[node]
+    match node:
+        case BinaryOperation(arg1, arg2, op):
+            return BinaryOperation(
+                substitute(arg1, replacements), substitute(arg2, replacements), op
+            )
+        case UnaryOperation(arg, op):
+            return UnaryOperation(substitute(arg, replacements), op)
+        case FunctionCall(name, args):
+            return FunctionCall(name, [substitute(a, replacements) for a in args])
+        case Alloc(size):
+            return Alloc(substitute(size, replacements))
+        case Index(array, index):
+            return Index(array, substitute(index, replacements))
+        case Slice(array, start, end):
+            return Slice(array, substitute(start, replacements), substitute(end, replacements))
+        case Group(statements):
+            return Group([substitute(s, replacements) for s in statements])
+        case Assignment(var, val):
+            return Assignment(var, substitute(val, replacements))
+        case IndexAssignment(target, val):
+            return IndexAssignment(substitute(target, replacements), substitute(val, replacements))
+        case If(condition, contents, _else):
+            return If(
+                substitute(condition, replacements),
+                substitute(contents, replacements),
+                substitute(_else, replacements) if _else is not None else None,
+            )
+        case While(condition, contents):
+            return While(substitute(condition, replacements), substitute(contents, replacements))
+        case FunctionReturn(expr):
+            return FunctionReturn(substitute(expr, replacements))
+        case FunctionCallStatement(call):
+            return FunctionCallStatement(substitute(call, replacements))
+        case Free(pointer):
+            return Free(substitute(pointer, replacements))
+        case FunctionDefinition(_, _, _, body):
+            return replace(node, body=substitute(body, replacements))
+        case _:
+            return node
+
+
+def map_statements(statement: Statement, f: Callable[[Statement], Statement]) -> Statement:
+    """
+    Rebuild a statement from the bottom up, replacing it and every statement below it with `f` of the statement
+    """
+    match statement:
+        case Group(statements):
+            statement = Group([map_statements(s, f) for s in statements])
+        case If(condition, contents, _else):
+            statement = If(
+                condition,
+                map_statements(contents, f),
+                map_statements(_else, f) if _else is not None else None,
+            )
+        case While(condition, contents):
+            statement = While(condition, map_statements(contents, f))
+        case FunctionDefinition(_, _, _, body):
+            statement = replace(statement, body=map_statements(body, f))
+    return f(statement)
+
+
+def vectorize_counted_loop(statement: Statement, pointers: set[str] = set()) -> Statement:
+    """
+    Replace a loop which adds up a value or sets the elements of an array
+    for a range of counter values, like
+
+        while (i < n){
+            s = s + f(i)     or     a[i] = f(i)
+            i = i + 1;
+        }
+
+    with statements which compute every iteration at once using a list comprehension.
+    `pointers` contains the names of the variables which could be pointers.
+    """
+    match statement:
+        case While(
+            BinaryOperation(Variable(_) as i, end, Operator.LT),
+            Group([work, Assignment(i2, BinaryOperation(i3, Literal("1"), Operator.ADD))]),
+        ) if i == i2 == i3:
+            pass
+        case _:
+            return statement
+
+    iterations = Range(i, end)
+    count = Length(iterations)
+    match work:
+        case Assignment(s, BinaryOperation(s2, element, Operator.ADD)) | Assignment(
+            s, BinaryOperation(element, s2, Operator.ADD)
+        ) if s == s2 and s != i:
+            changed = {s.name}
+            total = Reduction(ListOperator.SUM, Comprehension(element, i, iterations, None))
+            vectorized = Assignment(s, BinaryOperation(s, total, Operator.ADD))
+        case IndexAssignment(Index(array, index), element) if index == i:
+            changed = {array.name}
+            vectorized = IndexAssignment(
+                Slice(array, i, BinaryOperation(i, count, Operator.ADD)),
+                Comprehension(element, i, iterations, None),
+            )
+        case _:
+            return statement
+
+    if contains_call(element) or contains_call(end):
+        return statement
+    if any(isinstance(n, Alloc) for n in walk(work)):
+        return statement
+    if len(changed & pointers) > 0 and (uses_heap(element, pointers) or uses_heap(end, pointers)):
+        # another pointer could point to the elements being set
+        return statement
+    if len(free_names(end) & (changed | {i.name})) > 0 or len(free_names(element) & changed) > 0:
+        # the value depends on earlier iterations
+        return statement
+    return Group([vectorized, Assignment(i, BinaryOperation(i, count, Operator.ADD))])
+
+
+def changed_names(statement: Statement) -> set[str]:
+    """
+    Names of the variables which are assigned or declared anywhere in a statement
+    """
+    changed = set()
+    for n in walk(statement):
+        if isinstance(n, (Assignment, Declaration)):
+            changed.add(n.var.name)
+        elif isinstance(n, IndexAssignment):
+            changed.add(n.target.array.name)
+    return changed
+
+
+def statement_count(node: Statement) -> int:
+    """
+    Number of statements in a syntax tree, not counting groups
+    """
+    return sum(1 for n in walk(node) if isinstance(n, Statement) and not isinstance(n, Group))
+
+
+class LoopUnroller:
+    """
+    Repeats the body of counted loops like
+
+        while (i < n){
+            ...
+            i = i + 1;
+        }
+
+    so fewer iterations check the condition and jump back to the start.
+    Loops which start from a constant (assigned just before them) and have
+    a constant end are replaced with all of their iterations. Other loops run
+    `factor` iterations at a time, followed by the original loop for the rest.
+    The counter is replaced by its value in each iteration where possible.
+
+    budget -- number of statements which can be added to the whole program
+    """
+
+    def __init__(self, root: Statement, budget: int, factor: int):
+        self.root = root
+        self.budget = budget
+        self.factor = factor
+        self.pure = pure_functions(root)
+        self.pointers = pointer_names(root)
+
+    def unroll(self) -> Statement:
+        # a loop is unrolled with the group it is in, which has the statement before it
+        return map_statements(self.root, self._group)
+
+    def _group(self, statement: Statement) -> Statement:
+        if not isinstance(statement, Group):
+            return statement
+        statements: list[Statement] = []
+        for s in statement.statements:
+            if not isinstance(s, While):
+                statements.append(s)
+                continue
+            start = None
+            match statements[-1:]:
+                case [Assignment(var, Literal(_) as val)] if constant_value(val) is not None:
+                    start = (var, constant_value(val))
+            statements.extend(self._unroll(s, start))
+        return Group(statements)
+
+    def _counted_loop(self, loop: While) -> tuple[Variable, Expression, list[Statement]] | None:
+        """
+        The counter, end and body without the increment of a loop which can be unrolled
+        """
+        match loop:
+            case While(
+                BinaryOperation(Variable(_) as i, end, Operator.LT),
+                Group([*work, Assignment(i2, BinaryOperation(i3, Literal("1"), Operator.ADD))]),
+            ) if i == i2 == i3:
+                pass
+            case _:
+                return None
+
+        body = Group(work)
+        changed = changed_names(body)
+        if i.name in changed | self.pointers or len(free_names(end) & changed) > 0:
+            return None
+        if any(isinstance(n, Declaration) for n in walk(body)):
+            # each copy of the body would declare its variables again
+            return None
+        if contains_call(end) or any(
+            isinstance(n, FunctionCall) and n.name not in self.pure for n in walk(body)
+        ):
+            # the function could change the counter or the end
+            return None
+        if len(changed & self.pointers) > 0 and uses_heap(end, self.pointers):
+            # another pointer could point to the end
+            return None
+        return i, end, work
+
+    def _iterations(
+        self, i: Variable, work: list[Statement], start: float | None, count: int
+    ) -> list[Statement]:
+        """
+        Statements which run `count` iterations of a loop body one after the other
+        and leave the counter at its value after them. The counter starts at `start`,
+        or at its current value if it is None.
+        """
+
+        def counter(iteration: int) -> Expression:
+            if start is not None:
+                return number_literal(start + iteration)
+            return i if iteration == 0 else BinaryOperation(i, Literal(str(iteration)), Operator.ADD)
+
+        body = Group(work)
+        if i.name in read_names(substitute(body, {i: Literal("0")})):
+            # the counter is used somewhere `substitute` does not replace it
+            increment = Assignment(i, BinaryOperation(i, Literal("1"), Operator.ADD))
+            return (work + [increment]) * count
+
+        statements = []
+        for iteration in range(count):
+            statements.extend(substitute(body, {i: counter(iteration)}).statements)
+        return statements + [Assignment(i, counter(count))]
+
+    def _unroll(self, loop: While, start: tuple[Variable, float] | None) -> list[Statement]:
+        """
+        Statements which replace a loop, given the constant value
+        assigned to a variable just before it
+        """
+        counted = self._counted_loop(loop)
+        if counted is None:
+            return [loop]
+        i, end, work = counted
+
+        candidates = []
+        end_value = constant_value(end)
+        if start is not None and start[0] == i and start[1].is_integer() and end_value is not None:
+            count = max(ceil(end_value - start[1]), 0)
+            candidates.append(self._iterations(i, work, start[1], count))
+        for factor in range(self.factor, 1, -1):
+            condition = BinaryOperation(
+                BinaryOperation(i, Literal(str(factor - 1)), Operator.ADD), end, Operator.LT
+            )
+            candidates.append([While(condition, Group(self._iterations(i, work, None, factor))), loop])
+
+        for statements in candidates:
+            added = statement_count(Group(statements)) - statement_count(loop)
+            if added <= self.budget:
+                self.budget -= added
+                return statements
+        return [loop]
+
+
+class CommonSubexpressionEliminator:
+    """
+    Stores the result of a call to a pure function in a temporary variable
+    the first time it is evaluated, so later occurrences of the same call
+    read the variable instead of calling the function again.
+
+    A call can be reused until a statement changes one of the variables it
+    uses. Calls to other functions can change global variables, so calls which
+    use global variables are not reused past them. Other expressions are not
+    stored, since evaluating them again takes no ticks but storing them does.
+    """
+
+    def __init__(self, root: Statement, stats: "OptimizationStats"):
+        self.root = root
+        self.pure = pure_functions(root)
+        self.pointers = pointer_names(root)
+        self.stats = stats
+        self.temp_counter = 0
+        # the number of times each temporary variable is read
+        self.uses: dict[Variable, int] = {}
+        # the value assigned to each temporary variable
+        self.values: dict[Variable, Expression] = {}
+
+    def eliminate(self) -> Statement:
+        # variables declared at the top level are global
+        assert isinstance(self.root, Group)
+        root = Group(self._statements(self.root.statements, {}, frozenset(), False))
+
+        # temporary variables which are only read once save nothing
+        unused = {temp for temp, uses in self.uses.items() if uses == 1}
+        restored: dict[Expression, Expression] = {}
+        for temp in sorted(unused, key=lambda t: int(t.name[len("#cse") :])):
+            # a value can only contain temporary variables created before it
+            restored[temp] = substitute(self.values[temp], restored)
+        return map_statements(
+            substitute(root, restored),
+            lambda s: Group([i for i in s.statements if not self._is_unused(i, unused)])
+            if isinstance(s, Group)
+            else s,
+        )
+
+    def _is_unused(self, statement: Statement, unused: set[Variable]) -> bool:
+        return isinstance(statement, (Declaration, Assignment)) and statement.var in unused
+
+    def _statements(
+        self,
+        statements: tuple[Statement, ...],
+        available: dict[Expression, Variable],
+        local: frozenset[str],
+        declares_locals: bool = True,
+    ) -> list[Statement]:
+        """
+        Eliminate common subexpressions from a list of statements run one after the other.
+
+        `available` contains the calls which have already been stored in a variable,
+        and `local` is the set of variables in scope which cannot be changed by function calls.
+        """
+        result = []
+        available = dict(available)
+        for s in statements:
+            result += self._statement(s, available, local)
+            if declares_locals and isinstance(s, Declaration):
+                local = local | {s.var.name}
+        return result
+
+    def _block(
+        self, statement: Statement, available: dict[Expression, Variable], local: frozenset[str]
+    ) -> Statement:
+        statements = statement.statements if isinstance(statement, Group) else (statement,)
+        return Group(self._statements(statements, available, local))
+
+    def _statement(
+        self, statement: Statement, available: dict[Expression, Variable], local: frozenset[str]
+    ) -> list[Statement]:
+        """
+        Eliminate common subexpressions from a statement, returning the statements
+        to run in its place. `available` is updated with the calls which can be
+        reused after the statement.
+        """
+        setup: list[Statement] = []
+        impure = self._calls_impure(statement)
+        reuse = lambda e: self._reuse(e, available, local, impure, setup)
+
+        match statement:
+            case Assignment(var, val):
+                statement = Assignment(var, reuse(val))
+            case IndexAssignment(target, val):
+                statement = IndexAssignment(reuse(target), reuse(val))
+            case FunctionReturn(expr):
+                statement = FunctionReturn(reuse(expr))
+            case FunctionCallStatement(call):
+                statement = FunctionCallStatement(reuse(call))
+            case Free(pointer):
+                statement = Free(reuse(pointer))
+            case If(condition, contents, _else):
+                condition = reuse(condition)
+                statement = If(
+                    condition,
+                    self._block(contents, available, local),
+                    self._block(_else, available, local) if _else is not None else None,
+                )
+            case While(condition, contents):
+                # only calls which the loop cannot change are available in it
+                self._forget(available, statement, local, impure)
+                condition = self._reuse(condition, available, local, impure, None)
+                statement = While(condition, self._block(contents, available, local))
+            case Group(statements):
+                statement = Group(self._statements(statements, available, local))
+            case FunctionDefinition(_, _, params, body):
+                statement = replace(
+                    statement,
+                    body=self._block(body, {}, frozenset(p.var.name for p in params)),
+                )
+                return [statement]
+
+        self._forget(available, statement, local, impure)
+        return setup + [statement]
+
+    def _calls_impure(self, node: Expression | Statement) -> bool:
+        return any(isinstance(n, FunctionCall) and n.name not in self.pure for n in walk(node))
+
+    def _forget(
+        self,
+        available: dict[Expression, Variable],
+        statement: Statement,
+        local: frozenset[str],
+        impure: bool,
+    ):
+        """
+        Remove the calls which `statement` can change from `available`
+        """
+        changed = changed_names(statement)
+        for expr in list(available):
+            names = free_names(expr)
+            if len(names & changed) > 0 or (impure and not names <= local):
+                del available[expr]
+
+    def _reuse(
+        self,
+        expr: Expression,
+        available: dict[Expression, Variable],
+        local: frozenset[str],
+        impure: bool,
+        setup: list[Statement] | None,
+    ) -> Expression:
+        """
+        Replace the calls in an expression which are in `available` with the variable
+        holding their value. If `setup` is not None, calls which are not available are
+        stored in a new variable by statements added to `setup`, and become available.
+
+        `impure` is whether the statement containing the expression calls a function
+        which could change global variables.
+        """
+        reuse = lambda e: self._reuse(e, available, local, impure, setup)
+        if self._can_store(expr, local, impure):
+            if expr in available:
+                temp = available[expr]
+                self.uses[temp] += 1
+                self.stats.cse_hits[expr] = self.stats.cse_hits.get(expr, 0) + 1
+                return temp
+            if setup is not None:
+                value = FunctionCall(expr.name, [reuse(a) for a in expr.args])
+                temp = Variable(f"#cse{self.temp_counter}")
+                self.temp_counter += 1
+                setup.extend([Declaration(temp, DesmosType("num")), Assignment(temp, value)])
+                available[expr] = temp
+                self.uses[temp] = 1
+                self.values[temp] = value
+                return temp
+
+        match expr:
+            case BinaryOperation(arg1, arg2, Operator.AND | Operator.OR as op):
+                # calls in the second argument only run if the first one does not
+                # decide the result, so they are not stored before the statement
+                return BinaryOperation(reuse(arg1), self._reuse(arg2, available, local, impure, None), op)
+            case BinaryOperation(arg1, arg2, op):
+                return BinaryOperation(reuse(arg1), reuse(arg2), op)
+            case UnaryOperation(arg, op):
+                return UnaryOperation(reuse(arg), op)
+            case FunctionCall(name, args):
+                return FunctionCall(name, [reuse(a) for a in args])
+            case Alloc(size):
+                return Alloc(reuse(size))
+            case Index(array, index):
+                return Index(array, reuse(index))
+            case Slice(array, start, end):
+                return Slice(array, reuse(start), reuse(end))
+            case _:
+                return expr
+
+    def _can_store(self, expr: Expression, local: frozenset[str], impure: bool) -> bool:
+        if not isinstance(expr, FunctionCall) or expr.name not in self.pure:
+            return False
+        if uses_heap(expr, self.pointers) or any(isinstance(n, Comprehension) for n in walk(expr)):
+            return False
+        # other calls in the statement could change global variables before it is evaluated
+        return not impure or free_names(expr) <= local
+
+
+def _declared(statements: tuple[Statement, ...]) -> list[str]:
+    """
+    Names of the variables declared by statements in the same scope
+    """
+    names = []
+    for s in statements:
+        if isinstance(s, Declaration):
+            names.append(s.var.name)
+        elif isinstance(s, Group):
+            # a group inside another one does not create a scope
+            names += _declared(s.statements)
+    return names
+
+
+class DeadCodeEliminator:
+    """
+    Removes code which cannot change the output of the program: functions which
+    are never called, statements which never run, assignments whose value is
+    never read, and declarations of variables which are never read.
+
+    Calls to functions which are not pure are kept even if their value is not
+    used, and so are allocations since they exit the program when the heap is full.
+    Arrays are always kept. Statements which would not compile are removed too, so
+    `Compiler` compiles the program before it is optimized to find their errors.
+    """
+
+    def __init__(self, root: Statement):
+        self.root = root
+
+    def eliminate(self) -> Statement:
+        # removing code can make more code unused, so repeat until nothing changes
+        root = self.root
+        while True:
+            new_root = self._eliminate_once(root)
+            if new_root == root:
+                return root
+            root = new_root
+
+    def _eliminate_once(self, root: Statement) -> Statement:
+        # variables declared at the top level are global
+        assert isinstance(root, Group)
+        root = self._remove_uncalled(root)
+        self.pure = pure_functions(root)
+        # the output is read when the program finishes, and assignments are
+        # kept if their side effects cannot be separated from the value
+        self.read = read_names(root) | {"IN", "OUT"}
+        self.read |= {
+            n.var.name for n in walk(root) if isinstance(n, Assignment) and self._side_effects(n.val) is None
+        }
+        self.arrays = {
+            n.var.name for n in walk(root) if isinstance(n, Declaration) and isinstance(n.type, ArrayType)
+        }
+        self.globals = frozenset(_declared(root.statements)) | {"IN", "OUT"}
+        return Group(
+            self._statements(root.statements, frozenset({"IN", "OUT"}), frozenset(), frozenset(), False)
+        )
+
+    def _remove_uncalled(self, root: Group) -> Group:
+        definitions = [s for s in root.statements if isinstance(s, FunctionDefinition)]
+        bodies = {d.name: d.body for d in definitions}
+        called = {
+            n.name
+            for s in root.statements
+            if not isinstance(s, FunctionDefinition)
+            for n in walk(s)
+            if isinstance(n, FunctionCall)
+        }
+        unvisited = list(called)
+        while len(unvisited) > 0:
+            name = unvisited.pop()
+            for n in walk(bodies[name]) if name in bodies else []:
+                if isinstance(n, FunctionCall) and n.name not in called:
+                    called.add(n.name)
+                    unvisited.append(n.name)
+
+        # functions defined twice are kept so the error is found
+        definition_counts = Counter(d.name for d in definitions)
+        defined_twice = {name for name, count in definition_counts.items() if count > 1}
+        return Group(
+            [
+                s
+                for s in root.statements
+                if not isinstance(s, FunctionDefinition) or s.name in called | defined_twice
+            ]
+        )
+
+    def _statements(
+        self,
+        statements: tuple[Statement, ...],
+        scope: frozenset[str],
+        local: frozenset[str],
+        dead_end: frozenset[str],
+        declares_locals: bool = True,
+    ) -> list[Statement]:
+        """
+        Remove dead code from a list of statements run one after the other in the same scope.
+
+        `scope` is the set of variables in scope, `local` is the set of variables in scope
+        which cannot be read by function calls, and `dead_end` is the set of variables
+        whose value is not used after the statements.
+        """
+        declared = Counter(_declared(statements))
+
+        # statements which can run, with the variables in scope before each one
+        reachable: list[tuple[Statement, frozenset[str], frozenset[str]]] = []
+        pending = deque(statements)
+        while len(pending) > 0:
+            s = pending.popleft()
+            if isinstance(s, Group):
+                pending.extendleft(reversed(s.statements))
+                continue
+            replacement = self._simplify(s, scope, declared)
+            if isinstance(s, Declaration):
+                scope = scope | {s.var.name}
+                if declares_locals:
+                    local = local | {s.var.name}
+            if replacement is not None:
+                pending.extendleft(reversed(replacement))
+                continue
+            reachable.append((s, scope, local))
+            if always_returns(s):
+                break
+
+        # go backwards to find the variables whose value is not used after each statement
+        dead = set(dead_end) | {s.var.name for s, _, _ in reachable if isinstance(s, Declaration)}
+        result: list[Statement] = []
+        for s, scope, local in reversed(reachable):
+            match s:
+                case Assignment(var, val) if self._is_removable(var, scope) and var.name in dead:
+                    effects = self._side_effects(val)
+                    if effects is not None:
+                        for e in reversed(effects):
+                            dead = self._dead_before(e, dead, local)
+                            result.append(e)
+                        continue
+                case If(condition, contents, _else):
+                    s = If(
+                        condition,
+                        self._block(contents, scope, local, dead),
+                        self._block(_else, scope, local, dead) if _else is not None else None,
+                    )
+                case While(condition, contents):
+                    # the body is followed by either the next iteration or the code after the loop
+                    s = While(condition, self._block(contents, scope, local, self._dead_before(s, dead, local)))
+                case FunctionDefinition(_, _, params, body):
+                    names = frozenset(p.var.name for p in params)
+                    s = replace(s, body=self._block(body, self.globals | names, names, names))
+            dead = self._dead_before(s, dead, local)
+            result.append(s)
+        result.reverse()
+        return result
+
+    def _block(
+        self, statement: Statement, scope: frozenset[str], local: frozenset[str], dead_end: set[str]
+    ) -> Statement:
+        statements = statement.statements if isinstance(statement, Group) else (statement,)
+        return Group(self._statements(statements, scope, local, frozenset(dead_end)))
+
+    def _is_removable(self, var: Variable, scope: frozenset[str]) -> bool:
+        return var.name in scope and var.name not in self.arrays
+
+    def _simplify(
+        self, statement: Statement, scope: frozenset[str], declared: Counter[str]
+    ) -> list[Statement] | None:
+        """
+        Statements to run in place of a statement which do the same thing with less code,
+        or None if the statement is kept
+        """
+        match statement:
+            case Assignment(var, val) if var.name not in self.read and self._is_removable(var, scope):
+                return self._side_effects(val)
+            case Declaration(var, var_type) if (
+                var.name not in self.read
+                and not isinstance(var_type, ArrayType)
+                # declaring a variable which already exists is an error
+                and var.name not in scope
+                and declared[var.name] == 1
+            ):
+                return []
+            case FunctionCallStatement(call) if call.name in self.pure:
+                return self._side_effects(call)
+            case If(condition, contents, _else) if constant_value(condition) is not None:
+                branch = contents if constant_value(condition) == 1 else _else
+                if branch is None:
+                    return []
+                statements = branch.statements if isinstance(branch, Group) else (branch,)
+                if len(_declared(statements)) == 0:
+                    return list(statements)
+                # the branch has its own scope
+                simplified = If(Literal("1"), branch, None)
+                return [simplified] if simplified != statement else None
+            case If(condition, Group(()), None | Group(())):
+                return self._side_effects(condition)
+            case While(condition, _) if constant_value(condition) not in (None, 1):
+                return []
+        return None
+
+    def _side_effects(self, expr: Expression) -> list[Statement] | None:
+        """
+        Statements which do everything evaluating an expression does except give its value,
+        or None if they cannot be separated from it
+        """
+        if isinstance(expr, FunctionCall) and expr.name not in self.pure:
+            return [FunctionCallStatement(expr)]
+        if isinstance(expr, Alloc):
+            # allocating exits the program if there is not enough heap memory,
+            # and there is no statement which allocates without a pointer to the block
+            return None
+        if isinstance(expr, Comprehension):
+            # calls in a comprehension would run for every element
+            return None if contains_call(expr) else []
+        if isinstance(expr, BinaryOperation) and expr.op in (Operator.AND, Operator.OR):
+            # calls in the second argument only run if the first one does not decide the result
+            if self._side_effects(expr.arg2) != []:
+                return None
+        effects = []
+        for name in expr.__match_args__:
+            value = getattr(expr, name)
+            for child in value if isinstance(value, tuple) else [value]:
+                if isinstance(child, Expression):
+                    child_effects = self._side_effects(child)
+                    if child_effects is None:
+                        return None
+                    effects += child_effects
+        return effects
+
+    def _dead_before(self, statement: Statement, dead: set[str], local: frozenset[str]) -> set[str]:
+        """
+        Variables whose value is not used after the start of a statement,
+        given the variables whose value is not used after it (`dead`)
+        """
+        match statement:
+            case Assignment(var, _):
+                dead = dead | {var.name}
+            case Declaration(var, _):
+                # the variable before the declaration is a different one
+                dead = dead - {var.name}
+            case FunctionReturn(_):
+                dead = set(local)
+        dead = dead - read_names(statement)
+        if any(isinstance(n, FunctionCall) and n.name not in self.pure for n in walk(statement)):
+            # the function can read global variables
+            dead = dead & local
+        elif any(isinstance(n, FunctionReturn) for n in walk(statement)):
+            # and so can the caller after a return inside the statement
+            dead = dead & local
+        return dead
+
+
+@dataclass
+class OptimizationStats:
+    """
+    cse_hits -- number of times each call was reused instead of evaluated again
+    """
+
+    cse_hits: dict[Expression, int] = field(default_factory=dict)
+
+
+def optimize(
+    root: Statement,
+    stats: OptimizationStats | None = None,
+    unroll_budget: int = UNROLL_BUDGET,
+    unroll_factor: int = UNROLL_FACTOR,
+) -> Statement:
+    """
+    Rewrite a syntax tree into an equivalent one which runs in fewer ticks.
+    Loops are unrolled until `unroll_budget` statements have been added (see `LoopUnroller`).
+    """
+    stats = stats if stats is not None else OptimizationStats()
+    pointers = pointer_names(root)
+    root = map_statements(root, lambda s: vectorize_counted_loop(s, pointers))
+    root = LoopUnroller(root, unroll_budget, unroll_factor).unroll()
+    root = LoopInvariantHoister(root).hoist()
+    root = CommonSubexpressionEliminator(root, stats).eliminate()
+    root = DeadCodeEliminator(root).eliminate()
+    return root
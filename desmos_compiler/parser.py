@@ -1,28 +1,54 @@
+import lark
 from lark import Lark, Transformer, exceptions
 from desmos_compiler.syntax_tree import (
+    Alloc,
+    ArrayType,
     Assignment,
     BinaryOperation,
+    Comprehension,
     Declaration,
     DesmosType,
+    Free,
     FunctionCall,
     FunctionCallStatement,
     FunctionParameter,
     FunctionDefinition,
     FunctionReturn,
     If,
+    Index,
+    IndexAssignment,
+    Length,
+    ListOperator,
     Literal,
     Group,
     Operator,
+    Range,
+    Reduction,
+    Slice,
     Statement,
+    UnaryOperation,
     Variable,
     While,
+    walk,
 )
+from functools import cache
+from hashlib import sha256
 from pathlib import Path
 
-# TODO: add -$x with highest priority expr in the grammar
+GRAMMAR_PATH = Path(__file__).resolve().parent / "grammar.lark"
+
+# parser tables built from the grammar, shipped with the package (see `save_parser`)
+PARSER_PATH = GRAMMAR_PATH.with_suffix(".lalr")
+
+REDUCTIONS = {op.value for op in ListOperator}
 
 
 class SyntaxTreeTransformer(Transformer):
+    def __init__(self):
+        super().__init__()
+        # number of switch statements which needed a variable for their value
+        self.switch_count = 0
+
     VAR = lambda _, x: Variable(x.value)
     NUM = lambda _, x: Literal(x.value)
 
@@ -31,7 +57,9 @@ class SyntaxTreeTransformer(Transformer):
     start = lambda _, x: Group(x)
 
     declaration = lambda _, x: Declaration(x[1], x[0])
+    array_declaration = lambda _, x: Declaration(x[1], ArrayType(x[0].type, int(x[2])))
     assignment = lambda _, x: Assignment(x[0], x[1])
+    index_assignment = lambda _, x: IndexAssignment(x[0], x[1])
 
     if_only = lambda _, x: If(x[0], Group(x[1:]), None)
     else_ = lambda _, x: Group(x)
@@ -40,33 +68,118 @@ class SyntaxTreeTransformer(Transformer):
         if_, else_ = args
         return If(if_.condition, if_.contents, else_)
 
+    def switch_(self, args):
+        value, *cases = args
+        default = cases.pop() if len(cases) > 0 and isinstance(cases[-1], Group) else None
+
+        # a switch is the same as a chain of ifs comparing the value to each case,
+        # which the compiler turns back into a jump table (see `Compiler.switch_cases`)
+        statements = []
+        if any(isinstance(n, (FunctionCall, Alloc)) for n in walk(value)):
+            # the value is only evaluated once
+            var = Variable(f"#switch{self.switch_count}")
+            self.switch_count += 1
+            statements += [Declaration(var, DesmosType("num")), Assignment(var, value)]
+            value = var
+
+        chain = default
+        for numbers, contents in reversed(cases):
+            condition = BinaryOperation(value, numbers[0], Operator.EQ)
+            for n in numbers[1:]:
+                condition = BinaryOperation(condition, BinaryOperation(value, n, Operator.EQ), Operator.OR)
+            chain = If(condition, contents, chain)
+        if chain is None:
+            chain = Group([])
+        return chain if len(statements) == 0 else Group(statements + [chain])
+
+    case_ = lambda _, x: (x[0], Group(x[1:]))
+    case_values = lambda _, x: x
+    default_ = lambda _, x: Group(x)
+
     while_ = lambda _, x: While(x[0], Group(x[1:]))
 
     function_def = lambda _, x: FunctionDefinition(x[1], x[0], x[2], Group(x[3:]))
     param_list = lambda _, x: x
     func_param = lambda _, x: FunctionParameter(x[1], x[0])
 
-    function_call = lambda _, x: FunctionCall(x[0], x[1])
+    def function_call(self, args):
+        name, arg_list = args
+        # sum, min and max of a single list are built in
+        if name.name in REDUCTIONS and len(arg_list) == 1:
+            return Reduction(ListOperator(name.name), arg_list[0])
+        return FunctionCall(name, arg_list)
+
     arg_list = lambda _, x: x
 
     function_return = lambda _, x: FunctionReturn(x[0])
 
-    function_call_statement = lambda _, x: FunctionCallStatement(x[0])
+    function_call_statement = lambda _, x: FunctionCallStatement(FunctionCall(x[0], x[1]))
+
+    alloc = lambda _, x: Alloc(x[0])
+    free = lambda _, x: Free(x[0])
+
+    index = lambda _, x: Index(x[0], x[1])
+    slice = lambda _, x: Slice(x[0], x[1], x[2])
+    length = lambda _, x: Length(x[0])
+    range_ = lambda _, x: Range(x[0], x[1])
+
+    def comprehension(self, args):
+        expr, var, source, *condition = args
+        return Comprehension(expr, var, source, condition[0] if condition else None)
 
     parens_expr = lambda _, x: x[0]
     binary_expr = lambda _, x: BinaryOperation(x[0], x[2], Operator(x[1].value))
+    unary_expr = lambda _, x: UnaryOperation(x[1], Operator(x[0].value))
 
 class ParserError(Exception):
     pass
 
-def parse(program: str) -> Statement:
+def _parser_header(grammar: str) -> bytes:
+    """
+    First line of the saved parser, which must match for it to be used
+    """
+    return f"{lark.__version__} {sha256(grammar.encode()).hexdigest()}\n".encode()
+
+
+def save_parser():
+    """
+    Build the parser tables for the grammar and save them to `PARSER_PATH`.
+
+    This must be run after changing the grammar, otherwise `load_parser`
+    ignores the saved tables and builds them every time.
+    """
+    with open(GRAMMAR_PATH, "r") as f:
+        grammar = f.read()
+    with open(PARSER_PATH, "wb") as f:
+        f.write(_parser_header(grammar))
+        Lark(grammar, parser="lalr").save(f)
+
+
+@cache
+def load_parser() -> Lark:
+    """
+    Load the parser saved by `save_parser`, or build it from the grammar
+    if it was saved for a different grammar or version of lark
+    """
     try:
-        with open(Path(__file__).resolve().parent / "grammar.lark", "r") as f:
+        with open(GRAMMAR_PATH, "r") as f:
             grammar = f.read()
-        l = Lark(grammar, parser="earley")
-    except:
+    except OSError:
         raise ParserError("Could not read grammar file")
 
+    try:
+        with open(PARSER_PATH, "rb") as f:
+            if f.readline() == _parser_header(grammar):
+                return Lark.load(f)
+    except OSError:
+        pass
+
+    return Lark(grammar, parser="lalr")
+
+
+def parse(program: str) -> Statement:
+    l = load_parser()
+
     try:
         tree = l.parse(program)
         tree = SyntaxTreeTransformer().transform(tree)
@@ -76,4 +189,15 @@ def parse(program: str) -> Statement:
         message += "\n\n" + e._context
         message += e._format_expected(e.allowed)
         raise ParserError(message)
+    except exceptions.UnexpectedToken as e:
+        if e.token.type == "$END":
+            message = "Unexpected end of program\n\n"
+        else:
+            message = f"Unexpected {e.token} at line {e.line} col {e.column}"
+            message += "\n\n" + e.get_context(program)
+        message += e._format_expected(e.accepts or e.expected)
+        raise ParserError(message)
+
 
+if __name__ == "__main__":
+    save_parser()
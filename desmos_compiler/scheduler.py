@@ -0,0 +1,314 @@
+import re
+from dataclasses import dataclass
+
+from desmos_compiler.assembler import DONE, IN, LABEL_REF, LINE, OUT, iter_assembly
+from desmos_compiler.minify import is_name, tokenize
+
+NEXTLINE = "NEXTLINE"
+
+# substitutions made by the assembler, as the variables they stand for
+KEYWORDS = {"LINE": LINE, "IN": IN, "OUT": OUT, "DONE": DONE}
+
+
+def split_top_level(latex: str, separator: str) -> list[str]:
+    """
+    Split latex at each separator which is not inside brackets
+    """
+    parts = []
+    depth = 0
+    start = 0
+    i = 0
+    while i < len(latex):
+        c = latex[i]
+        if c in "([{":
+            depth += 1
+        elif c in ")]}":
+            depth -= 1
+        elif depth == 0 and latex.startswith(separator, i):
+            parts.append(latex[start:i].strip())
+            i += len(separator)
+            start = i
+            continue
+        i += 1
+    parts.append(latex[start:].strip())
+    return parts
+
+
+def _unwrap(latex: str, open: str, close: str) -> str | None:
+    """
+    The latex inside of a pair of brackets enclosing all of `latex`, or None if it is not enclosed
+    """
+    if not (latex.startswith(open) and latex.endswith(close)):
+        return None
+    inner = latex[len(open) : len(latex) - len(close)]
+    depth = 0
+    for c in inner:
+        if c in "([{":
+            depth += 1
+        elif c in ")]}":
+            depth -= 1
+            if depth < 0:
+                # the opening bracket is closed before the end
+                return None
+    return inner
+
+
+def latex_names(latex: str) -> set[str]:
+    """
+    Names of the variables used in latex, which can contain assembly keywords
+    """
+    for keyword, name in KEYWORDS.items():
+        latex = re.sub(rf"\b{keyword}\b", name, latex)
+    # line numbers of labels are constants
+    latex = re.sub(LABEL_REF, "0", latex)
+    return {t for t in tokenize(latex) if is_name(t)}
+
+
+def derived_names(program: str) -> dict[str, set[str]]:
+    """
+    Variables which each `expr` of a program written in Desmos assembly depends on,
+    since reading the expression reads all of them
+    """
+    uses = {}
+    for instruction, contents in iter_assembly(program):
+        if instruction == "expr":
+            name, latex = contents.split("=", 1)
+            uses[name.strip()] = latex_names(latex)
+
+    derived = {}
+    for name in uses:
+        names = set()
+        todo = [name]
+        while len(todo) > 0:
+            for n in uses[todo.pop()]:
+                if n not in names:
+                    names.add(n)
+                    if n in uses:
+                        todo.append(n)
+        derived[name] = names
+    return derived
+
+
+@dataclass
+class AssemblyLine:
+    """
+    A line of Desmos assembly, which is either a list of actions run together,
+    or a choice between lists of actions when `piecewise` is True.
+
+    branches -- the condition (None for the default) and actions of each choice
+    reads, writes -- the variables read and assigned by any of the actions or conditions
+    """
+
+    piecewise: bool
+    branches: list[tuple[str | None, list[str]]]
+    reads: set[str]
+    writes: set[str]
+
+    @property
+    def is_simple(self) -> bool:
+        """
+        Whether the line only runs actions which do not use
+        the line register and then continues to the next line
+        """
+        if self.piecewise or self.branches[0][1].count(NEXTLINE) != 1:
+            return False
+        rest = ", ".join(a for a in self.branches[0][1] if a != NEXTLINE)
+        return DONE not in self.writes and LINE not in latex_names(rest)
+
+    @property
+    def latex(self) -> str:
+        if not self.piecewise:
+            return ", ".join(self.branches[0][1])
+        parts = []
+        for condition, actions in self.branches:
+            value = actions[0] if len(actions) == 1 else rf"\left({', '.join(actions)}\right)"
+            parts.append(value if condition is None else f"{condition}: {value}")
+        return r"\left\{" + ", ".join(parts) + r"\right\}"
+
+
+def action_names(action: str, derived: dict[str, set[str]]) -> tuple[set[str], set[str]] | None:
+    """
+    Names of the variables read and assigned by an action,
+    or None if it is not an action the scheduler understands
+    """
+    if action == NEXTLINE:
+        return {LINE}, {LINE}
+    if re.fullmatch(r"GOTO \w+", action):
+        return set(), {LINE}
+    if action.startswith("GOTO "):
+        # a computed jump
+        reads = latex_names(action[len("GOTO ") :])
+        for n in list(reads):
+            reads |= derived.get(n, set())
+        return reads, {LINE}
+    parts = split_top_level(action, "\\to")
+    target = KEYWORDS.get(parts[0], parts[0])
+    if len(parts) != 2 or not is_name(target):
+        return None
+    reads = latex_names(parts[1])
+    for n in list(reads):
+        reads |= derived.get(n, set())
+    return reads, {target}
+
+
+def make_line(
+    piecewise: bool, branches: list[tuple[str | None, list[str]]], derived: dict[str, set[str]]
+) -> AssemblyLine | None:
+    reads, writes = set(), set()
+    for condition, actions in branches:
+        if condition is not None:
+            for n in latex_names(condition):
+                reads |= {n} | derived.get(n, set())
+        for a in actions:
+            names = action_names(a, derived)
+            if names is None:
+                return None
+            reads |= names[0]
+            writes |= names[1]
+    return AssemblyLine(piecewise, branches, reads, writes)
+
+
+def parse_line(latex: str, derived: dict[str, set[str]]) -> AssemblyLine | None:
+    """
+    Find the actions of a line of Desmos assembly,
+    or None if it is not in a form the scheduler understands.
+
+    `derived` contains the variables each expression depends on (see `derived_names`).
+    """
+    latex = latex.strip()
+    inner = _unwrap(latex, r"\left\{", r"\right\}")
+    if inner is None:
+        return make_line(False, [(None, split_top_level(latex, ","))], derived)
+
+    branches = []
+    for branch in split_top_level(inner, ","):
+        parts = split_top_level(branch, ":")
+        if len(parts) > 2:
+            return None
+        condition, value = (None, parts[0]) if len(parts) == 1 else parts
+        actions = _unwrap(value, r"\left(", r"\right)")
+        branches.append((condition, split_top_level(actions if actions is not None else value, ",")))
+    return make_line(True, branches, derived)
+
+
+def merge_lines(
+    first: AssemblyLine, second: AssemblyLine, derived: dict[str, set[str]]
+) -> AssemblyLine | None:
+    """
+    A line which does the same as `first` followed by `second` in a single tick,
+    or None if they cannot run at the same time.
+
+    The actions of `second` replace NEXTLINE in `first`, so they only run when
+    the program would have continued to `second`. Every action reads the values
+    from before the tick, so `second` cannot use a variable assigned by `first`.
+    """
+    if first.piecewise and second.piecewise:
+        return None
+    branches = []
+    for condition, actions in first.branches:
+        if NEXTLINE not in actions:
+            branches.append((condition, actions))
+            continue
+        rest = [a for a in actions if a != NEXTLINE]
+        assigned = {action_names(a, derived)[1].pop() for a in rest}
+        if not assigned.isdisjoint(second.reads | second.writes):
+            return None
+        if second.piecewise:
+            return make_line(True, [(c, rest + a) for c, a in second.branches], derived)
+        branches.append((condition, rest + second.branches[0][1]))
+    if branches == first.branches:
+        return None
+    return make_line(first.piecewise, branches, derived)
+
+
+def pack_ticks(lines: list[AssemblyLine]) -> list[list[int]]:
+    """
+    Schedule simple lines which run one after the other into as few ticks as possible,
+    returning the indices of the lines to run in each tick.
+
+    Each line goes in the first tick after every earlier line it depends on:
+    lines which assign a variable it reads or assigns must be in an earlier tick,
+    and lines which read a variable it assigns must not be in a later one.
+    """
+    last_read: dict[str, int] = {}
+    last_write: dict[str, int] = {}
+    ticks: list[list[int]] = []
+    for i, line in enumerate(lines):
+        reads = line.reads - {LINE}
+        writes = line.writes - {LINE}
+        tick = max(
+            [last_write[n] + 1 for n in reads | writes if n in last_write]
+            + [last_read[n] for n in writes if n in last_read]
+            + [0]
+        )
+        if tick == len(ticks):
+            ticks.append([])
+        ticks[tick].append(i)
+        for n in reads:
+            last_read[n] = max(last_read.get(n, tick), tick)
+        for n in writes:
+            last_write[n] = max(last_write.get(n, tick), tick)
+    return ticks
+
+
+def schedule(program: str) -> str:
+    """
+    Pack the actions of a program written in Desmos assembly into fewer lines.
+
+    Lines between labels are combined when their actions can run in the same
+    tick without changing what they do. Runs of simple lines (see
+    `AssemblyLine.is_simple`) are reordered to fit the most actions in each tick.
+    """
+    derived = derived_names(program)
+    result: list[str] = []
+    # lines since the last label, with their actions if they could be found
+    block: list[tuple[str, AssemblyLine | None]] = []
+    simple: list[tuple[str, AssemblyLine]] = []
+
+    def add(line: str, parsed: AssemblyLine | None):
+        if len(block) > 0 and block[-1][1] is not None and parsed is not None:
+            merged = merge_lines(block[-1][1], parsed, derived)
+            if merged is not None:
+                block[-1] = (merged.latex, merged)
+                return
+        block.append((line, parsed))
+
+    def flush_simple():
+        for tick in pack_ticks([parsed for _, parsed in simple]):
+            if len(tick) == 1:
+                add(*simple[tick[0]])
+                continue
+            actions = [a for i in tick for a in simple[i][1].branches[0][1] if a != NEXTLINE]
+            packed = make_line(False, [(None, actions + [NEXTLINE])], derived)
+            add(packed.latex, packed)
+        simple.clear()
+
+    def flush_block():
+        flush_simple()
+        result.extend(f"line {line}\n" for line, _ in block)
+        block.clear()
+
+    for instruction, contents in iter_assembly(program):
+        if instruction != "line":
+            flush_block()
+            result.append(f"{instruction} {contents}\n")
+            continue
+        parsed = parse_line(contents, derived)
+        if parsed is not None and parsed.is_simple:
+            simple.append((contents, parsed))
+            continue
+        flush_simple()
+        add(contents, parsed)
+    flush_block()
+    return "".join(result)
+
+
+def count_actions(line: str) -> int:
+    """
+    Number of actions run by a line of Desmos assembly,
+    counting the choice with the most actions for a piecewise line
+    """
+    parsed = parse_line(line, {})
+    if parsed is None:
+        return 1
+    return max(len(actions) for _, actions in parsed.branches)
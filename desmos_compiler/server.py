@@ -0,0 +1,363 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, fields
+from hashlib import sha256
+from time import perf_counter
+from typing import Awaitable, Callable
+
+from desmos_compiler.assembler import assemble
+from desmos_compiler.compiler import CompilerError, StackPages, compile_syntax_tree
+from desmos_compiler.defaults import EVAL_STEPS, HEAP_SIZE, MAX_LIST_LENGTH, UNROLL_BUDGET
+from desmos_compiler.evaluator import EvaluationError
+from desmos_compiler.parser import ParserError, load_parser, parse
+
+# number of artifacts (syntax trees, assembly and javascript) kept in memory
+CACHE_SIZE = 256
+
+# number of recent requests to each endpoint used for the latency percentiles
+LATENCY_WINDOW = 1000
+
+STAGES = ["parse", "compile", "assemble"]
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+}
+
+# smallest value of each number option (stack_pages, chunk_size and block_size can also be null)
+OPTION_MINIMUMS = {
+    "heap_size": 1,
+    "stack_pages": 1,
+    "page_size": 1,
+    "eval_steps": 0,
+    "unroll_budget": 0,
+    "chunk_size": 1,
+    "block_size": 1,
+}
+
+# errors in the program being compiled, as opposed to errors in the server
+PROGRAM_ERRORS = (ParserError, CompilerError, EvaluationError)
+
+
+@dataclass(frozen=True)
+class CompileOptions:
+    """
+    Options of a request, with the same meaning as the arguments of `desmoscc`
+    """
+
+    heap_size: int = HEAP_SIZE
+    stack_pages: int | None = None
+    page_size: int = MAX_LIST_LENGTH
+    eval_steps: int = EVAL_STEPS
+    unroll_budget: int = UNROLL_BUDGET
+    minify: bool = False
+    chunk_size: int | None = None
+    block_size: int | None = None
+
+    @staticmethod
+    def from_json(options: dict) -> "CompileOptions":
+        names = {f.name for f in fields(CompileOptions)}
+        for name, value in options.items():
+            if name not in names:
+                raise ValueError(f"Unknown option {name}")
+            if value is not None and (type(value) is not (bool if name == "minify" else int)):
+                raise ValueError(f"Option {name} has the wrong type")
+            if name in OPTION_MINIMUMS and value is not None and value < OPTION_MINIMUMS[name]:
+                raise ValueError(f"Option {name} must be at least {OPTION_MINIMUMS[name]}")
+        return CompileOptions(**options)
+
+    def compiler_options(self) -> tuple:
+        """
+        The options which change the assembly (the rest only change the javascript)
+        """
+        # the page size is only used if the stack is split into pages
+        page_size = self.page_size if self.stack_pages is not None else None
+        return (self.heap_size, self.stack_pages, page_size, self.eval_steps, self.unroll_budget)
+
+
+# stages of the pipeline, which are run in the worker processes
+
+
+def parse_program(program: str) -> str:
+    return str(parse(program))
+
+
+def compile_program(program: str, options: CompileOptions) -> str:
+    stack_pages = None
+    if options.stack_pages is not None:
+        stack_pages = StackPages(options.page_size, options.stack_pages)
+    return compile_syntax_tree(
+        parse(program), options.heap_size, stack_pages, options.eval_steps, options.unroll_budget
+    )
+
+
+def assemble_program(assembly: str, options: CompileOptions) -> str:
+    return assemble(assembly, options.minify, options.chunk_size, options.block_size)
+
+
+@dataclass
+class EndpointMetrics:
+    count: int = 0
+    errors: int = 0
+    total_seconds: float = 0
+    latencies: deque = field(default_factory=lambda: deque(maxlen=LATENCY_WINDOW))
+
+    def add(self, seconds: float, error: bool):
+        self.count += 1
+        self.errors += error
+        self.total_seconds += seconds
+        self.latencies.append(seconds)
+
+    def to_json(self) -> dict:
+        latencies = sorted(self.latencies)
+        percentile = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean_ms": self.total_seconds / self.count * 1000,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "max_ms": latencies[-1] * 1000,
+        }
+
+
+class CompileServer:
+    """
+    Compiles programs for many requests without starting a new process for each one.
+
+    The stages of the pipeline run in a pool of `workers` processes, each of which
+    keeps its parser loaded, so the event loop only reads requests and writes responses.
+    The results of recent requests are kept in memory, and a request for an artifact
+    which is already being made waits for it instead of making it again.
+    """
+
+    def __init__(self, workers: int = os.cpu_count() or 1, cache_size: int = CACHE_SIZE):
+        self.workers = workers
+        # forked workers would keep copies of open connections, so they could not be closed
+        context = multiprocessing.get_context("forkserver")
+        self.pool = ProcessPoolExecutor(workers, context, initializer=load_parser)
+        self.cache: OrderedDict[tuple, asyncio.Future] = OrderedDict()
+        self.cache_size = cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # jobs given to the pool which have not finished
+        self.in_flight = 0
+        self.max_queue_depth = 0
+        self.endpoints = {stage: EndpointMetrics() for stage in STAGES}
+
+    def queue_depth(self) -> int:
+        """
+        Number of jobs waiting for a free worker
+        """
+        return max(0, self.in_flight - self.workers)
+
+    async def run_job(self, f: Callable, *args) -> str:
+        self.in_flight += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth())
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.pool, f, *args)
+        finally:
+            self.in_flight -= 1
+
+    def artifact(self, key: tuple, make: Callable[[], Awaitable[str]]) -> asyncio.Future:
+        """
+        The cached artifact for `key`, or a new one made by `make`
+        """
+        if key in self.cache:
+            self.cache_hits += 1
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        self.cache_misses += 1
+        future = asyncio.ensure_future(make())
+        self.cache[key] = future
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+        def forget_error(f: asyncio.Future):
+            # errors are not kept, so a failing request can be retried
+            if (f.cancelled() or f.exception() is not None) and self.cache.get(key) is f:
+                del self.cache[key]
+
+        future.add_done_callback(forget_error)
+        return future
+
+    async def run_stage(self, stage: str, request: dict) -> dict:
+        options = CompileOptions.from_json(request.get("options", {}))
+        if stage == "assemble" and isinstance(request.get("assembly"), str):
+            assembly = request["assembly"]
+        else:
+            program = request.get("program")
+            if not isinstance(program, str):
+                raise ValueError("The request must have a program")
+            digest = sha256(program.encode()).hexdigest()
+            if stage == "parse":
+                tree = await self.artifact(("parse", digest), lambda: self.run_job(parse_program, program))
+                return {"syntax_tree": tree}
+            assembly = await self.artifact(
+                ("compile", digest, options.compiler_options()),
+                lambda: self.run_job(compile_program, program, options),
+            )
+            if stage == "compile":
+                return {"assembly": assembly}
+
+        digest = sha256(assembly.encode()).hexdigest()
+        js = await self.artifact(
+            ("assemble", digest, options.minify, options.chunk_size, options.block_size),
+            lambda: self.run_job(assemble_program, assembly, options),
+        )
+        return {"js": js}
+
+    def metrics(self) -> dict:
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth(),
+            "max_queue_depth": self.max_queue_depth,
+            "cache": {"entries": len(self.cache), "hits": self.cache_hits, "misses": self.cache_misses},
+            "requests": {stage: m.to_json() for stage, m in self.endpoints.items() if m.count > 0},
+        }
+
+    async def respond(self, method: str, path: str, body: bytes) -> tuple[int, dict]:
+        """
+        The status and JSON response for a request
+        """
+        if path == "/metrics":
+            if method != "GET":
+                return 405, {"error": "Use GET for /metrics"}
+            return 200, self.metrics()
+        stage = path.removeprefix("/")
+        if stage not in STAGES:
+            return 404, {"error": f"Unknown path {path}"}
+        if method != "POST":
+            return 405, {"error": f"Use POST for {path}"}
+
+        start = perf_counter()
+        queue_depth = self.queue_depth()
+        status = 200
+        try:
+            request = json.loads(body)
+            if not isinstance(request, dict):
+                raise ValueError("The request must be a JSON object")
+            response = await self.run_stage(stage, request)
+        except (ValueError,) + PROGRAM_ERRORS as e:
+            status, response = 400, {"error": str(e)}
+        except Exception as e:
+            status, response = 500, {"error": f"{type(e).__name__}: {e}"}
+        seconds = perf_counter() - start
+        self.endpoints[stage].add(seconds, status != 200)
+        response["latency_ms"] = seconds * 1000
+        response["queue_depth"] = queue_depth
+        return status, response
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Answer HTTP requests on a connection until it is closed
+        """
+        try:
+            while True:
+                headers = {}
+                try:
+                    request_line = await reader.readline()
+                    if not request_line:
+                        break
+                    while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        name, _, value = line.decode("latin-1").partition(":")
+                        headers[name.strip().lower()] = value.strip()
+                except ValueError:
+                    # a line is longer than the limit of the reader
+                    request_line = None
+                parts = request_line.decode("latin-1").split() if request_line is not None else []
+                content_length = headers.get("content-length", "0")
+                # the rest of the connection cannot be read after a bad request
+                bad_request = True
+                if request_line is None:
+                    status, response = 431, {"error": "The request line or a header is too long"}
+                elif len(parts) != 3:
+                    status, response = 400, {"error": "Bad request line"}
+                elif not content_length.isdigit():
+                    status, response = 400, {"error": f"Bad Content-Length {content_length}"}
+                else:
+                    bad_request = False
+                    body = await reader.readexactly(int(content_length))
+                    status, response = await self.respond(parts[0], parts[1], body)
+
+                data = json.dumps(response).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n".encode()
+                    + data
+                )
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close" or bad_request:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0, unix_path: str | None = None) -> asyncio.Server:
+        """
+        Start answering requests on a local port, or on a unix socket if `unix_path` is given
+        """
+        # start every worker now, rather than when the first requests arrive
+        await asyncio.gather(
+            *(asyncio.get_running_loop().run_in_executor(self.pool, os.getpid) for _ in range(self.workers))
+        )
+        if unix_path is not None:
+            return await asyncio.start_unix_server(self.handle_connection, unix_path)
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+async def serve(args: argparse.Namespace):
+    server = CompileServer(args.workers, args.cache_size)
+    try:
+        async with await server.start(args.host, args.port, args.unix) as s:
+            address = args.unix or "http://{}:{}".format(*s.sockets[0].getsockname()[:2])
+            print(f"Compiling programs on {address} with {args.workers} workers", flush=True)
+            await s.serve_forever()
+    finally:
+        server.close()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        prog="desmosserve",
+        description="Compile programs sent to a local HTTP server, without starting desmoscc for each one",
+    )
+    arg_parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default 127.0.0.1)")
+    arg_parser.add_argument("--port", type=int, default=8080, help="port to listen on (default 8080)")
+    arg_parser.add_argument("--unix", metavar="PATH", help="listen on a unix socket instead of a port")
+    arg_parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of processes compiling programs (default the number of CPUs)",
+    )
+    arg_parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=CACHE_SIZE,
+        help=f"number of results kept in memory (default {CACHE_SIZE})",
+    )
+    args = arg_parser.parse_args()
+
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
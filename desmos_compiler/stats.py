@@ -0,0 +1,437 @@
+import re
+from dataclasses import dataclass, field
+from typing import Callable
+
+from desmos_compiler.assembler import GOTO_LABEL, LABEL_REF, parse_assembly
+from desmos_compiler.compiler import FRAME_HEADER, STACK, Compiler
+from desmos_compiler.scheduler import count_actions
+
+# name used for the code outside of any function
+MAIN = "main"
+
+
+@dataclass
+class Estimate:
+    """
+    A count of the form `constant + sum(coefficient * symbol)`.
+
+    Symbols stand for quantities which are only known at runtime:
+    - `n_<label>` is the total number of iterations of the loop starting at `<label>`
+    - `calls_<function>` is the total number of calls to a recursive function
+    - `depth_<function>` is the deepest recursion of a recursive function
+    """
+
+    constant: int = 0
+    terms: dict[str, int] = field(default_factory=dict)
+
+    @property
+    def bounded(self) -> bool:
+        return len(self.terms) == 0
+
+    def __add__(self, other: "Estimate") -> "Estimate":
+        terms = dict(self.terms)
+        for symbol, coefficient in other.terms.items():
+            terms[symbol] = terms.get(symbol, 0) + coefficient
+        return Estimate(self.constant + other.constant, terms)
+
+    def max(self, other: "Estimate") -> "Estimate":
+        """
+        An estimate which is at least as large as both estimates
+        """
+        terms = dict(self.terms)
+        for symbol, coefficient in other.terms.items():
+            terms[symbol] = max(terms.get(symbol, 0), coefficient)
+        return Estimate(max(self.constant, other.constant), terms)
+
+    def __str__(self) -> str:
+        parts = [f"{coefficient}*{symbol}" for symbol, coefficient in sorted(self.terms.items())]
+        if self.constant != 0 or len(parts) == 0:
+            parts.insert(0, str(self.constant))
+        return " + ".join(parts)
+
+
+@dataclass
+class BasicBlock:
+    """
+    Lines of assembly which always run one after the other.
+    Every line takes one tick.
+    """
+
+    start: int
+    end: int
+    name: str
+    successors: list[int] = field(default_factory=list)
+    calls: list[str] = field(default_factory=list)
+
+    @property
+    def ticks(self) -> int:
+        return self.end - self.start
+
+
+@dataclass
+class FunctionStats:
+    """
+    blocks -- basic blocks of the function, in program order
+    loops -- ticks per iteration of each loop, by loop symbol
+    ticks -- ticks per call, not counting calls to recursive functions
+    frame_size -- largest number of stack entries the function uses at once
+    recursive -- whether the function can call itself
+    """
+
+    name: str
+    blocks: list[BasicBlock]
+    loops: dict[str, Estimate]
+    ticks: Estimate
+    frame_size: int
+    recursive: bool
+
+    @property
+    def lines(self) -> int:
+        return sum(b.ticks for b in self.blocks)
+
+
+@dataclass
+class ProgramStats:
+    """
+    Static cost estimates for a compiled program.
+
+    ticks -- number of ticks until the program exits
+    stack_size -- largest length of the stack, including the header of each function's frame
+    depth -- largest number of function calls which have not returned at once
+    actions -- number of actions in all lines, which the scheduler packs into as few lines as it can
+    cse_hits -- number of times each call was reused instead of evaluated again
+    """
+
+    lines: int
+    exprs: int
+    actions: int
+    functions: dict[str, FunctionStats]
+    ticks: Estimate
+    stack_size: Estimate
+    depth: Estimate
+    cse_hits: dict[str, int] = field(default_factory=dict)
+
+    @property
+    def actions_per_tick(self) -> float:
+        """
+        Average number of actions run by a line, each of which takes one tick
+        """
+        return self.actions / self.lines if self.lines > 0 else 0
+
+
+def _jump_tables(exprs: list[str]) -> dict[str, list[str]]:
+    """
+    Labels in each `expr` which refers to labels, which a computed jump can go to
+    """
+    tables = {}
+    for expr in exprs:
+        name, latex = expr.split("=", 1)
+        targets = re.findall(LABEL_REF, latex)
+        if len(targets) > 0:
+            tables[name.strip()] = targets
+    return tables
+
+
+def _successors(
+    line: str, index: int, labels: dict[str, int], tables: dict[str, list[str]]
+) -> tuple[list[int], bool]:
+    """
+    Find the lines which can run after a line.
+
+    Returns the indices of the successors and whether the line
+    only ever continues to the next line.
+    """
+    successors = [labels[i] for i in re.findall(GOTO_LABEL, line)]
+    if len(re.findall(r"\bGOTO\b", line)) > len(successors):
+        # a computed jump can go to any label in the tables it uses
+        targets = [labels[t] for name, table in tables.items() if name in line for t in table]
+        successors += list(dict.fromkeys(targets))
+    falls_through = re.search(r"\bNEXTLINE\b|\bLINE\s*\\to\s*LINE\s*\+\s*1\b", line)
+    if falls_through:
+        successors.append(index + 1)
+    only_next = falls_through is not None and len(successors) == 1 and not re.search(
+        r"\bDONE\b\s*\\to", line
+    )
+    return successors, only_next
+
+
+def _find_blocks(
+    lines: list[str],
+    labels: dict[str, int],
+    tables: dict[str, list[str]],
+    start: int,
+    end: int,
+    func_labels: dict[str, str],
+) -> list[BasicBlock]:
+    label_names: dict[int, str] = {}
+    for name, index in labels.items():
+        label_names.setdefault(index, name)
+
+    leaders = {start} | {i for i in label_names if start <= i < end}
+    for i in range(start, end):
+        _, only_next = _successors(lines[i], i, labels, tables)
+        if not only_next:
+            leaders.add(i + 1)
+    leaders = sorted(i for i in leaders if start <= i < end)
+
+    blocks = []
+    for block_start, block_end in zip(leaders, leaders[1:] + [end]):
+        last = lines[block_end - 1]
+        successors, _ = _successors(last, block_end - 1, labels, tables)
+        calls = [func_labels[i] for i in re.findall(GOTO_LABEL, last) if i in func_labels]
+        if len(calls) > 0:
+            # execution continues after the call once the function returns
+            successors = [block_end]
+        blocks.append(
+            BasicBlock(
+                block_start,
+                block_end,
+                label_names.get(block_start, f"line{block_start}"),
+                [i for i in successors if start <= i < end],
+                calls,
+            )
+        )
+    return blocks
+
+
+class _Analysis:
+    def __init__(self, compiler: Compiler):
+        self.compiler = compiler
+        self.lines, self.labels, self.exprs = parse_assembly(compiler.program_asm)
+
+        func_labels = {
+            info.goto_label: str(name) for name, info in compiler.function_lookup.items()
+        }
+        starts = sorted(
+            [(0, MAIN)] + [(self.labels[label], name) for label, name in func_labels.items()]
+        )
+        ends = [i for i, _ in starts[1:]] + [len(self.lines)]
+
+        tables = _jump_tables(self.exprs)
+        self.blocks = {
+            name: _find_blocks(self.lines, self.labels, tables, start, end, func_labels)
+            for (start, name), end in zip(starts, ends)
+        }
+        self.callees = {
+            name: {c for b in blocks for c in b.calls} for name, blocks in self.blocks.items()
+        }
+        self.reachable = {name: self._reachable(name) for name in self.blocks}
+
+        self.frame_sizes = {MAIN: compiler.global_scope.frame_size()}
+        for name, info in compiler.function_lookup.items():
+            self.frame_sizes[str(name)] = info.scope.frame_size() if info.scope else 0
+
+        self._costs: dict[str, tuple[Estimate, dict[str, Estimate]]] = {}
+
+    def _reachable(self, name: str) -> set[str]:
+        """
+        Functions which can be called (directly or indirectly) by a function
+        """
+        seen = set()
+        todo = list(self.callees[name])
+        while len(todo) > 0:
+            f = todo.pop()
+            if f not in seen:
+                seen.add(f)
+                todo.extend(self.callees[f])
+        return seen
+
+    def recursive(self, name: str) -> bool:
+        return name in self.reachable[name]
+
+    def cycle(self, name: str) -> list[str]:
+        """
+        Functions which are mutually recursive with a recursive function
+        """
+        return sorted(f for f in self.reachable[name] if name in self.reachable[f])
+
+    def frame_size(self, name: str) -> int:
+        return self.frame_sizes[name]
+
+    def body_cost(self, name: str) -> tuple[Estimate, dict[str, Estimate]]:
+        """
+        Ticks taken by one call of a function, along with the ticks
+        per iteration of every loop in it.
+
+        Calls to non-recursive functions are included in the cost and calls
+        to recursive functions are counted separately by `program_cost`.
+        """
+        if name in self._costs:
+            return self._costs[name]
+
+        blocks = self.blocks[name]
+        if len(blocks) == 0:
+            self._costs[name] = (Estimate(), {})
+            return self._costs[name]
+
+        by_start = {b.start: b for b in blocks}
+        weights = {}
+        for b in blocks:
+            weight = Estimate(b.ticks)
+            for callee in b.calls:
+                if not self.recursive(callee):
+                    weight += self.body_cost(callee)[0]
+            weights[b.start] = weight
+
+        # depth first search to find back edges and a topological order
+        order: list[int] = []
+        back_edges: list[tuple[int, int]] = []
+        state: dict[int, int] = {}
+
+        def visit(start: int):
+            state[start] = 1
+            for s in by_start[start].successors:
+                if state.get(s) == 1:
+                    back_edges.append((start, s))
+                elif s not in state:
+                    visit(s)
+            state[start] = 2
+            order.append(start)
+
+        visit(blocks[0].start)
+        order.reverse()
+        forward = {
+            start: [s for s in by_start[start].successors if (start, s) not in back_edges]
+            for start in order
+        }
+
+        def longest(source: int, allowed: set[int]) -> dict[int, Estimate]:
+            dist = {source: weights[source]}
+            for start in order:
+                if start not in dist:
+                    continue
+                for s in forward[start]:
+                    if s in allowed:
+                        candidate = dist[start] + weights[s]
+                        dist[s] = dist[s].max(candidate) if s in dist else candidate
+            return dist
+
+        # the longest path which leaves the function (or the program)
+        dist = longest(blocks[0].start, set(order))
+        exits = [start for start in order if len(by_start[start].successors) == 0]
+        if len(exits) == 0:
+            exits = [start for start in order if len(forward[start]) == 0]
+        cost = Estimate()
+        for start in exits:
+            cost = cost.max(dist[start])
+
+        loops: dict[str, Estimate] = {}
+        for tail, header in back_edges:
+            body = self._natural_loop(tail, header, by_start)
+            per_iteration = longest(header, body)[tail]
+            symbol = f"n_{by_start[header].name}"
+            loops[symbol] = loops[symbol].max(per_iteration) if symbol in loops else per_iteration
+
+        for symbol, per_iteration in loops.items():
+            cost += Estimate(0, {symbol: per_iteration.constant}) + Estimate(0, per_iteration.terms)
+
+        self._costs[name] = (cost, loops)
+        return self._costs[name]
+
+    @staticmethod
+    def _natural_loop(tail: int, header: int, by_start: dict[int, BasicBlock]) -> set[int]:
+        predecessors: dict[int, list[int]] = {start: [] for start in by_start}
+        for b in by_start.values():
+            for s in b.successors:
+                predecessors[s].append(b.start)
+
+        body = {header, tail}
+        todo = [tail]
+        while len(todo) > 0:
+            for p in predecessors[todo.pop()]:
+                if p not in body:
+                    body.add(p)
+                    todo.append(p)
+        return body
+
+    def program_cost(self, name: str) -> Estimate:
+        """
+        Ticks taken by a call to a function including calls to recursive functions
+        """
+        cycles = {tuple(self.cycle(f)) for f in self.reachable[name] if self.recursive(f)}
+        cost = Estimate() if self.recursive(name) else self.body_cost(name)[0]
+        for cycle in sorted(cycles):
+            for f in cycle:
+                body = self.body_cost(f)[0]
+                cost += Estimate(0, {f"calls_{f}": body.constant}) + Estimate(0, body.terms)
+        return cost
+
+    def chain(self, name: str, weight: Callable[[str], int]) -> Estimate:
+        """
+        Largest sum of `weight` over the functions active at once
+        after a call to a function.
+        """
+        if self.recursive(name):
+            cycle = self.cycle(name)
+            own = Estimate(0, {f"depth_{cycle[0]}": max(weight(f) for f in cycle)})
+            callees = {c for f in cycle for c in self.callees[f]} - set(cycle)
+        else:
+            own = Estimate(weight(name))
+            callees = self.callees[name]
+
+        deepest = Estimate()
+        for callee in sorted(callees):
+            deepest = deepest.max(self.chain(callee, weight))
+        return own + deepest
+
+
+def collect_stats(compiler: Compiler) -> ProgramStats:
+    """
+    Estimate the runtime cost of a program after `compiler.generate_assembly` has run
+    """
+    analysis = _Analysis(compiler)
+
+    functions = {}
+    for name, blocks in analysis.blocks.items():
+        cost, loops = analysis.body_cost(name)
+        functions[name] = FunctionStats(
+            name,
+            blocks,
+            loops,
+            cost,
+            analysis.frame_size(name),
+            analysis.recursive(name),
+        )
+
+    return ProgramStats(
+        lines=len(analysis.lines),
+        exprs=len(analysis.exprs),
+        actions=sum(count_actions(line) for line in analysis.lines),
+        functions=functions,
+        ticks=analysis.program_cost(MAIN),
+        stack_size=analysis.chain(
+            MAIN, lambda f: analysis.frame_size(f) + (0 if f == MAIN else FRAME_HEADER)
+        ),
+        depth=analysis.chain(MAIN, lambda f: 0 if f == MAIN else 1),
+        cse_hits={str(e): n for e, n in compiler.optimization_stats.cse_hits.items()},
+    )
+
+
+def format_stats(stats: ProgramStats) -> str:
+    """
+    Create a human readable report of program statistics
+    """
+    report = [
+        f"lines: {stats.lines}",
+        f"exprs: {stats.exprs}",
+        f"actions per tick: {stats.actions_per_tick:.2f}",
+        f"ticks: {stats.ticks}",
+        f"{STACK} length: {stats.stack_size}",
+        f"call depth: {stats.depth}",
+        f"reused calls: {sum(stats.cse_hits.values())}",
+    ]
+    for call, hits in stats.cse_hits.items():
+        report.append(f"    {call}: {hits}")
+
+    for f in stats.functions.values():
+        report.append("")
+        recursive = " (recursive)" if f.recursive else ""
+        report.append(f"{f.name}{recursive}: {f.lines} lines, frame size {f.frame_size}")
+        report.append(f"    ticks per call: {f.ticks}")
+        for symbol, per_iteration in f.loops.items():
+            report.append(f"    ticks per iteration of {symbol}: {per_iteration}")
+        for b in f.blocks:
+            calls = "".join(f", calls {c}" for c in b.calls)
+            report.append(f"    block {b.name} (line {b.start}): {b.ticks} ticks{calls}")
+
+    return "\n".join(report)
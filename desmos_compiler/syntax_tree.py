@@ -1,12 +1,55 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
+from typing import Iterator
 
 
 def indent(s: str, levels: int = 1):
     return "\n".join(["    " * levels + i for i in s.split("\n")])
 
 
-@dataclass(frozen=True)
+def walk(node: "Expression | Statement") -> Iterator["Expression | Statement"]:
+    """
+    Iterate over a node and every expression or statement below it in the syntax tree
+    """
+    stack = [node]
+    while len(stack) > 0:
+        node = stack.pop()
+        yield node
+        children = []
+        for name in node.__match_args__:
+            value = getattr(node, name)
+            for child in value if isinstance(value, tuple) else [value]:
+                if isinstance(child, Node):
+                    children.append(child)
+        stack.extend(reversed(children))
+
+
+def contains_call(node: "Expression | Statement") -> bool:
+    """
+    Whether a node contains a function call
+    """
+    return any(isinstance(n, FunctionCall) for n in walk(node))
+
+
+def _cached_hash(self: "Node") -> int:
+    if self._hash is None:
+        # the fields given to __init__, which are the ones compared by __eq__
+        values = tuple(getattr(self, name) for name in self.__match_args__)
+        object.__setattr__(self, "_hash", hash((type(self), values)))
+    return self._hash
+
+
+def node(cls):
+    """
+    Make a class a node of the syntax tree: an immutable dataclass with slots
+    whose hash is only calculated once, so equal subtrees can be used as keys
+    """
+    cls = dataclass(frozen=True, slots=True)(cls)
+    cls.__hash__ = _cached_hash
+    return cls
+
+
+@dataclass(frozen=True, slots=True)
 class DesmosType:
     """Type (of a variable, parameter, or function return)"""
 
@@ -16,7 +59,17 @@ class DesmosType:
         return self.type
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
+class ArrayType(DesmosType):
+    """Type of a fixed size array (size is None if it is only known at runtime)"""
+
+    size: int | None
+
+    def __repr__(self) -> str:
+        return f"{self.type}[{self.size if self.size is not None else ''}]"
+
+
+@dataclass(frozen=True, slots=True)
 class FunctionParameter:
     """
     Type and name of function parameter
@@ -29,12 +82,19 @@ class FunctionParameter:
         return f"{self.type} {self.var}"
 
 
-@dataclass(frozen=True)
-class Expression:
+@node
+class Node:
+    """Any expression or statement"""
+
+    _hash: int | None = field(default=None, init=False, repr=False, compare=False)
+
+
+@node
+class Expression(Node):
     """Any node which can be evaluated"""
 
 
-@dataclass(frozen=True)
+@node
 class Literal(Expression):
     """A constant expression"""
 
@@ -44,7 +104,7 @@ class Literal(Expression):
         return self.val
 
 
-@dataclass(frozen=True)
+@node
 class Variable(Expression):
     """Variable"""
 
@@ -69,8 +129,12 @@ class Operator(Enum):
     LE = "<="
     GE = ">="
 
+    AND = "&&"
+    OR = "||"
+    NOT = "!"
+
 
-@dataclass(frozen=True)
+@node
 class BinaryOperation(Expression):
     """
     Binary operation between values
@@ -84,36 +148,172 @@ class BinaryOperation(Expression):
         return f"({self.arg1} {self.op.value} {self.arg2})"
 
 
-@dataclass(frozen=True)
+@node
+class UnaryOperation(Expression):
+    """
+    Operation on a single value (`-x` or `!x`)
+    """
+
+    arg: Expression
+    op: Operator
+
+    def __repr__(self) -> str:
+        return f"({self.op.value}{self.arg})"
+
+
+@node
 class FunctionCall(Expression):
     """
     A call to a function
     """
 
     name: Variable
-    args: list[Expression]
+    args: tuple[Expression, ...]
+
+    def __post_init__(self):
+        object.__setattr__(self, "args", tuple(self.args))
 
     def __repr__(self) -> str:
         args = ", ".join(str(i) for i in self.args)
         return f"{self.name}( {args} )"
 
 
-@dataclass(frozen=True)
-class Statement:
+@node
+class Index(Expression):
+    """
+    An element of an array
+    """
+
+    array: Variable
+    index: Expression
+
+    def __repr__(self) -> str:
+        return f"{self.array}[{self.index}]"
+
+
+@node
+class Slice(Expression):
+    """
+    The elements of an array from `start` up to but not including `end`
+    """
+
+    array: Variable
+    start: Expression
+    end: Expression
+
+    def __repr__(self) -> str:
+        return f"{self.array}[{self.start}:{self.end}]"
+
+
+@node
+class Length(Expression):
+    """
+    Number of elements in an array or list
+    """
+
+    arg: Expression
+
+    def __repr__(self) -> str:
+        return f"len({self.arg})"
+
+
+@node
+class Range(Expression):
+    """
+    List of numbers from `start` counting up by 1 while less than `end`
+    """
+
+    start: Expression
+    end: Expression
+
+    def __repr__(self) -> str:
+        return f"range({self.start}, {self.end})"
+
+
+@node
+class ListLiteral(Expression):
+    """
+    List of constant numbers
+    """
+
+    values: tuple[Literal, ...]
+
+    def __post_init__(self):
+        object.__setattr__(self, "values", tuple(self.values))
+
+    def __repr__(self) -> str:
+        return f"[{', '.join(str(i) for i in self.values)}]"
+
+
+@node
+class Comprehension(Expression):
+    """
+    List of the values of `expr` for each element `var` of a list
+    (which satisfies `condition` if it is given)
+    """
+
+    expr: Expression
+    var: Variable
+    source: Expression
+    condition: Expression | None
+
+    def __repr__(self) -> str:
+        res = f"[{self.expr} for {self.var} in {self.source}"
+        if self.condition is not None:
+            res += f" if {self.condition}"
+        return res + "]"
+
+
+@node
+class Alloc(Expression):
+    """
+    Pointer to a new block of heap memory with room for `size` numbers
+    """
+
+    size: Expression
+
+    def __repr__(self) -> str:
+        return f"alloc({self.size})"
+
+
+class ListOperator(Enum):
+    SUM = "sum"
+    MIN = "min"
+    MAX = "max"
+
+
+@node
+class Reduction(Expression):
+    """
+    Combine the elements of a list into a single number
+    """
+
+    op: ListOperator
+    arg: Expression
+
+    def __repr__(self) -> str:
+        return f"{self.op.value}({self.arg})"
+
+
+@node
+class Statement(Node):
     """Any node which can be executed"""
 
 
-@dataclass(frozen=True)
+@node
 class Group(Statement):
     """Group of multiple statements"""
 
-    statements: list[Statement]
+    statements: tuple[Statement, ...]
+
+    def __post_init__(self):
+        object.__setattr__(self, "statements", tuple(self.statements))
 
     def __repr__(self) -> str:
         return "\n".join([str(i) for i in self.statements])
 
 
-@dataclass(frozen=True)
+@node
 class Declaration(Statement):
     """
     Declare a variable
@@ -123,10 +323,12 @@ class Declaration(Statement):
     type: DesmosType
 
     def __repr__(self) -> str:
+        if isinstance(self.type, ArrayType):
+            return f"{self.type.type} {self.var}[{self.type.size}];"
         return f"{self.type} {self.var};"
 
 
-@dataclass(frozen=True)
+@node
 class Assignment(Statement):
     """
     Assign a variable
@@ -139,7 +341,20 @@ class Assignment(Statement):
         return f"{self.var} = {self.val};"
 
 
-@dataclass(frozen=True)
+@node
+class IndexAssignment(Statement):
+    """
+    Assign an element or a slice of an array
+    """
+
+    target: Index | Slice
+    val: Expression
+
+    def __repr__(self) -> str:
+        return f"{self.target} = {self.val};"
+
+
+@node
 class If(Statement):
     """Conditional if / else if / else"""
 
@@ -156,7 +371,7 @@ class If(Statement):
         return res
 
 
-@dataclass(frozen=True)
+@node
 class While(Statement):
     """While loop"""
 
@@ -170,7 +385,7 @@ class While(Statement):
 
 
 
-@dataclass(frozen=True)
+@node
 class FunctionDefinition(Statement):
     """
     Define a new function
@@ -178,9 +393,12 @@ class FunctionDefinition(Statement):
 
     name: Variable
     ret_type: DesmosType
-    params: list[FunctionParameter]
+    params: tuple[FunctionParameter, ...]
     body: Statement
 
+    def __post_init__(self):
+        object.__setattr__(self, "params", tuple(self.params))
+
     def __repr__(self) -> str:
         body = indent(str(self.body))
         args = ", ".join([str(i) for i in self.params])
@@ -188,7 +406,7 @@ class FunctionDefinition(Statement):
         return res
 
 
-@dataclass(frozen=True)
+@node
 class FunctionReturn(Statement):
     """
     Return expression from a function
@@ -200,7 +418,7 @@ class FunctionReturn(Statement):
         return f"return {self.expr};"
 
 
-@dataclass(frozen=True)
+@node
 class FunctionCallStatement(Statement):
     """
     A standalone function call
@@ -209,3 +427,15 @@ class FunctionCallStatement(Statement):
 
     def __repr__(self) -> str:
         return f"{self.call};"
+
+
+@node
+class Free(Statement):
+    """
+    Give a block of heap memory back to the allocator
+    """
+
+    pointer: Expression
+
+    def __repr__(self) -> str:
+        return f"free({self.pointer});"
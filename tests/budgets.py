@@ -0,0 +1,251 @@
+"""
+Performance budgets for compiled programs.
+
+Each program in `PROGRAMS` is compiled and run in the emulator, its output is checked,
+and the number of ticks it takes, the number of lines of assembly, the size of the
+javascript and the compile time are compared with the baselines saved in `BASELINES_PATH`.
+
+Run `python -m tests.budgets` after a change which is expected to change these
+numbers to measure every program again and save the new baselines, or
+`python -m tests.budgets <name> ...` to only update some programs.
+"""
+
+import json
+import sys
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from time import perf_counter
+
+from desmos_compiler.assembler import assemble, parse_assembly
+from desmos_compiler.compiler import StackPages, compile_syntax_tree
+from desmos_compiler.emulator import run_assembly
+from desmos_compiler.parser import parse
+
+PROJECT_ROOT = Path(__file__).parent.parent.resolve()
+BASELINES_PATH = PROJECT_ROOT / "tests/budgets.json"
+
+# compile time depends on the machine, so it can be this many times the baseline
+COMPILE_TIME_FACTOR = 3
+
+# and a further number of seconds, so very short compile times do not fail because of noise
+COMPILE_TIME_SLACK = 0.25
+
+# number of times each program is compiled, keeping the fastest
+COMPILE_REPEATS = 3
+
+
+@dataclass
+class BudgetProgram:
+    """
+    program -- source of the program
+    output -- expected output of the program
+    program_input -- input the program is run with
+    options -- keyword arguments for `compile_syntax_tree`
+    minified -- measure the size of the minified javascript
+    """
+
+    program: str
+    output: float
+    program_input: float = 0
+    options: dict = field(default_factory=dict)
+    minified: bool = False
+
+
+@dataclass
+class Measurement:
+    """
+    ticks -- number of times the run action is clicked before the program exits
+    lines -- number of lines of desmos assembly
+    bytes -- size of the javascript
+    compile_seconds -- time taken to compile the syntax tree to assembly
+    """
+
+    ticks: int
+    lines: int
+    bytes: int
+    compile_seconds: float
+
+
+with open(PROJECT_ROOT / "examples/gcd.desmos") as f:
+    GCD = f.read()
+
+PROGRAMS = {
+    # the whole program is evaluated at compile time
+    "gcd": BudgetProgram(GCD, 6),
+    "gcd_runtime": BudgetProgram(GCD, 6, options={"eval_steps": 0}),
+    "gcd_pages_minified": BudgetProgram(
+        GCD, 6, options={"eval_steps": 0, "stack_pages": StackPages(100, 4)}, minified=True
+    ),
+    "fibonacci": BudgetProgram(
+        """
+        num fib(num n){
+            if (n < 2){
+                return n;
+            }
+            return fib(n - 1) + fib(n - 2);
+        }
+        OUT = fib(IN);
+        """,
+        55,
+        10,
+    ),
+    "bubble_sort": BudgetProgram(
+        """
+        num a[8];
+        a = [(x * 5 + IN) % 8 for x in range(0, 8)];
+        num i;
+        while (i < 8){
+            num j;
+            j = 0;
+            while (j < 7 - i){
+                if (a[j] > a[j + 1]){
+                    num t;
+                    t = a[j];
+                    a[j] = a[j + 1];
+                    a[j + 1] = t;
+                }
+                j = j + 1;
+            }
+            i = i + 1;
+        }
+        OUT = a[0] + a[7] * 10;
+        """,
+        70,
+        3,
+    ),
+    "counted_loops": BudgetProgram(
+        """
+        num a[16];
+        num i;
+        while (i < 16){
+            a[i] = i * IN;
+            i = i + 1;
+        }
+        num total;
+        i = 0;
+        while (i < 5){
+            total = total + sum([x % (i + 2) for x in a]);
+            i = i + 1;
+        }
+        OUT = total;
+        """,
+        86,
+        3,
+    ),
+    "switch": BudgetProgram(
+        """
+        num score(num n){
+            switch (n % 5){
+                case 0: return 1;
+                case 1: return 10;
+                case 2, 3: return 100;
+                default: return 1000;
+            }
+            return 0;
+        }
+        num i;
+        num total;
+        while (i < IN){
+            total = total + score(i * 7);
+            i = i + 1;
+        }
+        OUT = total;
+        """,
+        2523,
+        12,
+    ),
+    "linked_list": BudgetProgram(
+        """
+        ptr cons(num v, ptr next){
+            ptr node;
+            node = alloc(2);
+            node[0] = v;
+            node[1] = next;
+            return node;
+        }
+        num total(ptr list){
+            if (list == 0){
+                return 0;
+            }
+            return list[0] + total(list[1]);
+        }
+        ptr l;
+        num i;
+        while (i < IN){
+            l = cons(i, l);
+            i = i + 1;
+        }
+        OUT = total(l);
+        """,
+        15,
+        6,
+        {"heap_size": 64},
+    ),
+}
+
+
+def measure(budget_program: BudgetProgram) -> Measurement:
+    syntax_tree = parse(budget_program.program)
+    compile_seconds = float("inf")
+    for _ in range(COMPILE_REPEATS):
+        start = perf_counter()
+        assembly = compile_syntax_tree(syntax_tree, **budget_program.options)
+        compile_seconds = min(compile_seconds, perf_counter() - start)
+
+    lines, _, _ = parse_assembly(assembly)
+    js = assemble(assembly, budget_program.minified)
+    result = run_assembly(assembly, budget_program.program_input, minified=budget_program.minified)
+    if result.exit_code != 0:
+        raise AssertionError(f"The program exited with code {result.exit_code}")
+    if result.output != budget_program.output:
+        raise AssertionError(f"The program output {result.output} instead of {budget_program.output}")
+    return Measurement(result.ticks, len(lines), len(js.encode()), compile_seconds)
+
+
+def load_baselines() -> dict[str, Measurement]:
+    try:
+        with open(BASELINES_PATH) as f:
+            return {name: Measurement(**values) for name, values in json.load(f).items()}
+    except FileNotFoundError:
+        return {}
+
+
+def save_baselines(baselines: dict[str, Measurement]):
+    with open(BASELINES_PATH, "w") as f:
+        values = {name: asdict(m) | {"compile_seconds": round(m.compile_seconds, 4)} for name, m in baselines.items()}
+        json.dump(dict(sorted(values.items())), f, indent=4)
+        f.write("\n")
+
+
+def over_budget(measurement: Measurement, baseline: Measurement) -> list[str]:
+    """
+    Descriptions of each way `measurement` is worse than `baseline` allows
+    """
+    problems = []
+    for name in ["ticks", "lines", "bytes"]:
+        value, limit = getattr(measurement, name), getattr(baseline, name)
+        if value > limit:
+            problems.append(f"{name}: {value} is more than the budget of {limit}")
+    limit = baseline.compile_seconds * COMPILE_TIME_FACTOR + COMPILE_TIME_SLACK
+    if measurement.compile_seconds > limit:
+        problems.append(f"compile time: {measurement.compile_seconds:.3f} s is more than the budget of {limit:.3f} s")
+    return problems
+
+
+def update_baselines(names: list[str]):
+    """
+    Measure the programs called `names` (or every program) and save them as the new baselines
+    """
+    for name in names:
+        if name not in PROGRAMS:
+            raise SystemExit(f"Unknown program {name}")
+    baselines = {name: m for name, m in load_baselines().items() if name in PROGRAMS}
+    for name in names or PROGRAMS:
+        old = baselines.get(name)
+        baselines[name] = measure(PROGRAMS[name])
+        print(f"{name}: {old} -> {baselines[name]}")
+    save_baselines(baselines)
+
+
+if __name__ == "__main__":
+    update_baselines(sys.argv[1:])
@@ -1,6 +1,7 @@
 import pytest
 from tests.utils import run_program_js
-from desmos_compiler.assembler import assemble
+from json import loads
+from desmos_compiler.assembler import DesmosExpr, assemble, assembly_expressions, generate_js, process_line
 
 
 @pytest.mark.parametrize(
@@ -46,13 +47,15 @@ def collatz_assembly_program():
     """
 
 
+@pytest.mark.parametrize("chunk_size,block_size", [(None, None), (2, None), (None, 2), (3, 2)])
+@pytest.mark.parametrize("minified", [False, True])
 @pytest.mark.parametrize("program_input", [1, 3, 7])
-def test_assembler(driver, collatz_assembly_program, program_input):
+def test_assembler(driver, collatz_assembly_program, program_input, minified, chunk_size, block_size):
     """
     Ensure `DesmosImplementation.generate_exprs` functions correctly
     on an assembly program
     """
-    js = assemble(collatz_assembly_program)
+    js = assemble(collatz_assembly_program, minified, chunk_size, block_size)
 
     program_output = run_program_js(
         driver=driver, desmos_js=js, program_input=program_input
@@ -67,3 +70,60 @@ def test_assembler(driver, collatz_assembly_program, program_input):
         expected_output += 1
 
     assert program_output.output == expected_output
+
+
+def test_generate_js():
+    exprs = [DesmosExpr("a", r"A_{b} = \left[1, 2\right]"), DesmosExpr("b", "x", {"hidden": "true"})]
+    js = generate_js(exprs)
+    assert js.startswith("Calc.setExpressions(") and js.endswith(")")
+    assert loads(js[len("Calc.setExpressions(") : -1]) == [
+        {"id": "a", "latex": r"A_{b} = \left[1, 2\right]"},
+        {"id": "b", "latex": "x", "hidden": "true"},
+    ]
+
+
+def set_expressions_calls(js: str) -> list[list[dict]]:
+    calls = js.split(";\n")
+    assert all(c.startswith("Calc.setExpressions(") for c in calls)
+    return [loads(c[len("Calc.setExpressions(") : -1]) for c in calls]
+
+
+def test_chunked_js(collatz_assembly_program):
+    calls = set_expressions_calls(assemble(collatz_assembly_program, chunk_size=3))
+    assert [len(c) for c in calls] == [3, 3, 1]
+    # the size of the calls does not change the run action
+    assert [e["id"] for c in calls for e in c][:2] == ["run", "in"]
+
+
+def test_run_blocks(collatz_assembly_program):
+    calls = set_expressions_calls(assemble(collatz_assembly_program, block_size=2))
+    assert len(calls) == 1
+    exprs = calls[0]
+
+    # the 4 lines are split into 2 blocks of 2 lines
+    latex = {e["id"]: e["latex"] for e in exprs}
+    assert latex["run"] == r"R_{un} = \left\{L_{ine}<2:R_{un0}, R_{un1}\right\}"
+    assert latex["run0"].count("L_{ine}=") == 2
+    assert "L_{ine}=2:" in latex["run1"]
+    assert {"in", "out", "done", "line", "expr0", "expr1"} <= latex.keys()
+
+
+def test_computed_jumps():
+    labels = {"a": "3", "b": "5"}
+    assert process_line(r"\left\{x=1: GOTO a, GOTO T_{able}\left[x\right]\right\}", labels) == (
+        r"\left\{x=1: L_{ine} \to 3, L_{ine} \to T_{able}\left[x\right]\right\}"
+    )
+    assert process_line(r"GOTO \left[LABEL a,LABEL b\right]\left[2\right]", labels) == (
+        r"L_{ine} \to \left[3,5\right]\left[2\right]"
+    )
+
+    program = r"""
+    expr T_{able}=\left[LABEL start,LABEL end\right]
+    label start
+    line GOTO T_{able}\left[IN\right]
+    label end
+    line DONE \to 0
+    """
+    latex = {id: "".join(parts) for id, parts in assembly_expressions(program)}
+    assert latex["expr0"] == r"T_{able}=\left[0,1\right]"
+    assert r"L_{ine}=0:\left(L_{ine} \to T_{able}\left[I_{n}\right]\right)" in latex["run"]
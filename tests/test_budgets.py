@@ -0,0 +1,32 @@
+import pytest
+
+from tests.budgets import PROGRAMS, BudgetProgram, Measurement, load_baselines, measure, over_budget
+
+
+@pytest.fixture(scope="module")
+def baselines():
+    return load_baselines()
+
+
+@pytest.mark.parametrize("name", PROGRAMS)
+def test_budget(baselines, name):
+    if name not in baselines:
+        pytest.fail(f"{name} has no baseline, run `python -m tests.budgets {name}` to measure it")
+    problems = over_budget(measure(PROGRAMS[name]), baselines[name])
+    assert problems == [], (
+        f"{name} is over its budget ({'; '.join(problems)}). "
+        "If this is expected, run `python -m tests.budgets` to update the baselines."
+    )
+
+
+def test_over_budget():
+    baseline = Measurement(ticks=10, lines=5, bytes=1000, compile_seconds=0.01)
+    assert over_budget(baseline, baseline) == []
+    assert over_budget(Measurement(9, 6, 1000, 0.2), baseline) == ["lines: 6 is more than the budget of 5"]
+    # compile time is only over budget if it is much slower
+    assert len(over_budget(Measurement(10, 5, 1001, 1), baseline)) == 2
+
+
+def test_wrong_output():
+    with pytest.raises(AssertionError, match="output 1.0 instead of 2"):
+        measure(BudgetProgram("OUT = IN;", 2, program_input=1))
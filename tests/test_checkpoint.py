@@ -0,0 +1,77 @@
+import pytest
+
+from desmos_compiler.assembler import IN, assembly_latex
+from desmos_compiler.checkpoint import CheckpointError, read_checkpoint, resume_expressions, value_latex
+from desmos_compiler.compiler import STACK, compile_syntax_tree
+from desmos_compiler.emulator import Emulator, run_assembly, run_latex
+from desmos_compiler.parser import parse
+
+PROGRAM = """
+num count(num n){
+    if (n == 0){
+        return 0;
+    }
+    return 1 + count(n - 1);
+}
+OUT = count(IN) * 2;
+"""
+
+
+def checkpoint_after(assembly: str, ticks: int, program_input: float, **options) -> dict:
+    """
+    Variables of a program after the run action has been clicked `ticks` times
+    """
+    emulator = Emulator("".join(parts) for _, parts in assembly_latex(assembly, **options))
+    emulator.variables[IN] = float(program_input)
+    for _ in range(ticks):
+        emulator.tick()
+    return dict(emulator.variables)
+
+
+@pytest.mark.parametrize("options", [{}, {"minified": True}, {"block_size": 3}])
+@pytest.mark.parametrize("ticks", [1, 10, 20])
+def test_resume(options, ticks):
+    assembly = compile_syntax_tree(parse(PROGRAM), eval_steps=0)
+    checkpoint = checkpoint_after(assembly, ticks, 6, **options)
+    assert checkpoint["D_{one}"] == -1
+
+    # the input is saved in the checkpoint too
+    resumed = run_latex(("".join(parts) for _, parts in resume_expressions(assembly, checkpoint, **options)), None)
+    finished = run_assembly(assembly, 6, **options)
+    assert resumed.output == finished.output == 12
+    assert resumed.ticks == finished.ticks - ticks
+
+
+def test_read_checkpoint():
+    assembly = compile_syntax_tree(parse(PROGRAM), eval_steps=0)
+    checkpoint = checkpoint_after(assembly, 10, 6)
+    # desmos writes the values assigned by actions into the expressions of the graph
+    state = {
+        "version": 11,
+        "expressions": {
+            "list": [{"type": "folder", "id": "f"}]
+            + [
+                {"type": "expression", "id": id, "latex": "".join(parts)}
+                for id, parts in resume_expressions(assembly, checkpoint)
+            ]
+        },
+    }
+    assert read_checkpoint(state) == checkpoint
+    assert len(checkpoint[STACK]) > 0
+
+
+def test_scientific_notation():
+    latex = r"a=\left[1.5\times10^{-7},2\times10^{21}\right]"
+    state = {"expressions": {"list": [{"type": "expression", "id": "a", "latex": latex}]}}
+    assert read_checkpoint(state) == {"a": [1.5e-7, 2e21]}
+
+
+def test_value_latex():
+    assert value_latex([0.5, -3.0, float("nan")]) == r"\left[0.5,-3,\frac{0}{0}\right]"
+
+
+def test_wrong_checkpoint():
+    assembly = compile_syntax_tree(parse(PROGRAM), eval_steps=0)
+    other = compile_syntax_tree(parse("num x; x = IN; OUT = x;"), eval_steps=0)
+    with pytest.raises(CheckpointError):
+        list(resume_expressions(other, checkpoint_after(assembly, 1, 6)))
@@ -1,8 +1,22 @@
+import re
 import pytest
-from desmos_compiler.compiler import compile_syntax_tree
+from desmos_compiler.compiler import (
+    FRAME_PTR,
+    HEAP,
+    OUT_OF_MEMORY,
+    RETURN_VAL,
+    STACK,
+    STACK_OVERFLOW,
+    CompilerError,
+    StackPages,
+    compile_syntax_tree,
+)
+from desmos_compiler.emulator import run_assembly
+from desmos_compiler.defaults import EVAL_STEPS, HEAP_SIZE
+from desmos_compiler.evaluator import evaluate
 from tests.utils import run_program_js
 from desmos_compiler.parser import parse
-from desmos_compiler.assembler import assemble
+from desmos_compiler.assembler import assemble, parse_assembly
 
 
 @pytest.fixture
@@ -188,3 +202,617 @@ def test_mutual_recursion(prog_tester, input, expected_output):
         input,
         expected_output,
     )
+
+
+def test_frame_reserved_once():
+    desmos_assembly = compile_syntax_tree(
+        parse(
+            """
+            num x;
+            x = 0;
+            while (x < 3){
+                num y;
+                y = 2;
+                if (y == 2){
+                    num z;
+                    z = 1;
+                    x = x + z;
+                }
+            }
+            OUT = x;
+            """
+        ),
+        eval_steps=0,
+    )
+    loop = desmos_assembly.split("label begwhile0")[1].split("label endwhile0")[0]
+    push_or_pop = rf"{re.escape(STACK)}\s*\\to\s*(\\operatorname{{join}}\\left\({re.escape(STACK)},|{re.escape(STACK)}\\left\[)"
+    assert re.search(push_or_pop, loop) is None
+
+
+@pytest.mark.parametrize("eval_steps", [0, EVAL_STEPS])
+@pytest.mark.parametrize(
+    "program,input,expected_output",
+    [
+        # blocks next to each other use the same places in the stack frame
+        ("if (IN == 0){ num a; a = 5; OUT = a; } if (IN == 0){ num b; OUT = OUT + b; }", 0, 5),
+        (
+            """
+            num i;
+            while (i < 3){
+                num t;
+                t = t + 2;
+                OUT = OUT + t;
+                i = i + 1;
+            }
+            if (IN > 0){
+                num z;
+                OUT = OUT + z;
+            }
+            """,
+            2,
+            6,
+        ),
+        # declarations in a loop body set the variable to 0 in each iteration
+        ("num i; while (i < 3){ num s; s = s + i; OUT = s; i = i + 1; }", 0, 2),
+        ("num i; while (i < IN){ num a[3]; a[i] = a[0] + 5; OUT = OUT + sum(a); i = i + 1; }", 3, 15),
+        # a global declared after a block can use the place the block used
+        ("if (IN == 1){ num a; a = 7; OUT = a; } num b; OUT = OUT + b;", 1, 7),
+        ("num f(num n){ if (n > 0){ num a; a = n; } num b; return b; } OUT = f(IN);", 4, 0),
+    ],
+)
+def test_declarations_set_zero(program, input, expected_output, eval_steps):
+    assembly = compile_syntax_tree(parse(program), eval_steps=eval_steps)
+    assert run_assembly(assembly, input).output == expected_output
+    assert evaluate(parse(program), input) == expected_output
+
+
+@pytest.mark.parametrize("input,expected_output", [(0, 0), (1, 1), (4, 30)])
+def test_function_scopes(prog_tester, input, expected_output):
+    prog_tester(
+        """
+        num sum_squares(num n){
+            num total;
+            total = 0;
+            while (n > 0){
+                num square;
+                square = n * n;
+                total = total + square;
+                n = n - 1;
+            }
+            if (total > 0){
+                num result;
+                result = total;
+                return result;
+            }
+            return total;
+        }
+        OUT = sum_squares(IN);
+        """,
+        input,
+        expected_output,
+    )
+
+
+def test_expression_without_temporaries():
+    desmos_assembly = compile_syntax_tree(parse("OUT = (1 + IN) * (2 - IN) % 3;"))
+    assert f"{RETURN_VAL} \\to" not in desmos_assembly
+    assert "T_{emp" not in desmos_assembly
+
+
+def test_no_jump_after_return():
+    def assembly(body):
+        program = f"num f(num n){{ {body} return 3; }} OUT = f(IN);"
+        return compile_syntax_tree(parse(program), eval_steps=0)
+
+    # a branch which always returns never reaches the end of the if
+    assert "GOTO endif" not in assembly("if (n == 0){ return 1; }")
+    assert "GOTO endif" not in assembly("if (n == 0){ return 1; } else { return 2; }")
+    assert "GOTO endif" not in assembly("switch (n){ case 1: return 1; case 2: return 2; case 4: return 4; }")
+    assert "GOTO endif" in assembly("if (n == 0){ n = 1; } else { return 2; }")
+    assert "GOTO endif" in assembly("if (n == 0){ if (n < IN){ return 1; } } else { return 2; }")
+
+
+@pytest.mark.parametrize("input,expected_output", [(1, 4), (5, 40), (7, 108)])
+def test_temporaries_across_calls(prog_tester, input, expected_output):
+    prog_tester(
+        """
+        num counter;
+        counter = 0;
+
+        num fib(num n){
+            counter = counter + 1;
+            if (n < 2){
+                return n;
+            }
+            return fib(n - 1) + fib(n - 2);
+        }
+
+        num twice(num x){
+            return 2 * x;
+        }
+
+        OUT = counter + twice(fib(IN)) + twice(counter) * (twice(1) - fib(1));
+        """,
+        input,
+        expected_output,
+    )
+
+
+@pytest.mark.parametrize("input,expected_output", [(0, 1010), (3, 1011), (4, 2011), (8, 3111)])
+def test_logical_operators(prog_tester, input, expected_output):
+    prog_tester(
+        """
+        num calls;
+        num check(num x){
+            calls = calls + 1;
+            return x > 2;
+        }
+        num a;
+        a = -IN;
+        if (IN > 0 && check(IN) || !(a < -5)){
+            OUT = 10;
+        }
+        OUT = OUT + (IN == 3 || check(IN)) + (IN > 7 && check(IN)) * 100 + calls * 1000;
+        """,
+        input,
+        expected_output,
+    )
+
+
+def test_logical_operators_without_branches():
+    desmos_assembly = compile_syntax_tree(parse("OUT = IN < 1 && !(IN == -1) || -IN > 3;"))
+    assert "label" not in desmos_assembly
+    assert "T_{emp" not in desmos_assembly
+
+
+def test_short_circuit_branches():
+    lines, labels, _ = parse_assembly(
+        compile_syntax_tree(
+            parse(
+                """
+                num f(num x){
+                    OUT = OUT + 1;
+                    return x;
+                }
+                if (IN < 1 || f(IN) == 2){
+                    OUT = OUT + 10;
+                }
+                """
+            ),
+            eval_steps=0,
+        )
+    )
+    call = next(i for i, line in enumerate(lines) if "GOTO func" in line)
+    skip = next(i for i, line in enumerate(lines) if "< 1: GOTO endcond" in line)
+    end = labels[re.search(r"GOTO (endcond\d+)", lines[skip]).group(1)]
+    # the call is skipped if the first condition is true
+    assert skip < call < end
+
+
+@pytest.mark.parametrize("input,expected_output", [(0, 5), (1, 11), (2, 7), (3, 13), (4, 24), (5, 7), (-1, 7)])
+def test_switch(prog_tester, input, expected_output):
+    prog_tester(
+        """
+        num half(num n){
+            return n / 2;
+        }
+        switch (half(IN * 2)){
+            case 0:
+                OUT = 5;
+            case 1, 3:
+                OUT = 10 + IN;
+            case 4:
+                OUT = 20;
+                OUT = OUT + IN;
+            default:
+                OUT = 7;
+        }
+        """,
+        input,
+        expected_output,
+    )
+
+
+def test_jump_table():
+    lines, labels, exprs = parse_assembly(
+        compile_syntax_tree(
+            parse(
+                """
+                switch (IN){
+                    case 2: OUT = 1;
+                    case 3: OUT = 2;
+                    case 5: OUT = 3;
+                }
+                """
+            )
+        )
+    )
+    # one jump to the case for the value
+    assert sum("GOTO J_{umpTable0}" in line for line in lines) == 1
+    table = next(e for e in exprs if e.startswith("J_{umpTable0}="))
+    assert table == r"J_{umpTable0}=\left[LABEL else0,LABEL case0_0,LABEL case0_1,LABEL else0,LABEL case0_2\right]"
+
+    # a chain of ifs with few cases, or with cases too far apart, checks each case in turn
+    for cases in ["case 1: OUT = 1; case 2: OUT = 2;", "case 1: OUT = 1; case 2: OUT = 2; case 100: OUT = 3;"]:
+        assert "umpTable" not in compile_syntax_tree(parse(f"switch (IN){{ {cases} }}"))
+
+
+@pytest.mark.parametrize("input,expected_output", [(0, 0), (3, 3), (6, 364)])
+def test_loop_invariant_calls(prog_tester, input, expected_output):
+    prog_tester(
+        """
+        num fib(num n){
+            if (n < 2){
+                return n;
+            }
+            return fib(n - 1) + fib(n - 2);
+        }
+        num i;
+        i = 0;
+        while (i < fib(IN)){
+            OUT = OUT + fib(IN + 1) * i;
+            i = i + 1;
+        }
+        """,
+        input,
+        expected_output,
+    )
+
+
+@pytest.mark.parametrize("input,expected_output", [(0, 336), (5, 24), (7, 168)])
+def test_common_subexpressions(prog_tester, input, expected_output):
+    prog_tester(
+        """
+        num gcd(num a, num b){
+            if (b == 0){
+                return a;
+            }
+            return gcd(b, a % b);
+        }
+        num x;
+        num total;
+        x = IN * 6;
+        total = 0;
+        if (gcd(x, 84) > 1){
+            total = gcd(x, 84) * 2 + gcd(84, x);
+        }
+        OUT = total + gcd(x, 84);
+        """,
+        input,
+        expected_output,
+    )
+
+
+DEAD_CODE_PROGRAM = """
+num counter;
+num unused(num n){
+    return n * 2;
+}
+num count(num n){
+    counter = counter + 1;
+    return n;
+    counter = 100;
+}
+num x;
+num y;
+x = 5;
+x = IN + 1;
+y = count(x) * 3;
+if (2 > 3){
+    OUT = unused(x);
+}
+OUT = x * 10 + counter;
+"""
+
+
+@pytest.mark.parametrize("input,expected_output", [(0, 11), (4, 51)])
+def test_dead_code(prog_tester, input, expected_output):
+    prog_tester(DEAD_CODE_PROGRAM, input, expected_output)
+
+
+def test_dead_code_not_compiled():
+    desmos_assembly = compile_syntax_tree(parse(DEAD_CODE_PROGRAM))
+    # only count is compiled
+    assert desmos_assembly.count("label func") == 1
+
+
+@pytest.mark.parametrize("input,expected_output", [(0, 0), (3, 1203)])
+def test_array_elements(prog_tester, input, expected_output):
+    prog_tester(
+        """
+        num a[5];
+        num i;
+        i = 0;
+        while (i < len(a)){
+            a[i] = i * IN;
+            i = i + 1;
+        }
+        OUT = a[0] + a[1] + a[4] * 100;
+        """,
+        input,
+        expected_output,
+    )
+
+
+@pytest.mark.parametrize("input,expected_output", [(0, 3030), (3, 3033)])
+def test_array_copies(prog_tester, input, expected_output):
+    prog_tester(
+        """
+        num a[4];
+        num b[4];
+        a[0] = 1;
+        a[1] = 2;
+        a[2] = 3;
+        a[3] = IN;
+        b = a;
+        a[3] = 0;
+        b[0:2] = a[2:4];
+        OUT = b[0] * 1000 + b[1] * 100 + b[2] * 10 + b[3];
+        """,
+        input,
+        expected_output,
+    )
+
+
+@pytest.mark.parametrize("input,expected_output", [(0, 303), (3, 1293)])
+def test_arrays_in_functions(prog_tester, input, expected_output):
+    prog_tester(
+        """
+        num g[3];
+        num set(num i, num v){
+            num local[2];
+            local[0] = v;
+            local[1] = v * 2;
+            g[i] = local[0] + local[1];
+            return g[i];
+        }
+        num x;
+        x = set(0, IN) + set(2, 1);
+        OUT = x * 100 + g[0] * 10 + g[2];
+        """,
+        input,
+        expected_output,
+    )
+
+
+def test_array_errors():
+    with pytest.raises(CompilerError):
+        compile_syntax_tree(parse("num a[2]; OUT = a + 1;"))
+    with pytest.raises(CompilerError):
+        compile_syntax_tree(parse("num x; x[0] = 1;"))
+    with pytest.raises(CompilerError):
+        compile_syntax_tree(parse("num a[0];"))
+
+
+@pytest.mark.parametrize(
+    "program",
+    [
+        "if (IN > 1){ num x; } x = 1;",
+        "num x; num x;",
+        "if (0){ zz = 1; } OUT = 1;",
+        "if (0){ return 5; } OUT = 1;",
+        "num f(num a){ return g(a, 2); } num g(num a){ return a; } OUT = 1;",
+        "num x; if (0){ num y; num y; } OUT = 1;",
+        "num f(num a){ return a; q = 3; } OUT = f(IN);",
+    ],
+)
+@pytest.mark.parametrize("eval_steps", [0, EVAL_STEPS])
+def test_dead_code_errors(program, eval_steps):
+    # statements which would not compile are errors even if they never run or are never used
+    with pytest.raises(CompilerError):
+        compile_syntax_tree(parse(program), eval_steps=eval_steps)
+
+
+@pytest.mark.parametrize("input,expected_output", [(0, 2260901), (3, 2290904)])
+def test_list_reductions(prog_tester, input, expected_output):
+    prog_tester(
+        """
+        num a[5];
+        a = [x * x for x in range(0, 5)];
+        a[2] = IN;
+        OUT = sum(a) * 10000 + max(a[1:4]) * 100;
+        OUT = OUT + min([x + IN for x in a if x > 0]) + len([x for x in a if x > 3]) * 1000000;
+        """,
+        input,
+        expected_output,
+    )
+
+
+@pytest.mark.parametrize("input,expected_output", [(0, 0), (1, 100000), (3, 300630)])
+def test_counted_loops(prog_tester, input, expected_output):
+    prog_tester(
+        """
+        num a[10];
+        num i;
+        i = 0;
+        while (i < IN){
+            a[i] = i * 3;
+            i = i + 1;
+        }
+        OUT = a[0] + a[1] * 10 + a[2] * 100 + i * 100000;
+        """,
+        input,
+        expected_output,
+    )
+
+
+def test_counted_loop_ticks():
+    desmos_assembly = compile_syntax_tree(
+        parse(
+            """
+            num s;
+            num i;
+            while (i < IN){
+                s = s + i * i;
+                i = i + 1;
+            }
+            OUT = s;
+            """
+        )
+    )
+    assert "GOTO" not in desmos_assembly
+
+
+def test_calls_in_comprehension():
+    with pytest.raises(CompilerError):
+        compile_syntax_tree(
+            parse("num f(num x){ return x; } OUT = sum([f(x) for x in range(0, 3)]);")
+        )
+
+
+@pytest.mark.parametrize("input,expected_output", [(1, 11104), (7, 11710)])
+def test_heap_blocks(prog_tester, input, expected_output):
+    prog_tester(
+        """
+        ptr p;
+        ptr q;
+        p = alloc(3);
+        q = alloc(IN + 1);
+        p[0] = 1;
+        p[1] = 2;
+        p[2] = IN;
+        q[0:3] = p[0:3];
+        free(p);
+        ptr r;
+        r = alloc(4);
+        OUT = (r == p) * 10000 + (q != p) * 1000 + q[2] * 100 + sum(q[0:3]);
+        """,
+        input,
+        expected_output,
+    )
+
+
+@pytest.mark.parametrize("input,expected_output", [(0, 0), (1, 0), (6, 15)])
+def test_linked_list(prog_tester, input, expected_output):
+    prog_tester(
+        """
+        ptr cons(num v, ptr next){
+            ptr node;
+            node = alloc(2);
+            node[0] = v;
+            node[1] = next;
+            return node;
+        }
+        num total(ptr list){
+            if (list == 0){
+                return 0;
+            }
+            return list[0] + total(list[1]);
+        }
+        ptr l;
+        num i;
+        l = 0;
+        i = 0;
+        while (i < IN){
+            l = cons(i, l);
+            i = i + 1;
+        }
+        OUT = total(l);
+        """,
+        input,
+        expected_output,
+    )
+
+
+def test_out_of_memory(driver):
+    syntax_tree = parse(
+        """
+        num i;
+        i = 0;
+        while (i < 100){
+            ptr p;
+            p = alloc(IN);
+            i = i + 1;
+        }
+        OUT = 1;
+        """
+    )
+    js = assemble(compile_syntax_tree(syntax_tree, heap_size=64))
+    program_output = run_program_js(driver=driver, desmos_js=js, program_input="3")
+    assert program_output.exit_code == OUT_OF_MEMORY
+
+
+def test_unused_allocation():
+    # an allocation is kept even if the pointer is not used, since it can run out of memory
+    syntax_tree = parse("ptr p; p = alloc(5000); OUT = 3;")
+    result = run_assembly(compile_syntax_tree(syntax_tree, heap_size=64))
+    assert result.exit_code == OUT_OF_MEMORY
+
+
+@pytest.mark.parametrize("heap_size", [HEAP_SIZE, 64, 1])
+def test_allocate_whole_heap(heap_size):
+    # a block as large as the heap fits on an empty heap
+    program = "ptr p; p = alloc(IN); p[IN - 1] = 3; OUT = p[IN - 1];"
+    assembly = compile_syntax_tree(parse(program), heap_size=heap_size)
+    result = run_assembly(assembly, heap_size)
+    assert (result.exit_code, result.output) == (0, 3)
+    assert run_assembly(assembly, heap_size + 1).exit_code == OUT_OF_MEMORY
+
+
+def test_heap_only_when_used():
+    assert HEAP not in compile_syntax_tree(parse("num a[2]; a[0] = 1; OUT = a[0];"))
+    desmos_assembly = compile_syntax_tree(parse("ptr p; p = alloc(2); free(p);"), heap_size=16)
+    assert HEAP in desmos_assembly
+    # allocating and freeing take a single line each
+    assert len([l for l in desmos_assembly.splitlines() if l.startswith("line") and HEAP in l]) == 2
+
+
+COUNT_CALLS = """
+num count(num n){
+    if (n == 0){
+        return 0;
+    }
+    return 1 + count(n - 1);
+}
+OUT = count(IN);
+"""
+
+
+@pytest.mark.parametrize("stack_pages", [None, StackPages(10, 1), StackPages(10, 4)])
+def test_call_and_return_lines(stack_pages):
+    desmos_assembly = compile_syntax_tree(parse(COUNT_CALLS), stack_pages=stack_pages, eval_steps=0)
+    lines, labels, _ = parse_assembly(desmos_assembly)
+    # a single line pushes the frame and jumps to the function
+    calls = [l for l in lines if "GOTO func0" in l]
+    assert len(calls) == 2
+    assert all(f"DONE\\to {STACK_OVERFLOW}" in l for l in calls)
+    # and a single line pops it and jumps back
+    returns = [l for l in lines[labels["func0"] :] if "LINE\\to" in l]
+    assert len(returns) == 2
+    assert all(f"{RETURN_VAL} \\to" in l and f"{FRAME_PTR}\\to" in l for l in returns)
+
+@pytest.mark.parametrize(
+    "stack_pages,input,exit_code",
+    [(None, 5, 0), (StackPages(10, 3), 5, 0), (StackPages(10, 3), 30, STACK_OVERFLOW)],
+)
+def test_stack_pages(driver, stack_pages, input, exit_code):
+    js = assemble(compile_syntax_tree(parse(COUNT_CALLS), stack_pages=stack_pages))
+    program_output = run_program_js(driver=driver, desmos_js=js, program_input=str(input))
+    assert program_output.exit_code == exit_code
+    if exit_code == 0:
+        assert program_output.output == input
+
+
+@pytest.mark.parametrize("chunk_ticks", [1, 7])
+def test_resume_from_checkpoint(driver, chunk_ticks):
+    # the run is split into chunks, each one continuing in a fresh page
+    js = assemble(compile_syntax_tree(parse(COUNT_CALLS), eval_steps=0))
+    program_output = run_program_js(driver=driver, desmos_js=js, program_input="5", chunk_ticks=chunk_ticks)
+    assert program_output.exit_code == 0
+    assert program_output.output == 5
+
+
+def test_stack_page_writes():
+    desmos_assembly = compile_syntax_tree(parse(COUNT_CALLS), stack_pages=StackPages(10, 4))
+    assert f"{STACK}\\to" not in desmos_assembly
+    # lines which can write to more than one page only write in the branch for that page
+    dispatched = 0
+    for line in desmos_assembly.splitlines():
+        writes = re.findall(r"S_\{tack\d\}\s*\\to", line)
+        if len(writes) > 1:
+            dispatched += 1
+            assert len(re.findall(r"=(\d):S_\{tack\1\}\\to", line)) == len(writes)
+    assert dispatched > 0
+
+    with pytest.raises(CompilerError):
+        compile_syntax_tree(parse("num a[20];"), stack_pages=StackPages(10, 4))
@@ -0,0 +1,63 @@
+import pytest
+
+from desmos_compiler.compiler import compile_syntax_tree
+from desmos_compiler.emulator import EmulatorError, run_assembly, run_latex
+from desmos_compiler.evaluator import evaluate
+from desmos_compiler.parser import parse
+
+
+def test_assembly_program():
+    assembly = r"""
+    expr n=0
+    expr l=0
+    line n \to IN, l \to 0, NEXTLINE
+
+    label main
+    line \left\{n=1: (OUT \to l, DONE \to 0), \operatorname{mod}(n,2)=0: (l\to l+1, LINE \to LINE + 1), (l \to l+1, GOTO odd)\right\}
+
+    line n \to \frac{n}{2}, GOTO main
+
+    label odd
+    line n \to 3\cdot n + 1, GOTO main
+    """
+    result = run_assembly(assembly, 6)
+    assert result.output == 8
+    assert result.exit_code == 0
+    # the same program with its run action split up and its names shortened
+    assert run_assembly(assembly, 27, minified=True, block_size=2).output == 111
+
+
+def test_actions_use_old_values():
+    latex = [
+        "a=1",
+        "b=2",
+        "c=a+b",
+        "D_{one}=-1",
+        r"R_{un}=a\to b,b\to c,D_{one}\to\left\{b=2:0,-1\right\}",
+    ]
+    result = run_latex(latex + ["O_{ut}=\\left[a,b,c\\right]"])
+    assert result.output == [2, 3, 5]
+    assert result.ticks == 1
+
+
+@pytest.mark.parametrize(
+    "latex",
+    [
+        ["a=0", "D_{one}=-1", r"R_{un}=a\to1,a\to2"],
+        ["a=0", "b=a+1", "D_{one}=-1", r"R_{un}=b\to1"],
+        ["a=0", "D_{one}=-1", r"R_{un}=a\to\operatorname{unknown}(a)"],
+    ],
+)
+def test_emulator_errors(latex):
+    with pytest.raises(EmulatorError):
+        run_latex(latex + ["O_{ut}=0"])
+
+
+def test_compiled_program():
+    with open("examples/gcd.desmos") as f:
+        program = parse(f.read())
+    # nothing is run at compile time so the emulator runs the whole program
+    result = run_assembly(compile_syntax_tree(program, eval_steps=0))
+    assert result.output == evaluate(program, 0)
+    assert result.exit_code == 0
+    assert result.ticks > 1
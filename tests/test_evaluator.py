@@ -0,0 +1,189 @@
+import pytest
+
+from desmos_compiler.assembler import parse_assembly
+from desmos_compiler.compiler import compile_syntax_tree
+from desmos_compiler.evaluator import (
+    OUT_OF_MEMORY,
+    EvaluationError,
+    ProgramExit,
+    evaluate,
+    number_literal,
+    partial_evaluate,
+)
+from desmos_compiler.parser import parse
+
+
+@pytest.mark.parametrize(
+    "program,expected",
+    [
+        ("OUT = -7 % 3 + 10 * (2 < 3) + 100 * (IN == 2);", 112),
+        ("if (2){ OUT = 1; } else { OUT = 2; }", 2),
+        ("num a[4]; a[0:3] = [x * x for x in range(0, 4) if x != 2]; OUT = a[2] + len(a[1:3]);", 11),
+        ("num a[3]; a[0:2] = 5; OUT = sum(a) + max([x - 1 for x in a]);", 14),
+        ("num f(num n){ if (n < 2){ return n; } return f(n - 1) + f(n - 2); } OUT = f(IN + 8);", 55),
+        ("OUT = -IN * 3 + 10 * (IN == 2 && !(IN < 0)) + 100 * (IN == 1 || 2);", 4),
+        # the second argument of && and || is only evaluated if it is needed
+        ("num f(){ OUT = OUT + 1; return 1; } OUT = (IN == 2 || f()) + (IN == 0 && f()) + (!IN && f());", 2),
+    ],
+)
+def test_evaluate(program, expected):
+    assert evaluate(parse(program), 2) == expected
+
+
+def test_int_input():
+    assert evaluate(parse("num a[5]; a[1] = 3; OUT = a[IN];"), 1) == 3
+    assert evaluate(parse("OUT = IN / 2;"), 3) == 1.5
+
+
+def test_loop_declarations_reset():
+    # a declaration sets the variable to 0 each time it runs
+    program = """
+    num i;
+    while (i < 3){
+        num s;
+        s = s + i;
+        OUT = s;
+        i = i + 1;
+    }
+    """
+    assert evaluate(parse(program), 0) == 2
+
+
+@pytest.mark.parametrize(
+    "program",
+    [
+        "OUT = 1 / (IN - IN);",
+        "num x; num x;",
+        "OUT = y;",
+        "num a[2]; OUT = a[2];",
+        # elements outside of a block, and pointers to blocks which were freed or never allocated
+        "ptr p; p = alloc(2); OUT = p[2];",
+        "ptr p; p = alloc(2); free(p); p[0] = 1;",
+        "ptr p; free(p);",
+        "num f(){ OUT = 1; } f();",
+    ],
+)
+def test_evaluation_errors(program):
+    with pytest.raises(EvaluationError):
+        evaluate(parse(program), 0)
+
+
+@pytest.mark.parametrize(
+    "program,expected",
+    [
+        ("ptr p; p = alloc(3); p[0:3] = [x + 4 for x in range(0, 3)]; p[1] = IN; OUT = sum(p[0:3]) * 10 + p;", 122),
+        # a freed block is reused by the next block of the same size class, and its
+        # first element is the pointer to the next free block
+        (
+            "ptr a; ptr b; a = alloc(3); b = alloc(3); free(a); free(b);"
+            "ptr c; c = alloc(4); OUT = (c == b) * 100 + (c[0] == a) * 10 + c[1];",
+            110,
+        ),
+        (
+            "ptr cons(num v, ptr next){ ptr node; node = alloc(2); node[0] = v; node[1] = next; return node; }"
+            "num total(ptr l){ if (l == 0){ return 0; } return l[0] + total(l[1]); }"
+            "ptr l; num i; while (i < 5){ l = cons(i, l); i = i + 1; } OUT = total(l);",
+            10,
+        ),
+        # the largest block has room for the whole heap
+        ("ptr p; p = alloc(64); p[63] = 1; OUT = p[63];", 1),
+    ],
+)
+def test_heap(program, expected):
+    assert evaluate(parse(program), 2, heap_size=64) == expected
+
+
+@pytest.mark.parametrize(
+    "program",
+    [
+        "ptr p; p = alloc(65);",
+        "ptr p; p = alloc(64); ptr q; q = alloc(1);",
+        "num i; while (i < 20){ ptr p; p = alloc(3); i = i + 1; }",
+    ],
+)
+def test_out_of_memory(program):
+    with pytest.raises(ProgramExit) as e:
+        evaluate(parse(program), 0, heap_size=64)
+    assert e.value.exit_code == OUT_OF_MEMORY
+
+
+def test_heap_only_at_runtime():
+    program = parse("ptr p; p = alloc(2); p[0] = 3; OUT = p[0];")
+    assert partial_evaluate(program).residual == program
+
+
+def test_whole_program():
+    with open("examples/gcd.desmos") as f:
+        program = parse(f.read())
+    assert partial_evaluate(program).output == 6
+    lines, _, exprs = parse_assembly(compile_syntax_tree(program))
+    assert lines == ["OUT \\to 6, DONE \\to 0"]
+    assert exprs == []
+
+
+def test_residual_program():
+    evaluation = partial_evaluate(
+        parse(
+            """
+            num x;
+            num a[3];
+            x = 2.5;
+            a[1] = x * 2;
+            num twice(num n){
+                return n * 2;
+            }
+            OUT = twice(x) + IN;
+            x = 0;
+            """
+        )
+    )
+    assert evaluation.output is None
+    # the functions and variables come first, then the state and the statements from the first one using the input
+    assert str(evaluation.residual).split("\n")[3:] == [
+        "num x;",
+        "num a[3];",
+        "x = 2.5;",
+        "a = [0, 5, 0];",
+        "OUT = (twice( x ) + IN);",
+        "x = 0;",
+    ]
+
+
+def test_loop_continues_at_runtime():
+    program = parse(
+        """
+        num i;
+        while (i < 1000){
+            i = i + 1;
+        }
+        OUT = i + IN;
+        """
+    )
+    residual = partial_evaluate(program, steps=100).residual
+    statements = residual.statements
+    assert str(statements[1]).startswith("i = ")
+    assert str(statements[2]).startswith("while")
+    assert evaluate(residual, 1) == 1001
+
+
+def test_runtime_limits():
+    count = """
+    num count(num n){
+        if (n == 0){
+            return 0;
+        }
+        return 1 + count(n - 1);
+    }
+    OUT = count(50);
+    """
+    assert partial_evaluate(parse(count), list_length=10000, stack_size=10000).output == 50
+    # the call could overflow a smaller stack at runtime
+    assert partial_evaluate(parse(count), list_length=10000, stack_size=200).output is None
+    # and a long loop runs out of steps
+    loop = "num i; while (i < 100000){ i = i + 1; } OUT = i;"
+    assert partial_evaluate(parse(loop)).output is None
+
+
+@pytest.mark.parametrize("value,literal", [(3.0, "3"), (-0.5, "-0.5"), (1e-7, "0.0000001"), (1e20, "100000000000000000000")])
+def test_number_literal(value, literal):
+    assert number_literal(value).val == literal
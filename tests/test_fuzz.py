@@ -0,0 +1,54 @@
+from desmos_compiler.fuzz import FuzzOptions, ProgramGenerator, check_program, fuzz_seed, reduce_program
+from desmos_compiler.evaluator import EvaluationError
+from desmos_compiler.parser import parse
+from desmos_compiler.syntax_tree import walk, Variable
+
+
+def test_generator_is_deterministic():
+    assert ProgramGenerator(3).program() == ProgramGenerator(3).program()
+    assert ProgramGenerator(3).program() != ProgramGenerator(4).program()
+
+
+def test_random_programs():
+    checked = 0
+    for seed in range(20):
+        try:
+            assert fuzz_seed(seed, FuzzOptions()) is None
+            checked += 1
+        except EvaluationError:
+            pass
+    assert checked > 10
+
+
+def test_heap_programs():
+    programs = [ProgramGenerator(seed).program() for seed in range(20)]
+    assert any("alloc(" in p and "free(" in p for p in programs)
+
+
+def test_out_of_memory_is_checked():
+    program = parse("num i; while (i < 5){ ptr p; p = alloc(20); i = i + 1; } OUT = 1;")
+    assert check_program(program, 0, FuzzOptions()) is None
+    assert check_program(program, 0, FuzzOptions(heap_size=1000)) is None
+
+
+def test_reduce_program():
+    program = parse(
+        """
+        num x;
+        num y;
+        x = 1;
+        y = x * 2 + 3;
+        if (x){
+            y = y + 1;
+        }
+        OUT = y;
+        """
+    )
+
+    def uses_y(node):
+        # stands in for a program that is compiled wrongly whenever it mentions y
+        return any(isinstance(n, Variable) and n.name == "y" for n in walk(node))
+
+    reduced = reduce_program(program, uses_y)
+    assert uses_y(reduced)
+    assert len(str(reduced).split("\n")) == 1
@@ -0,0 +1,82 @@
+import pytest
+from desmos_compiler.assembler import assemble
+from desmos_compiler.compiler import compile_syntax_tree
+from desmos_compiler.minify import detokenize, minify, remove_parentheses, tokenize
+from desmos_compiler.parser import parse
+from tests.utils import load_time, run_program_js
+
+
+def without_parentheses(latex):
+    return detokenize(remove_parentheses(tokenize(latex)))
+
+
+@pytest.mark.parametrize(
+    "latex,expected",
+    [
+        (r"\left(a + \left(b \cdot c\right)\right)", r"a+b\cdot c"),
+        (r"\left(a + b\right) + c", r"a+b+c"),
+        (r"a - \left(b + c\right)", r"a-(b+c)"),
+        (r"a + \left(b + c\right)", r"a+(b+c)"),
+        (r"\left(a + b\right) \cdot c", r"(a+b)\cdot c"),
+        (r"a \cdot \left(-1\right)", r"a\cdot(-1)"),
+        (r"a \to \left(-1\right)", r"a\to-1"),
+        (r"S\left[1...\left(n - 1\right)\right]", r"S[1...n-1]"),
+        (r"\operatorname{mod}(a, b) + \left(\frac{a}{b}\right)", r"\operatorname{mod}(a,b)+\frac{a}{b}"),
+        (r"\left\{c=1:\left(a \to 1, b \to 2\right), \left(a \to 2\right)\right\}", r"\{c=1:(a\to1,b\to2),a\to2\}"),
+    ],
+)
+def test_remove_parentheses(latex, expected):
+    assert without_parentheses(latex) == expected
+
+
+def test_short_names():
+    latex = minify([r"S_{tack} = \left[1, I_{n}\right]", r"O_{ut} \to S_{tack}\left[2\right]"], {"I_{n}", "O_{ut}"})
+    assert latex == ["a=[1,I_{n}]", r"O_{ut}\to a[2]"]
+
+
+def test_repeated_subexpressions():
+    length = r"\operatorname{length}\left(S_{tackPtrs}\right)"
+    latex = minify([f"A_{{bc}} \\to {length} + {length} \\cdot {length}"] * 2, set())
+    # the length is moved into its own expression
+    assert len(latex) == 3
+    assert latex[2] == r"c=\operatorname{length}(a)"
+    assert latex[0] == r"b\to c+c\cdot c"
+
+
+
+def test_assigned_definitions_kept():
+    ones = r"\left[1...1000\right]"
+    actions = [rf"A_{{bc}}\to\left\{{{ones}={i}:{i},A_{{bc}}\right\}}" for i in range(10)]
+    latex = minify([rf"R_{{un}}=\left({','.join(actions)}\right)", rf"A_{{bc}}={ones}\cdot0"], {"R_{un}"})
+    assert latex[2] == "b=[1...1000]"
+    # a is assigned by the actions, so it has to be defined by a value instead of by b
+    assert latex[1] == r"a=[1...1000]\cdot0"
+
+FIB_PROGRAM = """
+num fib(num n){
+    if (n < 2){
+        return n;
+    }
+    return fib(n - 1) + fib(n - 2);
+}
+OUT = fib(IN);
+"""
+
+
+def test_minified_program_size():
+    desmos_assembly = compile_syntax_tree(parse(FIB_PROGRAM))
+    js = assemble(desmos_assembly)
+    minified = assemble(desmos_assembly, True)
+    assert len(minified) < len(js) / 2
+    assert "\\\\left" not in minified
+    # names required by the standard are kept
+    for name in ["R_{un}", "I_{n}", "O_{ut}", "D_{one}"]:
+        assert name in minified
+
+
+def test_minified_load_time(driver):
+    desmos_assembly = compile_syntax_tree(parse(FIB_PROGRAM))
+    js = assemble(desmos_assembly)
+    minified = assemble(desmos_assembly, True)
+    print(f"load time: {load_time(driver, js):.3f}s, minified: {load_time(driver, minified):.3f}s")
+    assert run_program_js(driver=driver, desmos_js=minified, program_input="7").output == 13
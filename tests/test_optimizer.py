@@ -0,0 +1,393 @@
+from desmos_compiler.optimizer import (
+    CommonSubexpressionEliminator,
+    DeadCodeEliminator,
+    LoopInvariantHoister,
+    LoopUnroller,
+    OptimizationStats,
+    UNROLL_FACTOR,
+    optimize,
+    pure_functions,
+    vectorize_counted_loop,
+)
+from desmos_compiler.defaults import UNROLL_BUDGET
+from desmos_compiler.evaluator import evaluate
+from desmos_compiler.parser import parse
+from desmos_compiler.syntax_tree import (
+    Assignment,
+    FunctionCall,
+    Comprehension,
+    FunctionDefinition,
+    If,
+    IndexAssignment,
+    Reduction,
+    Variable,
+    While,
+    walk,
+)
+
+FUNCTIONS = """
+num counter;
+num square(num x){
+    return x * x;
+}
+num count(num x){
+    counter = counter + 1;
+    return x;
+}
+num square_twice(num x){
+    return square(square(x));
+}
+"""
+
+
+def loop_of(tree):
+    return [n for n in walk(tree) if isinstance(n, While)][0]
+
+
+def test_pure_functions():
+    assert pure_functions(parse(FUNCTIONS)) == {Variable("square"), Variable("square_twice")}
+
+
+def test_hoist_condition():
+    tree = optimize(
+        parse(
+            FUNCTIONS
+            + """
+            num i;
+            i = 0;
+            while (i < square(IN)){
+                i = i + 1;
+            }
+            """
+        )
+    )
+    loop = loop_of(tree)
+    assert "square" not in repr(loop)
+    hoisted = [n for n in walk(tree) if isinstance(n, Assignment) and "square" in repr(n.val)]
+    assert len(hoisted) == 1
+
+
+def test_hoist_body():
+    tree = optimize(
+        parse(
+            FUNCTIONS
+            + """
+            num i;
+            i = 0;
+            while (i < IN){
+                OUT = OUT + square_twice(IN + 1) * i;
+                i = i + 1;
+            }
+            """
+        )
+    )
+    # the invariant is only computed if the loop runs
+    guard = [n for n in walk(tree) if isinstance(n, If)][-1]
+    assert "square_twice" in repr(guard.contents)
+    assert "square_twice" not in repr(loop_of(tree))
+
+
+def test_not_hoisted():
+    prog = (
+        FUNCTIONS
+        + """
+        num i;
+        i = 0;
+        while (i < IN){
+            OUT = OUT + square(i) + count(1);
+            if (i == 2){
+                OUT = OUT + square(IN);
+            }
+            i = i + 1;
+        }
+        """
+    )
+    # square(i) changes, count(1) is impure, and square(IN) might not run
+    assert repr(LoopInvariantHoister(parse(prog)).hoist()) == repr(parse(prog))
+
+
+def test_globals_changed_by_calls():
+    prog = (
+        FUNCTIONS
+        + """
+        num i;
+        i = 0;
+        while (i < square(counter)){
+            i = count(i) + 1;
+        }
+        """
+    )
+    assert repr(LoopInvariantHoister(parse(prog)).hoist()) == repr(parse(prog))
+
+
+def test_vectorize_sum():
+    loop = parse("while (i < n){ s = s + i * i; i = i + 1; }").statements[0]
+    vectorized = vectorize_counted_loop(loop)
+    assert not any(isinstance(n, While) for n in walk(vectorized))
+    assert any(isinstance(n, Reduction) for n in walk(vectorized))
+
+
+def test_vectorize_array():
+    loop = parse("while (i < len(a)){ a[i] = b[i] * 2; i = i + 1; }").statements[0]
+    vectorized = vectorize_counted_loop(loop)
+    assert not any(isinstance(n, While) for n in walk(vectorized))
+    assignment = [n for n in walk(vectorized) if isinstance(n, IndexAssignment)][0]
+    assert isinstance(assignment.val, Comprehension)
+
+
+def test_not_vectorized():
+    for prog in [
+        # each element depends on the previous one
+        "while (i < n){ a[i] = a[i - 1] * 2; i = i + 1; }",
+        "while (i < n){ s = s + s; i = i + 1; }",
+        # function calls take ticks
+        "while (i < n){ s = s + f(i); i = i + 1; }",
+        # not a counter
+        "while (i < n){ s = s + i; i = i + 2; }",
+        "while (i < s){ s = s + i; i = i + 1; }",
+    ]:
+        loop = parse(prog).statements[0]
+        assert vectorize_counted_loop(loop) == loop
+
+
+def test_heap_not_hoisted():
+    prog = """
+    num first(ptr p){
+        return p[0];
+    }
+    ptr p;
+    p = alloc(2);
+    while (p[0] < first(p)){
+        p[0] = p[0] + 1;
+    }
+    """
+    # first reads the heap, so it is not pure
+    assert pure_functions(parse(prog)) == set()
+    assert repr(optimize(parse(prog))) == repr(parse(prog))
+
+
+def test_heap_not_vectorized():
+    # p and q could point to the same block
+    prog = "ptr p; ptr q; while (i < n){ p[i] = q[i + 1]; i = i + 1; }"
+    assert repr(optimize(parse(prog), unroll_budget=0)) == repr(parse(prog))
+
+
+def test_unroll_completely():
+    prog = "num a[3]; num i; i = 0; while (i < 3){ a[i] = IN * i; i = i + 1; } OUT = a[2] + i;"
+    unrolled = LoopUnroller(parse(prog), UNROLL_BUDGET, UNROLL_FACTOR).unroll()
+    assert not any(isinstance(n, While) for n in walk(unrolled))
+    assert [str(s) for s in unrolled.statements[3:7]] == [
+        "a[0] = (IN * 0);",
+        "a[1] = (IN * 1);",
+        "a[2] = (IN * 2);",
+        "i = 3;",
+    ]
+    for inp in [0, 1, 5]:
+        assert evaluate(unrolled, inp) == evaluate(parse(prog), inp)
+
+
+def test_unroll_partially():
+    prog = "num s; num i; while (i < IN){ s = s * 2 + i; i = i + 1; } OUT = s;"
+    unrolled = LoopUnroller(parse(prog), UNROLL_BUDGET, 2).unroll()
+    loops = [n for n in walk(unrolled) if isinstance(n, While)]
+    # two iterations at a time, then one at a time for the rest
+    assert [str(loop.condition) for loop in loops] == ["((i + 1) < IN)", "(i < IN)"]
+    assert str(loops[0].contents).split("\n") == [
+        "s = ((s * 2) + i);",
+        "s = ((s * 2) + (i + 1));",
+        "i = (i + 2);",
+    ]
+    for inp in [0, 1, 2, 7]:
+        assert evaluate(unrolled, inp) == evaluate(parse(prog), inp)
+
+
+def test_unroll_budget():
+    prog = "num i; i = 0; while (i < 1000){ OUT = OUT + IN; i = i + 1; }"
+    # too many iterations to unroll completely
+    unrolled = LoopUnroller(parse(prog), 10, 4).unroll()
+    loop = loop_of(unrolled)
+    assert str(loop.condition) == "((i + 3) < 1000)"
+    assert LoopUnroller(parse(prog), 2, 4).unroll() == parse(prog)
+
+
+def test_not_unrolled():
+    for prog in [
+        # each copy would declare the variable again
+        "while (i < n){ num x; x = x + i; OUT = x; i = i + 1; }",
+        # the end changes
+        "while (i < n){ n = n - 1; i = i + 1; }",
+        # count could change the counter
+        "while (i < n){ OUT = count(i); i = i + 1; }",
+        # not a counter
+        "while (i < n){ OUT = i; i = i + 2; }",
+    ]:
+        tree = parse(FUNCTIONS + prog)
+        assert LoopUnroller(tree, UNROLL_BUDGET, UNROLL_FACTOR).unroll() == tree
+
+
+def calls_to(tree, name):
+    return [n for n in walk(tree) if isinstance(n, FunctionCall) and n.name == Variable(name)]
+
+
+def test_reuse_call():
+    stats = OptimizationStats()
+    tree = CommonSubexpressionEliminator(
+        parse(
+            FUNCTIONS
+            + """
+            num x;
+            x = IN;
+            if (square(x) > 1){
+                OUT = square(x) * 2 + square(x + 0);
+            }
+            OUT = OUT + square(x);
+            """
+        ),
+        stats,
+    ).eliminate()
+    # the definition of square_twice calls square twice
+    assert len(calls_to(tree, "square")) == 2 + 2
+    assert list(stats.cse_hits.values()) == [2]
+
+
+def test_not_reused():
+    prog = (
+        FUNCTIONS
+        + """
+        num x;
+        OUT = square(x);
+        x = x + 1;
+        OUT = square(x);
+        if (IN > 1){
+            OUT = square(IN);
+        }
+        OUT = OUT + square(IN) + count(1);
+        OUT = square(counter);
+        count(1);
+        OUT = square(counter);
+        """
+    )
+    # x changes, square(IN) might not have run, and count changes counter
+    stats = OptimizationStats()
+    assert repr(CommonSubexpressionEliminator(parse(prog), stats).eliminate()) == repr(parse(prog))
+    assert stats.cse_hits == {}
+
+
+def test_reuse_in_function():
+    tree = CommonSubexpressionEliminator(
+        parse(
+            FUNCTIONS
+            + """
+            num f(num a){
+                num b;
+                b = square(a) + count(a);
+                return b + square(a);
+            }
+            """
+        ),
+        OptimizationStats(),
+    ).eliminate()
+    # parameters cannot be changed by the call to count
+    f = [n for n in walk(tree) if isinstance(n, FunctionDefinition) and n.name == Variable("f")][0]
+    assert len(calls_to(f, "square")) == 1
+
+
+def test_remove_uncalled_functions():
+    tree = DeadCodeEliminator(parse(FUNCTIONS + "OUT = square_twice(IN);")).eliminate()
+    defined = {n.name.name for n in walk(tree) if isinstance(n, FunctionDefinition)}
+    assert defined == {"square", "square_twice"}
+
+
+def test_remove_unreachable():
+    tree = DeadCodeEliminator(
+        parse(
+            """
+            num f(num x){
+                if (x > 1){
+                    return 1;
+                } else {
+                    return 2;
+                }
+                x = f(x - 1);
+                return x;
+            }
+            if (1 > 2){
+                OUT = 5;
+            } else {
+                OUT = f(IN);
+            }
+            while (3 - 3){
+                OUT = 6;
+            }
+            """
+        )
+    ).eliminate()
+    assert tree == parse(
+        """
+        num f(num x){
+            if (x > 1){
+                return 1;
+            } else {
+                return 2;
+            }
+        }
+        OUT = f(IN);
+        """
+    )
+
+
+def test_remove_dead_stores():
+    tree = DeadCodeEliminator(
+        parse(
+            FUNCTIONS
+            + """
+            num x;
+            num y;
+            num z;
+            x = 1;
+            x = IN;
+            y = count(3) + square(x);
+            z = square(x);
+            OUT = x + counter;
+            """
+        )
+    ).eliminate()
+    main = [s for s in tree.statements if not isinstance(s, FunctionDefinition)]
+    # the call to count changes counter, so it is kept
+    assert main == list(parse("num counter; num x; x = IN; count(3); OUT = x + counter;").statements)
+
+
+
+def test_stores_kept_before_return():
+    program = parse(
+        """
+        num g;
+        num f(){
+            g = 1;
+            if (IN > 2){
+                return 0;
+            }
+            g = 2;
+            return 0;
+        }
+        f();
+        OUT = g;
+        """
+    )
+    # the caller can read g after the first return
+    assert DeadCodeEliminator(program).eliminate() == program
+
+
+def test_short_circuit_side_effects():
+    program = parse(
+        """
+        num f(){
+            OUT = OUT + 1;
+            return 1;
+        }
+        num x;
+        x = IN == 1 || f();
+        """
+    )
+    # f is only called if IN is not 1, so the assignment is kept
+    assert DeadCodeEliminator(program).eliminate() == program
@@ -1,11 +1,15 @@
 import pytest
 
-from desmos_compiler.parser import parse
+from desmos_compiler.parser import GRAMMAR_PATH, PARSER_PATH, ParserError, _parser_header, parse
 from desmos_compiler.syntax_tree import (
+    Alloc,
+    ArrayType,
     Assignment,
     BinaryOperation,
+    Comprehension,
     Declaration,
     DesmosType,
+    Free,
     FunctionCall,
     FunctionCallStatement,
     FunctionDefinition,
@@ -13,8 +17,16 @@ from desmos_compiler.syntax_tree import (
     FunctionReturn,
     Group,
     If,
+    Index,
+    IndexAssignment,
+    Length,
+    ListOperator,
     Literal,
     Operator,
+    Range,
+    Reduction,
+    Slice,
+    UnaryOperation,
     Variable,
     While,
 )
@@ -36,7 +48,7 @@ def test_var():
     )
 
 
-@pytest.mark.parametrize("op", Operator)
+@pytest.mark.parametrize("op", [op for op in Operator if op != Operator.NOT])
 def test_binary_operation(op):
     assert parse(f"x=x{op.value}1;") == Group(
         [
@@ -71,6 +83,31 @@ def test_order_of_operations():
     )
 
 
+def test_logical_and_unary_operations():
+    x, y = Variable("x"), Variable("y")
+    # ! and - apply before * and && before ||
+    assert parse("x = -x * 2 || !x && y;") == Group(
+        [
+            Assignment(
+                x,
+                BinaryOperation(
+                    BinaryOperation(UnaryOperation(x, Operator.SUB), Literal("2"), Operator.MULT),
+                    BinaryOperation(UnaryOperation(x, Operator.NOT), y, Operator.AND),
+                    Operator.OR,
+                ),
+            )
+        ]
+    )
+    assert parse("x = !(x != -1);") == Group(
+        [
+            Assignment(
+                x,
+                UnaryOperation(BinaryOperation(x, Literal("-1"), Operator.NE), Operator.NOT),
+            )
+        ]
+    )
+
+
 def test_conditional():
     assert parse("if (x < 2){}") == Group(
         [If(BinaryOperation(Variable("x"), Literal("2"), Operator.LT), Group([]), None)]
@@ -91,6 +128,43 @@ def test_conditional():
     )
 
 
+def test_switch():
+    x = Variable("x")
+    case = lambda n: BinaryOperation(x, Literal(n), Operator.EQ)
+    # the first case for a value runs, and there is no fallthrough
+    assert parse("switch (x){ case 1: x = 2; case -2: case 3, 1: x = 3; default: x = 4; }") == Group(
+        [
+            If(
+                case("1"),
+                Group([Assignment(x, Literal("2"))]),
+                If(
+                    case("-2"),
+                    Group([]),
+                    If(
+                        BinaryOperation(case("3"), case("1"), Operator.OR),
+                        Group([Assignment(x, Literal("3"))]),
+                        Group([Assignment(x, Literal("4"))]),
+                    ),
+                ),
+            )
+        ]
+    )
+
+    # a value which calls a function is only evaluated once
+    value = Variable("#switch0")
+    assert parse("switch (f(x)){ case 1: x = 2; }") == Group(
+        [
+            Group(
+                [
+                    Declaration(value, DesmosType("num")),
+                    Assignment(value, FunctionCall(Variable("f"), [x])),
+                    If(BinaryOperation(value, Literal("1"), Operator.EQ), Group([Assignment(x, Literal("2"))]), None),
+                ]
+            )
+        ]
+    )
+
+
 def test_while():
     assert parse("while (x < 2){x = 2;}") == Group(
         [
@@ -139,3 +213,93 @@ def test_function():
             )
         ]
     )
+
+
+def test_array():
+    assert parse("num a[3];\na[0] = a[1:len(a)];") == Group(
+        [
+            Declaration(Variable("a"), ArrayType("num", 3)),
+            IndexAssignment(
+                Index(Variable("a"), Literal("0")),
+                Slice(Variable("a"), Literal("1"), Length(Variable("a"))),
+            ),
+        ]
+    )
+
+    # len is only special when it is called with an array
+    assert parse("x = len(a) + lenx(a);") == Group(
+        [
+            Assignment(
+                Variable("x"),
+                BinaryOperation(
+                    Length(Variable("a")),
+                    FunctionCall(Variable("lenx"), [Variable("a")]),
+                    Operator.ADD,
+                ),
+            )
+        ]
+    )
+
+
+def test_list_expressions():
+    assert parse("x = sum([i * i for i in range(0, n) if i > 1]) + max(a, b);") == Group(
+        [
+            Assignment(
+                Variable("x"),
+                BinaryOperation(
+                    Reduction(
+                        ListOperator.SUM,
+                        Comprehension(
+                            BinaryOperation(Variable("i"), Variable("i"), Operator.MULT),
+                            Variable("i"),
+                            Range(Literal("0"), Variable("n")),
+                            BinaryOperation(Variable("i"), Literal("1"), Operator.GT),
+                        ),
+                    ),
+                    FunctionCall(Variable("max"), [Variable("a"), Variable("b")]),
+                    Operator.ADD,
+                ),
+            )
+        ]
+    )
+
+
+def test_pointers():
+    assert parse("ptr p; p = alloc(n + 1); p[0] = p; free(p);") == Group(
+        [
+            Declaration(Variable("p"), DesmosType("ptr")),
+            Assignment(
+                Variable("p"),
+                Alloc(BinaryOperation(Variable("n"), Literal("1"), Operator.ADD)),
+            ),
+            IndexAssignment(Index(Variable("p"), Literal("0")), Variable("p")),
+            Free(Variable("p")),
+        ]
+    )
+
+
+def test_keyword_prefixes():
+    assert parse("number = sum; summary = ptrs(x);") == Group(
+        [
+            Assignment(Variable("number"), Variable("sum")),
+            Assignment(Variable("summary"), FunctionCall(Variable("ptrs"), [Variable("x")])),
+        ]
+    )
+
+
+@pytest.mark.parametrize("program", ["num x", "x = ;", "x = 1 @ 2;", "if (x) { x = 1;"])
+def test_parser_error(program):
+    with pytest.raises(ParserError):
+        parse(program)
+
+
+def test_saved_parser():
+    """
+    The saved parser tables must be rebuilt with `python -m desmos_compiler.parser`
+    when the grammar changes
+    """
+    with open(GRAMMAR_PATH, "r") as f:
+        grammar = f.read()
+    with open(PARSER_PATH, "rb") as f:
+        header = f.readline()
+    assert header.split()[1] == _parser_header(grammar).split()[1]
@@ -0,0 +1,109 @@
+from desmos_compiler.assembler import parse_assembly
+from desmos_compiler.scheduler import count_actions, parse_line, schedule
+from tests.test_stats import get_stats
+
+
+def scheduled_lines(program):
+    return parse_assembly(schedule(program))[0]
+
+
+def test_parse_line():
+    line = parse_line(r"\left\{a=1: \left(b \to c\left[1\right], NEXTLINE\right), GOTO end\right\}", {})
+    assert line.piecewise
+    assert line.branches == [("a=1", [r"b \to c\left[1\right]", "NEXTLINE"]), (None, ["GOTO end"])]
+    assert line.reads == {"a", "c", "L_{ine}"}
+    assert line.writes == {"b", "L_{ine}"}
+    assert parse_line(line.latex, {}) == line
+
+    # not a list of actions
+    assert parse_line(r"\operatorname{f}\left(a\right)", {}) is None
+
+
+def test_independent_lines():
+    lines = scheduled_lines(
+        r"""
+        line a \to 1, NEXTLINE
+        line b \to 2, NEXTLINE
+        line c \to a, NEXTLINE
+        line d \to 3, NEXTLINE
+        line OUT \to c, DONE \to 0
+        """
+    )
+    # c uses the new value of a, and d can run alongside any of them
+    assert lines == [
+        r"a \to 1, b \to 2, d \to 3, NEXTLINE",
+        r"c \to a, NEXTLINE",
+        r"OUT \to c, DONE \to 0",
+    ]
+
+
+def test_reads_before_writes():
+    lines = scheduled_lines(
+        r"""
+        line b \to a, NEXTLINE
+        line a \to 1, NEXTLINE
+        line a \to a + 1, NEXTLINE
+        """
+    )
+    # every action reads the values from before the tick
+    assert lines == [r"b \to a, a \to 1, NEXTLINE", r"a \to a + 1, NEXTLINE"]
+
+
+def test_derived_exprs():
+    lines = scheduled_lines(
+        r"""
+        expr d=a+1
+        line a \to 1, NEXTLINE
+        line b \to d, NEXTLINE
+        """
+    )
+    assert len(lines) == 2
+
+
+def test_labels_and_jumps():
+    program = r"""
+        line a \to 1, NEXTLINE
+        label loop
+        line a \to a + 1, NEXTLINE
+        line \left\{a < 5: GOTO loop, NEXTLINE\right\}
+        line b \to 2, NEXTLINE
+        line OUT \to b, DONE \to 0
+        """
+    lines, labels, _ = parse_assembly(schedule(program))
+    assert labels == {"loop": 1}
+    # the condition reads the new value of a, but the line after it can run with it
+    assert lines[1] == r"a \to a + 1, NEXTLINE"
+    assert lines[2:] == [
+        r"\left\{a < 5: GOTO loop, \left(b \to 2, NEXTLINE\right)\right\}",
+        r"OUT \to b, DONE \to 0",
+    ]
+
+
+def test_unknown_lines_kept():
+    program = r"""
+        line a \to 1, NEXTLINE
+        line \operatorname{f}\left(a\right)
+        line b \to 2, NEXTLINE
+        """
+    assert scheduled_lines(program) == [r"a \to 1, NEXTLINE", r"\operatorname{f}\left(a\right)", r"b \to 2, NEXTLINE"]
+
+
+def test_count_actions():
+    assert count_actions(r"a \to 1, b \to 2, NEXTLINE") == 3
+    assert count_actions(r"\left\{a=1: \left(b \to 2, GOTO end\right), NEXTLINE\right\}") == 2
+
+
+def test_actions_per_tick():
+    stats = get_stats(
+        """
+        num add(num a, num b){
+            return a + b;
+        }
+        num x;
+        num y;
+        x = IN;
+        y = IN * 2;
+        OUT = add(x, y) + y;
+        """
+    )
+    assert stats.actions_per_tick > 2
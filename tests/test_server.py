@@ -0,0 +1,143 @@
+import asyncio
+import json
+
+import pytest
+
+from desmos_compiler.assembler import assemble
+from desmos_compiler.compiler import compile_syntax_tree
+from desmos_compiler.parser import parse
+from desmos_compiler.server import CompileServer
+
+PROGRAM = "num f(num n){ return n * 2; } OUT = f(IN) + 1;"
+
+
+async def post(port: int, path: str, request: dict | None = None, method: str = "POST") -> tuple[int, dict]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = json.dumps(request).encode() if request is not None else b""
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nConnection: close\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, data = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(data)
+
+
+def with_server(test):
+    """
+    Run `test` with the port of a new server
+    """
+
+    async def run():
+        server = CompileServer(workers=2, cache_size=8)
+        try:
+            async with await server.start() as s:
+                await test(server, s.sockets[0].getsockname()[1])
+        finally:
+            server.close()
+
+    asyncio.run(run())
+
+
+def test_stages():
+    async def test(server, port):
+        status, response = await post(port, "/parse", {"program": PROGRAM})
+        assert status == 200
+        assert response["syntax_tree"] == str(parse(PROGRAM))
+
+        options = {"eval_steps": 0, "minify": True}
+        status, response = await post(port, "/compile", {"program": PROGRAM, "options": options})
+        assembly = compile_syntax_tree(parse(PROGRAM), eval_steps=0)
+        assert response["assembly"] == assembly
+
+        status, response = await post(port, "/assemble", {"program": PROGRAM, "options": options})
+        assert response["js"] == assemble(assembly, minified=True)
+        assert response["latency_ms"] >= 0
+        # the assembly was reused from the compile request
+        assert server.cache_hits == 1
+
+        status, response = await post(port, "/assemble", {"assembly": assembly})
+        assert response["js"] == assemble(assembly)
+
+    with_server(test)
+
+
+def test_concurrent_requests():
+    async def test(server, port):
+        programs = [f"OUT = IN * {i};" for i in range(6)]
+        # each program is requested twice at once, but only compiled once
+        requests = [post(port, "/compile", {"program": p, "options": {"eval_steps": 0}}) for p in programs * 2]
+        responses = await asyncio.gather(*requests)
+        assert all(status == 200 for status, _ in responses)
+        assert server.cache_misses == len(programs)
+
+        status, metrics = await post(port, "/metrics", method="GET")
+        assert status == 200
+        assert metrics["requests"]["compile"]["count"] == 12
+        assert metrics["max_queue_depth"] > 0
+        assert metrics["in_flight"] == 0
+
+    with_server(test)
+
+
+@pytest.mark.parametrize(
+    "path,request_json,status",
+    [
+        ("/compile", {"program": "OUT = ;"}, 400),
+        ("/compile", {"program": "OUT = x;"}, 400),
+        ("/compile", {"program": PROGRAM, "options": {"optimize": True}}, 400),
+        ("/compile", {"program": PROGRAM, "options": {"eval_steps": "0"}}, 400),
+        ("/compile", {"program": PROGRAM, "options": {"stack_pages": 0}}, 400),
+        ("/compile", {"program": PROGRAM, "options": {"heap_size": -5}}, 400),
+        ("/compile", {"program": PROGRAM, "options": {"eval_steps": -1}}, 400),
+        ("/assemble", {"program": PROGRAM, "options": {"chunk_size": 0}}, 400),
+        ("/assemble", {}, 400),
+        ("/run", {"program": PROGRAM}, 404),
+    ],
+)
+def test_errors(path, request_json, status):
+    async def test(server, port):
+        response = await post(port, path, request_json)
+        assert response[0] == status
+        assert "error" in response[1]
+        # and the server keeps working
+        assert (await post(port, "/parse", {"program": PROGRAM}))[0] == 200
+
+    with_server(test)
+
+
+@pytest.mark.parametrize(
+    "head,status",
+    [
+        ("POST /parse HTTP/1.1\r\nContent-Length: -1\r\n\r\n", 400),
+        ("POST /parse HTTP/1.1\r\nContent-Length: ten\r\n\r\n", 400),
+        # longer than the limit of the stream reader
+        (f"POST /parse HTTP/1.1\r\nX-Long: {'a' * 100000}\r\n\r\n", 431),
+        (f"POST /{'a' * 100000} HTTP/1.1\r\n\r\n", 431),
+    ],
+)
+def test_bad_head(head, status):
+    async def test(server, port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(head.encode())
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        response_head, _, data = response.partition(b"\r\n\r\n")
+        assert int(response_head.split()[1]) == status
+        assert "error" in json.loads(data)
+        # and the server keeps working
+        assert (await post(port, "/parse", {"program": PROGRAM}))[0] == 200
+
+    with_server(test)
+
+
+def test_page_size_without_pages():
+    async def test(server, port):
+        # the page size does not change the assembly unless the stack is split into pages
+        for options in [{}, {"page_size": 100}, {"stack_pages": 2, "page_size": 100}]:
+            assert (await post(port, "/compile", {"program": PROGRAM, "options": options}))[0] == 200
+        assert (server.cache_hits, server.cache_misses) == (1, 2)
+
+    with_server(test)
@@ -0,0 +1,144 @@
+from desmos_compiler.compiler import Compiler
+from desmos_compiler.parser import parse
+from desmos_compiler.stats import MAIN, Estimate, collect_stats, format_stats
+
+
+def get_stats(prog):
+    # the programs would otherwise run at compile time
+    compiler = Compiler(parse(prog), eval_steps=0)
+    compiler.generate_assembly()
+    return collect_stats(compiler)
+
+
+def test_straight_line():
+    stats = get_stats("OUT = 1 + 2;")
+    assert stats.ticks.bounded
+    assert stats.ticks == Estimate(stats.lines)
+    assert stats.depth == Estimate(0)
+
+
+def test_loop():
+    stats = get_stats(
+        """
+        num x;
+        x = 0;
+        while (x < 3){
+            num y;
+            y = 2;
+            x = x + y;
+        }
+        OUT = x;
+        """
+    )
+    main = stats.functions[MAIN]
+    assert list(main.loops) == ["n_begwhile0"]
+    assert not stats.ticks.bounded
+    assert stats.ticks.terms["n_begwhile0"] == main.loops["n_begwhile0"].constant
+    # the loop condition runs once more than the loop body
+    header = [b for b in main.blocks if b.name == "begwhile0"][0]
+    assert stats.ticks.constant + main.loops["n_begwhile0"].constant == stats.lines + header.ticks
+
+
+def test_frame_size():
+    stats = get_stats(
+        """
+        num x;
+        x = IN;
+        if (IN < 1){
+            num y;
+            num z;
+            y = x + 1;
+            z = y * y;
+            OUT = z;
+        } else {
+            num w;
+            w = x * 2;
+            OUT = w;
+        }
+        """
+    )
+    # IN, OUT, x and the larger of the two branches
+    assert stats.functions[MAIN].frame_size == 5
+
+
+def test_calls():
+    stats = get_stats(
+        """
+        num double(num a){
+            num b;
+            b = a * 2;
+            return b;
+        }
+        OUT = double(1) + double(2);
+        """
+    )
+    double = stats.functions["double"]
+    assert not double.recursive
+    assert double.ticks.bounded
+    assert stats.ticks.bounded
+    assert stats.ticks.constant == stats.functions[MAIN].lines + 2 * double.lines
+    assert stats.depth == Estimate(1)
+    # the frame of double starts with the line to return to and the frame pointer of main
+    assert stats.stack_size == Estimate(stats.functions[MAIN].frame_size + double.frame_size + 2)
+
+
+def test_switch():
+    stats = get_stats(
+        """
+        switch (IN){
+            case 1: OUT = 10;
+            case 2: OUT = 20; OUT = OUT * IN;
+            case 4: OUT = 30;
+        }
+        """
+    )
+    blocks = stats.functions[MAIN].blocks
+    jump = next(b for b in blocks if len(b.successors) > 2)
+    # the jump can go to each case or past the switch
+    assert {blocks[i].name for i in range(len(blocks)) if blocks[i].start in jump.successors} == {
+        "case0_0",
+        "case0_1",
+        "case0_2",
+        "else0",
+    }
+    # the longest path goes through the second case, which takes two ticks, and then sets the output
+    assert stats.ticks == Estimate(jump.ticks + 2 + 1)
+
+
+def test_recursion():
+    stats = get_stats(
+        """
+        num even(num x){
+            if (x == 0){
+                return 1;
+            }
+            return odd(x - 1);
+        }
+
+        num odd(num x){
+            if (x == 0){
+                return 0;
+            }
+            return even(x - 1);
+        }
+        OUT = even(IN);
+        """
+    )
+    assert stats.functions["even"].recursive
+    assert stats.functions["odd"].recursive
+    assert set(stats.ticks.terms) == {"calls_even", "calls_odd"}
+    assert stats.depth == Estimate(0, {"depth_even": 1})
+
+
+def test_reused_calls():
+    stats = get_stats(
+        """
+        num square(num x){
+            return x * x;
+        }
+        OUT = square(IN) + 1;
+        OUT = OUT + square(IN);
+        """
+    )
+    assert stats.cse_hits == {"square( IN )": 1}
+    assert "reused calls: 1" in format_stats(stats)
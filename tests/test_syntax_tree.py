@@ -0,0 +1,66 @@
+import tracemalloc
+from dataclasses import FrozenInstanceError
+
+import pytest
+
+from desmos_compiler.parser import load_parser, parse
+from desmos_compiler.syntax_tree import (
+    Assignment,
+    BinaryOperation,
+    FunctionCall,
+    Group,
+    Literal,
+    Operator,
+    Variable,
+    walk,
+)
+
+# average size of a node of the syntax tree for a large program
+MAX_BYTES_PER_NODE = 100
+
+
+def large_program(n: int) -> str:
+    program = "num f(num a, num b){ return a + b; }\nnum x;\nnum y;\n"
+    for i in range(n):
+        program += f"x = (x + {i}) * (y - f(x, {i % 7}));\n"
+        program += f"if (x > {i}) {{ y = y + 1; }}\n"
+    return program
+
+
+def test_children_are_tuples():
+    call = FunctionCall(Variable("f"), [Literal("1"), Variable("x")])
+    assert call.args == (Literal("1"), Variable("x"))
+    assert Group([call]) == Group((call,))
+
+
+def test_nodes_are_immutable():
+    var = Variable("x")
+    with pytest.raises(FrozenInstanceError):
+        var.name = "y"
+    assert not hasattr(var, "__dict__")
+
+
+def test_equal_subtrees():
+    tree = parse("x = (a + b) * (a + b); y = f(a + b, 2);")
+    sum_ = BinaryOperation(Variable("a"), Variable("b"), Operator.ADD)
+    sums = [n for n in walk(tree) if n == sum_]
+    assert len(sums) == 3
+    assert len({hash(n) for n in sums}) == 1
+
+    # identical statements can be used as keys
+    seen = {Assignment(Variable("x"), sum_): 1}
+    assert seen[Assignment(Variable("x"), BinaryOperation(Variable("a"), Variable("b"), Operator.ADD))] == 1
+
+
+def test_syntax_tree_memory():
+    program = large_program(1000)
+    load_parser()
+
+    tracemalloc.start()
+    tree = parse(program)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    nodes = sum(1 for _ in walk(tree))
+    print(f"{nodes} nodes in {size / 1024:.0f} KiB ({size / nodes:.0f} bytes per node)")
+    assert size / nodes < MAX_BYTES_PER_NODE
@@ -5,11 +5,12 @@ from pathlib import Path
 from selenium import webdriver
 
 from typing import Literal
-from time import sleep
+from time import perf_counter, sleep
 
 from selenium.webdriver.common.by import By
 
 from desmos_compiler.assembler import DesmosExpr, generate_js
+from desmos_compiler.checkpoint import CHECKPOINT_JS
 
 PROJECT_ROOT = Path(__file__).parent.parent.resolve()
 DESMOS_PATH = PROJECT_ROOT / "desmos/index.html"
@@ -33,12 +34,28 @@ class ProgramOutput:
     output: int | list[int]
     exit_code: int
 
+def load_time(driver: webdriver.Chrome, desmos_js: str) -> float:
+    """
+    Seconds taken by Desmos to create and evaluate the expressions made by `desmos_js`
+    """
+    driver.get("file://" + str(DESMOS_PATH))
+    start = perf_counter()
+    driver.execute_async_script(
+        desmos_js
+        + """
+        const done = arguments[arguments.length - 1];
+        Calc.observeEvent("change", () => done());
+        """
+    )
+    return perf_counter() - start
+
 def run_program_js(
     *,
     driver: webdriver.Chrome,
     desmos_js: str,
     program_input: str | None = None,
     output_type: Literal["numeric", "list"] = "numeric",
+    chunk_ticks: int | None = None,
 ) -> ProgramOutput:
     """
     Run the Desmos program created by `desmos_js`.
@@ -48,6 +65,8 @@ def run_program_js(
     `desmos_js` -- javascript to generate desmos expressions
     `program_input` -- sets the "in" expression if provided
     `output_type` -- either "numeric" or "list" depending on the type of the "out" expression
+    `chunk_ticks` -- if provided, the graph state is saved after this many clicks of the
+        run action, the page is reloaded and the program continues from the saved state
 
     Returns the program result as a `ProgramOutput` object.
     """
@@ -69,18 +88,22 @@ def run_program_js(
     get_expr_value = lambda name, var_type: loads(
         driver.execute_script(f"return JSON.stringify({name}.{var_type}Value)")
     )
-    driver.execute_script(
-        """
-        selenium_track_output = Calc.HelperExpression({ latex: 'O_{ut}' });
-        selenium_track_done = Calc.HelperExpression({ latex: 'D_{one}' });
-        """
-    )
-    sleep(PROG_ACTION_DELAY)
 
-    # find the button to execute the run action
-    run_btn = driver.find_element(
-        by=By.CSS_SELECTOR, value="div[expr-id='run'] div[aria-label='Run Action']"
-    )
+    def track_program():
+        driver.execute_script(
+            """
+            selenium_track_output = Calc.HelperExpression({ latex: 'O_{ut}' });
+            selenium_track_done = Calc.HelperExpression({ latex: 'D_{one}' });
+            """
+        )
+        sleep(PROG_ACTION_DELAY)
+
+        # find the button to execute the run action
+        return driver.find_element(
+            by=By.CSS_SELECTOR, value="div[expr-id='run'] div[aria-label='Run Action']"
+        )
+
+    run_btn = track_program()
 
     # keep executing the run action until the program is done
     steps = 0
@@ -90,6 +113,13 @@ def run_program_js(
         steps += 1
         if steps > MAX_STEPS:
             raise AssertionError("Program ran for too many steps")
+        if chunk_ticks is not None and steps % chunk_ticks == 0:
+            # continue in a fresh page from a checkpoint of the whole machine state
+            state = driver.execute_script(f"return {CHECKPOINT_JS}")
+            driver.get("file://" + str(DESMOS_PATH))
+            driver.execute_script(f"Calc.setState({state})")
+            sleep(PROG_SETUP_DELAY)
+            run_btn = track_program()
 
     # find and return the output
     return ProgramOutput(